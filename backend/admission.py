@@ -0,0 +1,212 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+import asyncio
+import json
+import time
+
+from instrumentation import current_request_stats
+from metrics import REGISTRY
+
+# Admission control. Each route class (upload, processing, read) has a
+# concurrency limit and a bounded queue of waiters in front of it; a request
+# that finds the queue full, or waits longer than the queue timeout, is
+# turned away with 503 and Retry-After instead of piling more work onto a
+# saturated worker. Uploads and reads are limited by AdmissionMiddleware
+# before the request body is read; image processing takes a "processing"
+# slot inside the upload endpoint, so CPU-bound work is capped separately
+# from slow client uploads
+
+ADMISSION_IN_FLIGHT = REGISTRY.gauge(
+    "admission_in_flight", "Requests holding an admission slot", ("pool",)
+)
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge(
+    "admission_queue_depth", "Requests waiting for an admission slot", ("pool",)
+)
+ADMISSION_WAIT = REGISTRY.histogram(
+    "admission_wait_seconds", "Time spent queued for an admission slot", ("pool",)
+)
+ADMISSION_REJECTED = REGISTRY.counter(
+    "admission_rejected_total", "Requests turned away with 503", ("pool", "reason")
+)
+
+class Overloaded(Exception):
+    def __init__(self, pool: str, reason: str, retry_after: int):
+        super().__init__(f"{pool} admission rejected: {reason}")
+        self.pool = pool
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionLimiter:
+    """Concurrency limit with a bounded, time-limited FIFO queue in front of it.
+
+    A released slot is handed straight to the oldest waiter, so a request
+    arriving later cannot overtake the queue. A waiter cancelled just as a
+    slot reaches it passes the slot on, so slots are never lost (as they can
+    be with asyncio.wait_for around Semaphore.acquire before Python 3.12).
+    A concurrency of 0 or less disables the limit.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, queue_timeout: float,
+                 retry_after: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        # Slots held, including ones handed to a waiter that has not resumed yet
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        ADMISSION_IN_FLIGHT.set_function(lambda: self.active, pool=name)
+        ADMISSION_QUEUE_DEPTH.set_function(lambda: self.waiting, pool=name)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _reject(self, reason: str):
+        ADMISSION_REJECTED.labels(pool=self.name, reason=reason).inc()
+        raise Overloaded(self.name, reason, self.retry_after)
+
+    def _release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    async def _wait(self):
+        if self.waiting >= self.queue_size:
+            self._reject("queue_full")
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        # Expires the waiter itself rather than wrapping it in wait_for, which
+        # before Python 3.12 can swallow a cancellation that races the handover
+        expiry = loop.call_later(self.queue_timeout, _expire, waiter)
+        started = time.perf_counter()
+        try:
+            try:
+                await waiter
+            except asyncio.TimeoutError:
+                self._reject("timeout")
+        except BaseException:
+            # Cancelled after a slot was handed over: pass it on
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self._release()
+            raise
+        finally:
+            expiry.cancel()
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            waited = time.perf_counter() - started
+            ADMISSION_WAIT.observe(waited, pool=self.name)
+            stats = current_request_stats.get()
+            if stats is not None:
+                stats.add_timing(f"queue_{self.name}", waited)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a slot for the duration of the block; raises Overloaded"""
+        if self.concurrency <= 0:
+            yield
+            return
+        if self.active < self.concurrency and not self._waiters:
+            # A free slot is taken without suspending
+            self.active += 1
+        else:
+            await self._wait()
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def try_slot(self):
+        """Hold a slot only when one is free and no request is queued for
+        it, for background work that must not delay requests; raises
+        Overloaded otherwise, without counting a rejection"""
+        if self.concurrency > 0 and (self.active >= self.concurrency or self._waiters):
+            raise Overloaded(self.name, "busy", self.retry_after)
+        async with self.slot():
+            yield
+
+def _expire(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_exception(asyncio.TimeoutError())
+
+_limiters: Dict[str, AdmissionLimiter] = {}
+
+def configure_admission(settings) -> Dict[str, AdmissionLimiter]:
+    """Create the upload, processing and read limiters from settings"""
+    for name in ("upload", "processing", "read"):
+        _limiters[name] = AdmissionLimiter(
+            name,
+            concurrency=getattr(settings, f"admission_{name}_concurrency"),
+            queue_size=getattr(settings, f"admission_{name}_queue"),
+            queue_timeout=getattr(settings, f"admission_{name}_queue_timeout"),
+            retry_after=settings.admission_retry_after_seconds,
+        )
+    return _limiters
+
+def limiter(name: str) -> AdmissionLimiter:
+    return _limiters[name]
+
+def _route_class(scope) -> Optional[str]:
+    method, path = scope["method"], scope["path"]
+    if method == "POST" and path == "/api/upload-image":
+        return "upload"
+    # Public reads; probes, metrics and admin endpoints are never queued so
+    # the worker stays observable while overloaded
+    if method in ("GET", "HEAD") and path.startswith(("/api/", "/uploads/")) and not path.startswith("/api/admin"):
+        return "read"
+    return None
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying the upload and read limiters by route.
+
+    Overloaded raised further down (the processing limiter) is answered
+    the same way, as long as the response has not started.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_tracking(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        route_class = _route_class(scope)
+        try:
+            if route_class is None or route_class not in _limiters:
+                await self.app(scope, receive, send_tracking)
+            else:
+                async with _limiters[route_class].slot():
+                    await self.app(scope, receive, send_tracking)
+        except Overloaded as e:
+            if response_started:
+                raise
+            await _send_overloaded(send, e)
+
+async def _send_overloaded(send, error: Overloaded):
+    body = json.dumps({"detail": "Сервер перегружен, повторите попытку позже"}, ensure_ascii=False).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(error.retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,153 @@
+from datetime import datetime
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import hashlib
+import json
+import sys
+import time
+
+from sqlalchemy import JSON, DateTime, Table, bindparam, func, select
+
+from models import ContactsTable, PortfolioTable, ServiceTable, UploadedImagesTable
+
+# Bulk row transfer shared by dump.py and migrate_to_postgres.py: the content
+# tables, a JSON-safe row encoding, chunked reads in primary key order, the
+# fastest insert path per dialect (COPY on PostgreSQL, executemany elsewhere)
+# and table checksums for comparing two databases
+
+CONTENT_TABLES: Dict[str, Table] = {
+    "services": ServiceTable.__table__,
+    "portfolio": PortfolioTable.__table__,
+    "contacts": ContactsTable.__table__,
+    "uploaded_images": UploadedImagesTable.__table__,
+}
+
+def primary_key(table: Table):
+    return list(table.primary_key.columns)[0]
+
+def encode_row(table: Table, row) -> dict:
+    """JSON-safe dict of a row mapping; datetimes become ISO strings"""
+    data = {}
+    for column in table.columns:
+        value = row[column.name]
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        data[column.name] = value
+    return data
+
+@lru_cache(maxsize=None)
+def _column_kinds(table: Table) -> Tuple[Tuple[str, bool], ...]:
+    # (name, is DateTime) per column, looked up once rather than per row
+    return tuple((column.name, isinstance(column.type, DateTime)) for column in table.columns)
+
+def decode_row(table: Table, data: dict) -> dict:
+    """Inverse of encode_row; keys that are not columns of `table` (from a
+    newer schema) are dropped"""
+    row = {}
+    for name, is_datetime in _column_kinds(table):
+        if name not in data:
+            continue
+        value = data[name]
+        if is_datetime and isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        row[name] = value
+    return row
+
+async def last_key(conn, table: Table) -> Optional[str]:
+    """Largest primary key in `table`, in the byte order read_batches uses
+    on SQLite; PostgreSQL compares with the "C" collation to match"""
+    key = primary_key(table)
+    if conn.dialect.name == "postgresql":
+        key = key.collate("C")
+    return await conn.scalar(select(func.max(key)))
+
+async def read_batches(conn, table: Table, batch_size: int, after: Optional[str] = None,
+                       through: Optional[str] = None) -> AsyncIterator[List[dict]]:
+    """Rows of `table` as dicts in primary key order, `batch_size` at a time,
+    through a server-side cursor; `after` skips keys up to and including it,
+    `through` stops after it (bounds compare like last_key)"""
+    key = primary_key(table)
+    statement = select(table).order_by(key)
+    bound = key.collate("C") if conn.dialect.name == "postgresql" else key
+    if after is not None:
+        statement = statement.where(bound > after)
+    if through is not None:
+        statement = statement.where(bound <= through)
+    result = await conn.stream(statement.execution_options(yield_per=batch_size))
+    async for partition in result.mappings().partitions():
+        yield [dict(row) for row in partition]
+
+async def insert_rows(conn, table: Table, rows: List[dict]):
+    """Insert decoded rows in one round trip where the driver allows"""
+    if not rows:
+        return
+    if conn.dialect.name == "postgresql":
+        await _copy_rows(conn, table, rows)
+    else:
+        await conn.execute(_insert_statement(table), rows)
+
+@lru_cache(maxsize=None)
+def _insert_statement(table: Table):
+    # A plain JSON column stores None as the JSON text 'null'; rows are
+    # copied as read, so SQL NULL has to stay SQL NULL
+    return table.insert().values({
+        column.name: bindparam(column.name, type_=JSON(none_as_null=True))
+        for column in table.columns if isinstance(column.type, JSON)
+    })
+
+def _copy_value(column, value):
+    # COPY bypasses SQLAlchemy's type processing: JSON goes over as text
+    if value is not None and isinstance(column.type, JSON):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+async def _copy_rows(conn, table: Table, rows: List[dict]):
+    columns = list(table.columns)
+    records = [tuple(_copy_value(column, row.get(column.name)) for column in columns) for row in rows]
+    # Any statement makes SQLAlchemy open its transaction on the connection,
+    # so the COPY below commits or rolls back with the rest of the batch
+    await conn.exec_driver_sql("SELECT 1")
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        table.name, records=records, columns=[column.name for column in columns]
+    )
+
+async def table_checksum(conn, table: Table, batch_size: int,
+                         through: Optional[str] = None) -> Tuple[int, str]:
+    """Row count and a digest of the encoded rows of `table`, or of its rows
+    with keys up to `through`.
+
+    The digest is the sum of per-row SHA-256 values, so it does not depend
+    on the order rows come back in, which differs between databases with
+    different collations.
+    """
+    count = total = 0
+    async for batch in read_batches(conn, table, batch_size, through=through):
+        for row in batch:
+            encoded = json.dumps(encode_row(table, row), sort_keys=True, ensure_ascii=False)
+            total += int.from_bytes(hashlib.sha256(encoded.encode()).digest(), "big")
+        count += len(batch)
+    return count, f"{total % 2 ** 256:064x}"
+
+class Progress:
+    """Per-table row counter with rate, redrawn in place on stderr"""
+
+    def __init__(self, verb: str):
+        self.verb = verb
+        self.table = None
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    def advance(self, table: str, rows: int):
+        if table != self.table:
+            self.finish_table()
+            self.table, self.rows, self.started = table, 0, time.perf_counter()
+        self.rows += rows
+        rate = self.rows / max(time.perf_counter() - self.started, 1e-9)
+        print(f"\r  {table}: {self.rows} rows {self.verb} ({rate:,.0f} rows/s)",
+              end="", flush=True, file=sys.stderr)
+
+    def finish_table(self):
+        if self.table is not None:
+            print(file=sys.stderr)
+        self.table = None
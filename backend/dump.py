@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Export and import of the content database as NDJSON.
+
+    python dump.py export -o backup.ndjson.gz
+    python dump.py export -o backup.tar.gz --with-uploads
+    python dump.py import backup.tar.gz [--clear] [--batch 5000]
+
+The dump has one JSON object per line: a header with the format and schema
+versions, then {"table": ..., "row": {...}} for every row of services,
+portfolio, contacts and uploaded_images in primary key order, then a
+trailer with the row counts, so a truncated file is detected on import.
+Rows are read through a server-side cursor and written as they arrive.
+
+An output ending in .tar, .tar.gz or .tgz is a tarball holding data.ndjson
+and, with --with-uploads, uploads/<name> for every stored image file and
+its WebP/AVIF siblings. Other outputs are plain NDJSON, gzipped when the
+name ends in .gz; "-" is stdout (or stdin for import).
+
+Import applies pending migrations, then inserts in batches of --batch rows
+per transaction: COPY on PostgreSQL, executemany elsewhere. Tables must be
+empty unless --clear is given. A failed import leaves the batches already
+committed in place; run it again with --clear.
+
+Uses the same settings as the server (APP_ENV, DATABASE_URL, ...) unless
+--database-url is given.
+"""
+
+import argparse
+import asyncio
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+FORMAT_VERSION = 1
+DATA_MEMBER = "data.ndjson"
+UPLOADS_PREFIX = "uploads/"
+UPLOADS_DIR = Path(__file__).parent / "uploads"
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz")
+
+
+class DumpError(Exception):
+    pass
+
+
+def _is_tar(path: str) -> bool:
+    return path.endswith(TAR_SUFFIXES)
+
+
+# Export
+
+async def write_rows(engine, out) -> dict:
+    """Write header, rows and trailer to the text stream `out`; returns counts"""
+    from bulk import CONTENT_TABLES, Progress, encode_row, read_batches
+    from migrations import current_version
+    from settings import get_settings
+
+    batch_size = get_settings().stream_batch_size
+    schema_version = await current_version(engine)
+    header = {"format_version": FORMAT_VERSION, "schema_version": schema_version,
+              "exported_at": datetime.utcnow().isoformat()}
+    out.write(json.dumps({"meta": header}) + "\n")
+
+    counts = {}
+    progress = Progress("exported")
+    async with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            # One snapshot for all tables
+            await conn.execution_options(isolation_level="REPEATABLE READ")
+        for name, table in CONTENT_TABLES.items():
+            counts[name] = 0
+            async for batch in read_batches(conn, table, batch_size):
+                out.write("".join(
+                    json.dumps({"table": name, "row": encode_row(table, row)}, ensure_ascii=False) + "\n"
+                    for row in batch
+                ))
+                counts[name] += len(batch)
+                progress.advance(name, len(batch))
+    progress.finish_table()
+    out.write(json.dumps({"meta": {"counts": counts}}) + "\n")
+    return counts
+
+
+async def add_uploads(engine, tar: tarfile.TarFile, uploads_dir: Path) -> int:
+    from sqlalchemy import select
+    from imaging import FORMAT_EXTENSIONS
+    from models import UploadedImagesTable
+    from upload_storage import stored_files
+
+    added = 0
+    extensions = list(FORMAT_EXTENSIONS.values())
+    statement = select(UploadedImagesTable.filename).order_by(UploadedImagesTable.id)
+    async with engine.connect() as conn:
+        result = await conn.stream(statement.execution_options(yield_per=1000))
+        async for filename in result.scalars():
+            names = set()
+            # A half-migrated file may exist in both layouts; one copy is enough
+            for path in stored_files(uploads_dir, filename, extensions):
+                if path.name not in names:
+                    names.add(path.name)
+                    tar.add(path, arcname=UPLOADS_PREFIX + path.name, recursive=False)
+                    added += 1
+    return added
+
+
+async def export(engine, output: str, with_uploads: bool, uploads_dir: Path):
+    if not _is_tar(output):
+        if with_uploads:
+            raise DumpError("--with-uploads needs a .tar, .tar.gz or .tgz output")
+        if output == "-":
+            counts = await write_rows(engine, sys.stdout)
+        else:
+            opener = gzip.open if output.endswith(".gz") else open
+            with opener(output, "wt", encoding="utf-8") as out:
+                counts = await write_rows(engine, out)
+        print(f"Exported {sum(counts.values())} rows", file=sys.stderr)
+        return
+
+    mode = "w" if output.endswith(".tar") else "w:gz"
+    # dereference: store every file in full rather than as links to an
+    # earlier member, so each one can be extracted on its own
+    with tarfile.open(output, mode, dereference=True) as tar:
+        # Tar members need their size up front, so the rows are spooled to a
+        # temporary file first; data.ndjson goes first so import can start
+        # inserting before it reaches the image files
+        with tempfile.TemporaryFile() as spool:
+            out = io.TextIOWrapper(spool, encoding="utf-8")
+            counts = await write_rows(engine, out)
+            out.flush()
+            info = tarfile.TarInfo(DATA_MEMBER)
+            info.size = spool.tell()
+            info.mtime = int(time.time())
+            spool.seek(0)
+            tar.addfile(info, spool)
+            out.detach()
+        files = await add_uploads(engine, tar, uploads_dir) if with_uploads else 0
+    print(f"Exported {sum(counts.values())} rows and {files} files", file=sys.stderr)
+
+
+# Import
+
+async def prepare_tables(engine, clear: bool):
+    from sqlalchemy import delete, exists, select
+    from bulk import CONTENT_TABLES
+
+    async with engine.begin() as conn:
+        if clear:
+            for table in reversed(CONTENT_TABLES.values()):
+                await conn.execute(delete(table))
+            return
+        for name, table in CONTENT_TABLES.items():
+            if await conn.scalar(select(exists().select_from(table))):
+                raise DumpError(f"Table {name} is not empty; use --clear to replace its rows")
+
+
+async def read_rows(engine, lines, batch_size: int) -> dict:
+    """Insert the rows of a dump read from `lines` (str or UTF-8 bytes);
+    returns counts"""
+    from bulk import CONTENT_TABLES, Progress, decode_row, insert_rows
+    from migrations import latest_version
+
+    counts = {name: 0 for name in CONTENT_TABLES}
+    progress = Progress("imported")
+    batch, batch_table = [], None
+    header = trailer = None
+
+    async def flush():
+        async with engine.begin() as conn:
+            await insert_rows(conn, CONTENT_TABLES[batch_table], batch)
+        counts[batch_table] += len(batch)
+        progress.advance(batch_table, len(batch))
+        batch.clear()
+
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise DumpError(f"Line {number} is not valid JSON") from None
+        if trailer is not None:
+            raise DumpError(f"Unexpected data after the trailer on line {number}")
+        if "meta" in record:
+            if header is None:
+                header = record["meta"]
+                if header.get("format_version") != FORMAT_VERSION:
+                    raise DumpError(f"Unsupported dump format {header.get('format_version')!r}")
+                if header.get("schema_version", 0) > latest_version():
+                    raise DumpError(
+                        f"Dump is from schema version {header['schema_version']}, "
+                        f"newer than this code ({latest_version()})"
+                    )
+            else:
+                trailer = record["meta"]
+            continue
+        if header is None:
+            raise DumpError("Missing header line; not a dump file")
+        name = record.get("table")
+        if name not in CONTENT_TABLES:
+            raise DumpError(f"Unknown table {name!r} on line {number}")
+        if batch and (name != batch_table or len(batch) >= batch_size):
+            await flush()
+        batch_table = name
+        batch.append(decode_row(CONTENT_TABLES[name], record["row"]))
+    if batch:
+        await flush()
+    progress.finish_table()
+
+    if trailer is None:
+        raise DumpError("Dump ends without a trailer; the file is truncated")
+    expected = trailer.get("counts", {})
+    mismatched = [name for name in CONTENT_TABLES if expected.get(name, 0) != counts[name]]
+    if mismatched:
+        raise DumpError(
+            "Row counts differ from the trailer: "
+            + ", ".join(f"{name} {counts[name]}/{expected.get(name, 0)}" for name in mismatched)
+        )
+    return counts
+
+
+def extract_upload(tar: tarfile.TarFile, member: tarfile.TarInfo, uploads_dir: Path) -> bool:
+    from imaging import mislabeled
+    from upload_storage import locate_upload, upload_path, valid_upload_name
+
+    name = member.name[len(UPLOADS_PREFIX):]
+    if not member.isfile() or not valid_upload_name(name):
+        print(f"Skipped tar member {member.name}", file=sys.stderr)
+        return False
+    if locate_upload(uploads_dir, name) is not None:
+        return False
+    partial = uploads_dir / f".{name}.partial"
+    with tar.extractfile(member) as source, open(partial, "wb") as f:
+        shutil.copyfileobj(source, f)
+    # Old uploads with bytes that do not match their extension stay flat,
+    # as migrate_uploads.py leaves them, so they are served by magic bytes
+    target = uploads_dir / name if mislabeled(partial, name) else upload_path(uploads_dir, name)
+    os.replace(partial, target)
+    return True
+
+
+async def import_dump(engine, source: str, clear: bool, batch_size: int, uploads_dir: Path):
+    from migrations import upgrade
+
+    await upgrade(engine)
+    await prepare_tables(engine, clear)
+
+    if not _is_tar(source):
+        if source == "-":
+            counts = await read_rows(engine, sys.stdin, batch_size)
+        else:
+            opener = gzip.open if source.endswith(".gz") else open
+            with opener(source, "rt", encoding="utf-8") as lines:
+                counts = await read_rows(engine, lines, batch_size)
+        print(f"Imported {sum(counts.values())} rows", file=sys.stderr)
+        return
+
+    counts, files = None, 0
+    # Streaming mode: members are handled in archive order without seeking
+    with tarfile.open(source, "r|*") as tar:
+        for member in tar:
+            if member.name == DATA_MEMBER:
+                # Binary lines: a text wrapper would need a seekable member
+                with tar.extractfile(member) as lines:
+                    counts = await read_rows(engine, lines, batch_size)
+            elif member.name.startswith(UPLOADS_PREFIX):
+                files += extract_upload(tar, member, uploads_dir)
+    if counts is None:
+        raise DumpError(f"{source} has no {DATA_MEMBER}")
+    print(f"Imported {sum(counts.values())} rows and {files} files", file=sys.stderr)
+
+
+async def run(args):
+    from database import get_database
+
+    database = get_database()
+    try:
+        if args.command == "export":
+            await export(database.engine, args.output, args.with_uploads, args.uploads_dir)
+        else:
+            await import_dump(database.engine, args.input, args.clear, args.batch, args.uploads_dir)
+    finally:
+        await database.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--uploads-dir", type=Path, default=UPLOADS_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="write every content table to a dump")
+    export_parser.add_argument("-o", "--output", default="-", help="file name, or - for stdout")
+    export_parser.add_argument("--with-uploads", action="store_true", help="include image files (tar outputs)")
+    import_parser = subparsers.add_parser("import", help="load a dump into empty tables")
+    import_parser.add_argument("input", help="file name, or - for stdin")
+    import_parser.add_argument("--clear", action="store_true", help="delete existing content rows first")
+    import_parser.add_argument("--batch", type=int, default=5000, help="rows per insert transaction")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    started = time.perf_counter()
+    try:
+        asyncio.run(run(args))
+    except DumpError as e:
+        print(f"\n{e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Done in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+from dataclasses import dataclass
+from typing import BinaryIO, Iterable, Optional
+import struct
+
+from metrics import REGISTRY
+
+# Upload sniffing: identify the format from magic bytes and read the
+# dimensions declared in the header, without decoding anything, so that
+# non-images and decompression bombs are rejected before the upload is
+# written to disk or handed to Pillow
+
+IMAGE_UPLOADS_REJECTED = REGISTRY.counter(
+    "image_uploads_rejected_total", "Uploads rejected before processing, by reason", ("reason",)
+)
+
+# Bytes read for formats with a fixed header layout
+HEADER_BYTES = 32
+# JPEG headers can carry large EXIF/ICC segments before the frame header
+MAX_JPEG_HEADER_BYTES = 1024 * 1024
+
+# Start-of-frame markers carry the dimensions; C4, C8 and CC are not frames
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = set(range(0xD0, 0xDA)) | {0x01}
+
+class ImageRejected(ValueError):
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+@dataclass
+class SniffedImage:
+    # Pillow format name: JPEG, PNG, GIF or WEBP
+    format: str
+    width: int
+    height: int
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+def _jpeg_size(stream: BinaryIO):
+    stream.seek(2)
+    while stream.tell() < MAX_JPEG_HEADER_BYTES:
+        byte = stream.read(1)
+        if not byte:
+            return None
+        if byte != b"\xff":
+            continue
+        marker = stream.read(1)
+        # Fill bytes: any number of 0xFF before the marker code
+        while marker == b"\xff":
+            marker = stream.read(1)
+        if not marker:
+            return None
+        code = marker[0]
+        if code in JPEG_STANDALONE_MARKERS:
+            continue
+        if code == 0xDA:
+            # Start of scan before any frame header
+            return None
+        length_bytes = stream.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if code in JPEG_SOF_MARKERS:
+            frame = stream.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack(">HH", frame[1:5])
+            return width, height
+        stream.seek(length - 2, 1)
+    return None
+
+def _webp_size(header: bytes):
+    chunk = header[12:16]
+    if chunk == b"VP8 " and len(header) >= 30:
+        width, height = struct.unpack("<HH", header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(header) >= 25:
+        bits = struct.unpack("<I", header[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(header) >= 30:
+        width = int.from_bytes(header[24:27], "little") + 1
+        height = int.from_bytes(header[27:30], "little") + 1
+        return width, height
+    return None
+
+def detect_format(header: bytes) -> Optional[str]:
+    """Pillow format name from the first HEADER_BYTES of a file, if supported"""
+    if header.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "GIF"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "WEBP"
+    if header[4:12] in (b"ftypavif", b"ftypavis"):
+        return "AVIF"
+    return None
+
+def sniff_image(stream: BinaryIO) -> SniffedImage:
+    """Format and declared size of an image stream; the position is restored.
+
+    Raises ImageRejected when the magic bytes match no supported format or
+    the header is truncated.
+    """
+    position = stream.tell()
+    size = None
+    try:
+        stream.seek(0)
+        header = stream.read(HEADER_BYTES)
+        image_format = detect_format(header)
+        if image_format == "JPEG":
+            size = _jpeg_size(stream)
+        elif image_format == "PNG" and header[12:16] == b"IHDR":
+            size = struct.unpack(">II", header[16:24])
+        elif image_format == "GIF":
+            size = struct.unpack("<HH", header[6:10])
+        elif image_format == "WEBP":
+            size = _webp_size(header)
+        elif image_format is None:
+            raise ImageRejected("unknown_format", "Файл должен быть изображением")
+        else:
+            # Recognised for serving, but its header is not parsed for uploads
+            raise ImageRejected("format_not_allowed", f"Формат {image_format} не поддерживается")
+    except struct.error:
+        size = None
+    finally:
+        stream.seek(position)
+
+    if not size or not all(size):
+        raise ImageRejected("bad_header", "Не удалось прочитать заголовок изображения")
+    return SniffedImage(image_format, *size)
+
+def check_upload(stream: BinaryIO, allowed_formats: Iterable[str], max_pixels: int,
+                 max_dimension: int) -> SniffedImage:
+    """Sniff an upload and enforce format and size limits, counting rejections"""
+    try:
+        image = sniff_image(stream)
+        if image.format not in allowed_formats:
+            raise ImageRejected("format_not_allowed", f"Формат {image.format} не поддерживается")
+        if image.width > max_dimension or image.height > max_dimension or image.pixels > max_pixels:
+            raise ImageRejected(
+                "too_many_pixels",
+                f"Слишком большое разрешение изображения: {image.width}x{image.height}"
+            )
+    except ImageRejected as e:
+        IMAGE_UPLOADS_REJECTED.labels(reason=e.reason).inc()
+        raise
+    return image
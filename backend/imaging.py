@@ -0,0 +1,404 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import asyncio
+import logging
+import os
+import time
+
+from instrumentation import timed
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Upload image pipeline (decode, convert, resize, encode) with per-stage
+# timings, sizes and failure reasons reported to the metrics registry and
+# returned to the caller so they can be stored with the upload record
+
+BYTES_BUCKETS = (
+    16 * 1024, 64 * 1024, 128 * 1024, 256 * 1024, 512 * 1024,
+    1024 ** 2, 2 * 1024 ** 2, 5 * 1024 ** 2, 10 * 1024 ** 2,
+)
+PIXEL_BUCKETS = (1e5, 5e5, 1e6, 2e6, 5e6, 12e6, 24e6, 50e6)
+RATIO_BUCKETS = (0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5)
+
+IMAGE_STAGE_DURATION = REGISTRY.histogram(
+    "image_stage_duration_seconds", "Time spent in each image pipeline stage", ("stage",)
+)
+IMAGE_INPUT_BYTES = REGISTRY.histogram(
+    "image_input_bytes", "Size of uploaded images before processing", ("format",), buckets=BYTES_BUCKETS
+)
+IMAGE_OUTPUT_BYTES = REGISTRY.histogram(
+    "image_output_bytes", "Size of stored images after processing", ("format",), buckets=BYTES_BUCKETS
+)
+IMAGE_INPUT_PIXELS = REGISTRY.histogram(
+    "image_input_pixels", "Pixel count of uploaded images", ("format",), buckets=PIXEL_BUCKETS
+)
+IMAGE_OUTPUT_PIXELS = REGISTRY.histogram(
+    "image_output_pixels", "Pixel count of stored images", ("format",), buckets=PIXEL_BUCKETS
+)
+IMAGE_COMPRESSION_RATIO = REGISTRY.histogram(
+    "image_compression_ratio", "Output bytes divided by input bytes", ("format",), buckets=RATIO_BUCKETS
+)
+IMAGE_BYTES_SAVED = REGISTRY.counter(
+    "image_bytes_saved_total", "Bytes removed by image processing (negative when it grew files)"
+)
+IMAGE_VARIANT_BYTES = REGISTRY.histogram(
+    "image_variant_bytes", "Size of WebP/AVIF siblings of stored images", ("format",), buckets=BYTES_BUCKETS
+)
+IMAGE_FAILURES = REGISTRY.counter(
+    "image_processing_failures_total", "Images that could not be processed, by reason", ("reason",)
+)
+
+STAGES = ("decode", "convert", "resize", "encode")
+
+# Pillow format name -> extension and media type of stored files
+FORMAT_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "WEBP": ".webp", "AVIF": ".avif"}
+MEDIA_TYPES = {
+    "JPEG": "image/jpeg", "PNG": "image/png", "GIF": "image/gif",
+    "WEBP": "image/webp", "AVIF": "image/avif",
+}
+# Extension -> media type of served files; .bmp and .svg for files uploaded
+# before uploads were sniffed
+EXTENSION_MEDIA_TYPES = {
+    ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".gif": "image/gif",
+    ".webp": "image/webp", ".avif": "image/avif", ".bmp": "image/bmp", ".svg": "image/svg+xml",
+}
+# Siblings offered to clients that accept them, smallest first
+NEGOTIATED_FORMATS = ("AVIF", "WEBP")
+
+WEBP_QUALITY = 80
+AVIF_QUALITY = 60
+
+# Lossless (PNG) uploads whose sample has at least this share of distinct
+# colours are photos and stored as JPEG; screenshots and diagrams stay
+# below 1% and are kept as PNG
+PHOTO_COLOR_RATIO = 1 / 16
+PHOTO_SAMPLE_SIDE = 256
+# 16-bit grayscale, which JPEG, WebP and AVIF would cut to 8 bits
+HIGH_DEPTH_MODES = ("I;16", "I")
+# Modes stored in a PNG primary as they are; others are converted to RGBA
+PNG_MODES = ("RGBA", "RGB", "L", *HIGH_DEPTH_MODES)
+
+# Fast decode path: JPEG draft decoding stops at this multiple of the target
+# size, and resize() uses reduce() until within REDUCING_GAP of it
+DRAFT_OVERSAMPLE = 2
+REDUCING_GAP = 3.0
+
+@dataclass
+class ImageStats:
+    input_format: Optional[str] = None
+    input_bytes: int = 0
+    output_bytes: int = 0
+    input_width: int = 0
+    input_height: int = 0
+    output_width: int = 0
+    output_height: int = 0
+    output_format: Optional[str] = None
+    # Stored primary file; the uploaded file itself when processing failed
+    output_path: Optional[Path] = None
+    # Sibling format -> bytes
+    variants: Dict[str, int] = field(default_factory=dict)
+    # Stage name -> seconds
+    stages: Dict[str, float] = field(default_factory=dict)
+    # Failure reason, None when the image was processed
+    error: Optional[str] = None
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.stages.values())
+
+    @property
+    def compression_ratio(self) -> Optional[float]:
+        if not self.input_bytes or not self.output_bytes:
+            return None
+        return self.output_bytes / self.input_bytes
+
+    def as_dict(self) -> dict:
+        """Detail stored in uploaded_images.processing_stats"""
+        ratio = self.compression_ratio
+        return {
+            "input_format": self.input_format,
+            "output_format": self.output_format,
+            "variants": dict(self.variants),
+            "input_pixels": self.input_width * self.input_height,
+            "output_pixels": self.output_width * self.output_height,
+            "compression_ratio": round(ratio, 4) if ratio is not None else None,
+            "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            "error": self.error,
+        }
+
+def _failure_reason(stage: str, error: Exception) -> str:
+    from PIL import Image, UnidentifiedImageError
+
+    if isinstance(error, UnidentifiedImageError):
+        return "unidentified_format"
+    if isinstance(error, Image.DecompressionBombError):
+        return "decompression_bomb"
+    if isinstance(error, OSError) and "truncated" in str(error):
+        return "truncated"
+    return f"{stage}_error"
+
+def _record_metrics(stats: ImageStats):
+    for name, seconds in stats.stages.items():
+        IMAGE_STAGE_DURATION.observe(seconds, stage=name)
+    if stats.error is not None:
+        IMAGE_FAILURES.labels(reason=stats.error).inc()
+        return
+    image_format = stats.input_format or "unknown"
+    IMAGE_INPUT_BYTES.observe(stats.input_bytes, format=image_format)
+    IMAGE_OUTPUT_BYTES.observe(stats.output_bytes, format=image_format)
+    IMAGE_INPUT_PIXELS.observe(stats.input_width * stats.input_height, format=image_format)
+    IMAGE_OUTPUT_PIXELS.observe(stats.output_width * stats.output_height, format=image_format)
+    IMAGE_COMPRESSION_RATIO.observe(stats.compression_ratio, format=image_format)
+    IMAGE_BYTES_SAVED.inc(stats.input_bytes - stats.output_bytes)
+    for variant_format, size in stats.variants.items():
+        IMAGE_VARIANT_BYTES.observe(size, format=variant_format)
+
+def looks_photographic(img) -> bool:
+    """Whether an image has the colour variety of a photo rather than a
+    screenshot or diagram, judged on a nearest-neighbour sample"""
+    from PIL import Image
+
+    sample = img
+    if img.width > PHOTO_SAMPLE_SIDE or img.height > PHOTO_SAMPLE_SIDE:
+        size = (min(img.width, PHOTO_SAMPLE_SIDE), min(img.height, PHOTO_SAMPLE_SIDE))
+        sample = img.resize(size, Image.Resampling.NEAREST)
+    pixels = sample.width * sample.height
+    return len(sample.getcolors(pixels)) >= pixels * PHOTO_COLOR_RATIO
+
+def choose_output_format(img) -> str:
+    """PNG where JPEG would lose something (transparency, palette
+    graphics, 16-bit depth, lossless screenshots and diagrams), JPEG for
+    photos"""
+    if img.mode in ("RGBA", "LA", "PA", "P", "1") or "transparency" in img.info:
+        return "PNG"
+    if img.mode in HIGH_DEPTH_MODES:
+        return "PNG"
+    if img.format == "PNG" and not looks_photographic(img):
+        return "PNG"
+    return "JPEG"
+
+def to_eight_bit(img):
+    """16-bit grayscale scaled down to L, for encoders without 16-bit
+    support; other images are returned as they are"""
+    if img.mode not in HIGH_DEPTH_MODES:
+        return img
+    return img.convert("I").point(lambda value: value * (1 / 257)).convert("L")
+
+def encode_options(image_format: str, quality: int) -> dict:
+    if image_format == "JPEG":
+        return {"quality": quality, "optimize": True}
+    if image_format == "WEBP":
+        return {"quality": WEBP_QUALITY, "method": 4}
+    if image_format == "AVIF":
+        return {"quality": AVIF_QUALITY, "speed": 8}
+    # optimize=True costs ~6x the encode time for ~2% smaller PNGs
+    return {"compress_level": 6}
+
+def supported_variant_formats(formats: Iterable[str]) -> List[str]:
+    """The requested sibling formats this Pillow build can encode"""
+    from PIL import features
+
+    return [f for f in formats if f in FORMAT_EXTENSIONS and features.check(f.lower())]
+
+def _accepted_types(accept: str) -> Dict[str, float]:
+    types = {}
+    for part in accept.split(","):
+        media_type, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        types[media_type.strip().lower()] = quality
+    return types
+
+def negotiate_variant(primary: Path, accept: str) -> Path:
+    """Smallest sibling the client explicitly accepts, else the primary.
+
+    Wildcards do not count: a client that sends only */* may not decode
+    AVIF or WebP.
+    """
+    accepted = _accepted_types(accept or "")
+    for variant_format in NEGOTIATED_FORMATS:
+        if accepted.get(MEDIA_TYPES[variant_format], 0) > 0:
+            candidate = primary.with_suffix(FORMAT_EXTENSIONS[variant_format])
+            if candidate.exists():
+                return candidate
+    return primary
+
+def preferred_variant_format(accept: str, formats: Iterable[str]) -> Optional[str]:
+    """First of `formats`, smallest first, the client explicitly accepts"""
+    accepted = _accepted_types(accept or "")
+    for variant_format in NEGOTIATED_FORMATS:
+        if variant_format in formats and accepted.get(MEDIA_TYPES[variant_format], 0) > 0:
+            return variant_format
+    return None
+
+def _encode_variant(primary: Path, variant_format: str, quality: int) -> Path:
+    from PIL import Image
+
+    target = primary.with_suffix(FORMAT_EXTENSIONS[variant_format])
+    # Written under a private name and renamed, so concurrent readers and
+    # other workers never see a partial file
+    partial = target.with_name(f".{target.name}.{os.getpid()}.partial")
+    started = time.perf_counter()
+    try:
+        with Image.open(primary) as img:
+            img = to_eight_bit(img)
+            if img.mode not in ("RGB", "RGBA", "L"):
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+            img.save(partial, variant_format, **encode_options(variant_format, quality))
+        os.replace(partial, target)
+    finally:
+        partial.unlink(missing_ok=True)
+    IMAGE_STAGE_DURATION.observe(time.perf_counter() - started, stage=f"encode_{variant_format.lower()}")
+    IMAGE_VARIANT_BYTES.observe(target.stat().st_size, format=variant_format)
+    return target
+
+async def create_variant(primary: Path, variant_format: str, quality: int = 85) -> Path:
+    """Encode a missing sibling of a stored image, e.g. one uploaded before
+    siblings were generated; runs in a worker thread"""
+    return await asyncio.to_thread(_encode_variant, primary, variant_format, quality)
+
+def sniffed_media_type(path: Path) -> Optional[str]:
+    """Media type from the file's magic bytes, None when not recognised"""
+    from image_sniffing import HEADER_BYTES, detect_format
+
+    with open(path, "rb") as f:
+        image_format = detect_format(f.read(HEADER_BYTES))
+    return MEDIA_TYPES[image_format] if image_format else None
+
+def media_type_for(path: Path, sniff: bool = False) -> str:
+    """Media type of a stored file.
+
+    Files stored by the upload endpoint are named after the format sniffed
+    at upload, so the extension is reliable without reading the file.
+    `sniff` reads the magic bytes instead, for uploads from before then,
+    which may carry JPEG bytes under another extension.
+    """
+    if sniff:
+        media_type = sniffed_media_type(path)
+        if media_type is not None:
+            return media_type
+    return EXTENSION_MEDIA_TYPES.get(path.suffix.lower(), "application/octet-stream")
+
+def mislabeled(path: Path, filename: Optional[str] = None) -> bool:
+    """Whether the magic bytes of `path` name another format than the
+    extension of `filename` (the file's own name by default)"""
+    media_type = sniffed_media_type(path)
+    suffix = Path(filename or path.name).suffix.lower()
+    return media_type is not None and media_type != EXTENSION_MEDIA_TYPES.get(suffix)
+
+def _process_image(file_path: Path, max_width: int, max_height: int, quality: int,
+                   fast_decode: bool, formats: Optional[List[str]],
+                   variant_formats: Iterable[str]) -> ImageStats:
+    # Pillow is imported on first use to keep worker spawn cheap
+    from PIL import Image
+
+    stats = ImageStats(input_bytes=file_path.stat().st_size, output_path=file_path)
+    stage = "decode"
+    started = time.perf_counter()
+    try:
+        with Image.open(file_path, formats=formats) as img:
+            stats.input_format = img.format
+            stats.input_width, stats.input_height = img.size
+
+            # Calculate new dimensions while maintaining aspect ratio
+            ratio = min(max_width / img.width, max_height / img.height)
+            target = (int(img.width * ratio), int(img.height * ratio)) if ratio < 1 else None
+            if target and fast_decode:
+                # Let the JPEG decoder scale by 1/2, 1/4 or 1/8 in the DCT
+                # domain, stopping at twice the target size like
+                # Image.thumbnail does, so the final resample still has
+                # enough detail to work with
+                img.draft(None, (target[0] * DRAFT_OVERSAMPLE, target[1] * DRAFT_OVERSAMPLE))
+            img.load()
+            stats.stages["decode"] = time.perf_counter() - started
+
+            # Convert to a mode the output format can store and LANCZOS can
+            # resample; palette graphics are quantized again after resizing
+            stage, started = "convert", time.perf_counter()
+            output_format = choose_output_format(img)
+            palette = img.mode in ("P", "1") and "transparency" not in img.info
+            if output_format == "PNG" and not palette:
+                if img.mode not in PNG_MODES:
+                    img = img.convert("RGBA")
+            elif img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            stats.stages["convert"] = time.perf_counter() - started
+
+            stage, started = "resize", time.perf_counter()
+            if target:
+                # With a reducing gap, resize() first shrinks by an integer
+                # factor with reduce() and only runs LANCZOS on the rest
+                reducing_gap = REDUCING_GAP if fast_decode else None
+                img = img.resize(target, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+            stats.output_width, stats.output_height = img.size
+            stats.stages["resize"] = time.perf_counter() - started
+
+            # Save optimized image
+            stage, started = "encode", time.perf_counter()
+            output_path = file_path.with_suffix(FORMAT_EXTENSIONS[output_format])
+            primary = img.quantize(256, method=Image.Quantize.FASTOCTREE) if palette else img
+            primary.save(output_path, output_format, **encode_options(output_format, quality))
+            stats.stages["encode"] = time.perf_counter() - started
+
+            # The upload is replaced before siblings are written, since an
+            # uploaded .webp shares its name with the WebP sibling
+            if output_path != file_path:
+                file_path.unlink()
+            stats.output_format = output_format
+            stats.output_path = output_path
+            stats.output_bytes = output_path.stat().st_size
+
+            # GIFs may be animated; siblings would keep only the first frame
+            if stats.input_format == "GIF":
+                variant_formats = ()
+            for variant_format in supported_variant_formats(variant_formats):
+                variant_path = file_path.with_suffix(FORMAT_EXTENSIONS[variant_format])
+                if variant_path == output_path:
+                    continue
+                stage, started = f"encode_{variant_format.lower()}", time.perf_counter()
+                to_eight_bit(img).save(variant_path, variant_format, **encode_options(variant_format, quality))
+                stats.variants[variant_format] = variant_path.stat().st_size
+                stats.stages[stage] = time.perf_counter() - started
+    except Exception as e:
+        stats.stages[stage] = time.perf_counter() - started
+        stats.error = _failure_reason(stage, e)
+        logger.error(f"Error processing image {file_path} ({stats.error}): {e}")
+    return stats
+
+# Helper function to resize and optimize images
+@timed("image")
+async def process_image(file_path: Path, max_width: int = 1200, max_height: int = 800,
+                        quality: int = 85, fast_decode: bool = True,
+                        formats: Optional[List[str]] = None,
+                        variant_formats: Iterable[str] = ()) -> ImageStats:
+    """Resize and re-encode an uploaded image.
+
+    The output format is chosen per image (see choose_output_format) and the
+    result is stored next to the upload with the matching extension,
+    replacing it; `variant_formats` (e.g. WEBP, AVIF) are written as
+    siblings with the same stem, except for GIF uploads.
+
+    With `fast_decode`, large JPEGs are decoded at reduced scale and the
+    resize reduces by an integer factor before the final LANCZOS pass,
+    instead of decoding and resampling at full resolution. `formats`
+    restricts which Pillow decoders may open the file. Failures are
+    logged and reported in the returned stats rather than raised; when the
+    primary could not be written the original file is kept as uploaded,
+    and `output_path` points at it.
+    """
+    # Runs in a worker thread so the event loop keeps serving other
+    # requests; Pillow releases the GIL while decoding, resampling and
+    # encoding
+    stats = await asyncio.to_thread(
+        _process_image, file_path, max_width, max_height, quality, fast_decode, formats, variant_formats
+    )
+    _record_metrics(stats)
+    return stats
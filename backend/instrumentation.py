@@ -0,0 +1,293 @@
+from sqlalchemy import event
+from fastapi.routing import APIRoute
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import functools
+import inspect
+import logging
+import time
+import uuid
+
+from metrics import REGISTRY
+
+# Database and request instrumentation. SQLAlchemy pool and cursor events feed
+# the metrics registry, and per-request totals are collected in RequestStats
+# through a context variable set by RequestMetricsMiddleware
+
+slow_request_logger = logging.getLogger("slow_requests")
+
+# Statements kept per request for the slow-request log
+MAX_LOGGED_STATEMENTS = 100
+MAX_STATEMENT_LENGTH = 500
+
+@dataclass
+class RequestStats:
+    # Taken from the X-Request-ID header when present and echoed back
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    started: float = field(default_factory=time.perf_counter)
+    db_time: float = 0.0
+    query_count: int = 0
+    pool_wait: float = 0.0
+    # Named phases (convert, serialize, image, ...) in seconds
+    timings: Dict[str, float] = field(default_factory=dict)
+    # Set by TimedRoute when the endpoint function returns
+    endpoint_done: Optional[float] = None
+    # (statement, seconds) pairs, capped at MAX_LOGGED_STATEMENTS
+    statements: List[Tuple[str, float]] = field(default_factory=list)
+
+    def add_timing(self, name: str, seconds: float):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "current_request_stats", default=None
+)
+
+@contextmanager
+def request_timer(name: str):
+    """Add the time spent in the block to the current request's `name` phase"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.add_timing(name, time.perf_counter() - started)
+
+def timed(name: str):
+    """Decorator form of request_timer for sync and async functions"""
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with request_timer(name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with request_timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class TimedRoute(APIRoute):
+    """Route that records when its endpoint returns, so the time FastAPI then
+    spends validating and encoding the response shows up as `serialize`"""
+
+    def __init__(self, path, endpoint, **kwargs):
+        if inspect.iscoroutinefunction(endpoint):
+            original = endpoint
+
+            @functools.wraps(original)
+            async def endpoint(*args, **kwargs):
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    stats = current_request_stats.get()
+                    if stats is not None:
+                        stats.endpoint_done = time.perf_counter()
+        super().__init__(path, endpoint, **kwargs)
+
+# Bucket boundaries for "queries per request"
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+DB_STATEMENT_DURATION = REGISTRY.histogram(
+    "db_statement_duration_seconds", "Latency of individual SQL statements", ("operation",)
+)
+DB_POOL_WAIT = REGISTRY.histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled connection", ("pool",)
+)
+DB_CONNECTION_AGE = REGISTRY.histogram(
+    "db_connection_age_seconds", "Age of pooled connections when checked out", ("pool",),
+    buckets=(1, 10, 60, 300, 900, 1800, 3600, 7200)
+)
+DB_POOL_CHECKOUTS = REGISTRY.counter(
+    "db_pool_checkouts_total", "Connections checked out of the pool", ("pool",)
+)
+DB_POOL_CONNECTS = REGISTRY.counter(
+    "db_pool_connections_created_total", "New DBAPI connections opened by the pool", ("pool",)
+)
+DB_POOL_INVALIDATIONS = REGISTRY.counter(
+    "db_pool_invalidations_total", "Pooled connections invalidated after errors", ("pool",)
+)
+DB_POOL_SIZE = REGISTRY.gauge("db_pool_size", "Configured pool size", ("pool",))
+DB_POOL_CHECKED_OUT = REGISTRY.gauge("db_pool_checked_out", "Connections currently in use", ("pool",))
+DB_POOL_CHECKED_IN = REGISTRY.gauge("db_pool_checked_in", "Idle connections in the pool", ("pool",))
+DB_POOL_OVERFLOW = REGISTRY.gauge(
+    "db_pool_overflow", "Connections beyond pool_size (negative while below size)", ("pool",)
+)
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "Total request latency", ("endpoint", "method")
+)
+HTTP_REQUEST_DB_TIME = REGISTRY.histogram(
+    "http_request_db_time_seconds", "Time spent executing SQL per request", ("endpoint",)
+)
+HTTP_REQUEST_QUERIES = REGISTRY.histogram(
+    "http_request_db_queries", "SQL statements executed per request", ("endpoint",),
+    buckets=QUERY_COUNT_BUCKETS
+)
+HTTP_REQUEST_POOL_WAIT = REGISTRY.histogram(
+    "http_request_pool_wait_seconds", "Time spent waiting for connections per request", ("endpoint",)
+)
+
+class InstrumentedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that reports how long each checkout waited for a connection"""
+
+    pool_label = "unknown"
+    # Keep pool log records under the sqlalchemy.pool logger hierarchy
+    _sqla_logger_namespace = "sqlalchemy.pool.impl.AsyncAdaptedQueuePool"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            DB_POOL_WAIT.observe(waited, pool=self.pool_label)
+            stats = current_request_stats.get()
+            if stats is not None:
+                stats.pool_wait += waited
+
+def _operation(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return keyword if keyword in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+def instrument_engine(async_engine, label: str):
+    """Attach pool and cursor event listeners and pool gauges to an engine"""
+    sync_engine = async_engine.sync_engine
+    pool = sync_engine.pool
+    if isinstance(pool, InstrumentedAsyncAdaptedQueuePool):
+        pool.pool_label = label
+
+    DB_POOL_SIZE.set_function(pool.size, pool=label)
+    DB_POOL_CHECKED_OUT.set_function(pool.checkedout, pool=label)
+    DB_POOL_CHECKED_IN.set_function(pool.checkedin, pool=label)
+    DB_POOL_OVERFLOW.set_function(pool.overflow, pool=label)
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        connection_record.info["created_at"] = time.monotonic()
+        DB_POOL_CONNECTS.labels(pool=label).inc()
+
+    @event.listens_for(sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKOUTS.labels(pool=label).inc()
+        created_at = connection_record.info.get("created_at")
+        if created_at is not None:
+            DB_CONNECTION_AGE.observe(time.monotonic() - created_at, pool=label)
+
+    @event.listens_for(sync_engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        DB_POOL_INVALIDATIONS.labels(pool=label).inc()
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_STATEMENT_DURATION.observe(elapsed, operation=_operation(statement))
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.db_time += elapsed
+            stats.query_count += 1
+            if len(stats.statements) < MAX_LOGGED_STATEMENTS:
+                stats.statements.append((statement[:MAX_STATEMENT_LENGTH], elapsed))
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _on_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+def _endpoint_label(scope) -> str:
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    return getattr(endpoint, "__name__", type(endpoint).__name__)
+
+def _server_timing(stats: RequestStats) -> str:
+    total = time.perf_counter() - stats.started
+    entries = [f'db;dur={stats.db_time * 1000:.2f};desc="{stats.query_count} queries"']
+    if stats.pool_wait:
+        entries.append(f"pool;dur={stats.pool_wait * 1000:.2f}")
+    for name, seconds in stats.timings.items():
+        entries.append(f"{name};dur={seconds * 1000:.2f}")
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+class RequestMetricsMiddleware:
+    """Pure ASGI middleware recording per-endpoint latency and DB usage.
+
+    It also adds a Server-Timing header (db, pool wait, convert, serialize,
+    image, total) and logs requests slower than `slow_request_ms` together with
+    the SQL they issued.
+    """
+
+    def __init__(self, app, server_timing: bool = True, slow_request_ms: float = 0):
+        self.app = app
+        self.server_timing = server_timing
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope.get("headers", [])).get(b"x-request-id", b"").decode("latin-1")[:200]
+        stats = RequestStats(request_id=request_id) if request_id else RequestStats()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if stats.endpoint_done is not None:
+                    stats.add_timing("serialize", time.perf_counter() - stats.endpoint_done)
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", stats.request_id.encode("latin-1")))
+                if self.server_timing:
+                    headers.append((b"server-timing", _server_timing(stats).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = current_request_stats.set(stats)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_request_stats.reset(token)
+            total = time.perf_counter() - stats.started
+            endpoint = _endpoint_label(scope)
+            HTTP_REQUEST_DURATION.observe(total, endpoint=endpoint, method=scope["method"])
+            HTTP_REQUEST_DB_TIME.observe(stats.db_time, endpoint=endpoint)
+            HTTP_REQUEST_QUERIES.observe(stats.query_count, endpoint=endpoint)
+            HTTP_REQUEST_POOL_WAIT.observe(stats.pool_wait, endpoint=endpoint)
+            if self.slow_request_ms and total * 1000 >= self.slow_request_ms:
+                self._log_slow_request(scope, endpoint, status_code, total, stats)
+
+    def _log_slow_request(self, scope, endpoint, status_code, total, stats):
+        entry = {
+            "request_id": stats.request_id,
+            "method": scope["method"],
+            "path": scope["path"],
+            "endpoint": endpoint,
+            "status": status_code,
+            "total_ms": round(total * 1000, 2),
+            "db_ms": round(stats.db_time * 1000, 2),
+            "pool_wait_ms": round(stats.pool_wait * 1000, 2),
+            "query_count": stats.query_count,
+            "timings_ms": {name: round(seconds * 1000, 2) for name, seconds in stats.timings.items()},
+            "statements": [
+                {"sql": sql, "ms": round(seconds * 1000, 2)} for sql, seconds in stats.statements
+            ],
+        }
+        # Fields go through `extra` so the JSON log formatter emits them as-is
+        slow_request_logger.warning(
+            f"Slow request {scope['method']} {scope['path']}: {entry['total_ms']} ms",
+            extra={"event": "slow_request", **entry}
+        )
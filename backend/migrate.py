@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Offline schema migration CLI.
+
+    python migrate.py status
+    python migrate.py upgrade [--to VERSION]
+
+Uses the same settings as the server (APP_ENV, DATABASE_URL, ...). Run
+`upgrade` once per deploy before starting the workers when DB_AUTO_MIGRATE
+is off.
+"""
+
+import argparse
+import asyncio
+import logging
+
+from database import engine
+from migrations import MIGRATIONS, current_version, latest_version, pending_migrations, upgrade
+
+
+async def status():
+    version = await current_version(engine)
+    print(f"Current version: {version}")
+    print(f"Latest version:  {latest_version()}")
+    for m in MIGRATIONS:
+        state = "applied" if m.version <= version else "pending"
+        print(f"  {m.version:>4}  {state:<8} {m.name}")
+
+
+async def run_upgrade(target):
+    version = await current_version(engine)
+    if not pending_migrations(version, target):
+        print(f"Already at version {version}, nothing to do")
+        return
+    applied = await upgrade(engine, target)
+    for m in applied:
+        print(f"Applied {m.version}: {m.name}")
+    print(f"Now at version {await current_version(engine)}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="show applied and pending migrations")
+    upgrade_parser = subparsers.add_parser("upgrade", help="apply pending migrations")
+    upgrade_parser.add_argument("--to", type=int, default=None, help="stop at this version")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    try:
+        if args.command == "status":
+            await status()
+        else:
+            await run_upgrade(args.to)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
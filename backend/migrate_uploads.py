@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Online migration of uploads from the flat layout into hash-prefix shards.
+
+    python migrate_uploads.py status
+    python migrate_uploads.py run [--batch 1000] [--grace 2] [--limit N]
+
+Safe to run while the server is up: files are found in either layout, and
+each batch is first hard-linked into its shards, then, after --grace
+seconds for requests that already resolved the old path, unlinked from
+the top level. Progress lives in the filesystem itself, so an interrupted
+run is resumed by running it again.
+
+Old uploads whose bytes do not match their extension (JPEG data in a .png,
+say) stay in the flat layout, where the server reads their magic bytes to
+pick the Content-Type; files in shards are served by extension.
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+from imaging import mislabeled
+from upload_storage import link_into_shard
+
+UPLOADS_DIR = Path(__file__).parent / "uploads"
+
+
+def flat_files(root: Path):
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False) and not entry.name.startswith("."):
+                yield Path(entry.path)
+
+
+def count_sharded(root: Path) -> int:
+    count = 0
+    for first in root.iterdir():
+        if len(first.name) != 2 or not first.is_dir():
+            continue
+        for second in first.iterdir():
+            if second.is_dir():
+                count += sum(1 for path in second.iterdir() if not path.name.startswith("."))
+    return count
+
+
+def status(root: Path):
+    kept = flat = 0
+    for path in flat_files(root):
+        if mislabeled(path):
+            kept += 1
+        else:
+            flat += 1
+    print(f"Flat (pending): {flat}")
+    print(f"Flat (kept):    {kept}")
+    print(f"Sharded:        {count_sharded(root)}")
+
+
+def migrate_batch(root: Path, batch, grace: float):
+    """Returns (moved, conflicts)"""
+    linked, conflicts = [], 0
+    for path in batch:
+        if link_into_shard(root, path):
+            linked.append(path)
+        else:
+            conflicts += 1
+            print(f"\nConflict, left in place: {path.name}")
+    # The server prefers the shard path from here on; give requests that
+    # resolved the flat path just before the link time to open it
+    time.sleep(grace)
+    for path in linked:
+        path.unlink(missing_ok=True)
+    return len(linked), conflicts
+
+
+def run(root: Path, batch_size: int, grace: float, limit):
+    started = time.perf_counter()
+    moved = conflicts = 0
+    batch = []
+    kept = 0
+    for path in flat_files(root):
+        if limit is not None and moved + conflicts + len(batch) >= limit:
+            break
+        if mislabeled(path):
+            kept += 1
+            continue
+        batch.append(path)
+        if len(batch) >= batch_size:
+            done, failed = migrate_batch(root, batch, grace)
+            moved, conflicts = moved + done, conflicts + failed
+            batch.clear()
+            rate = moved / (time.perf_counter() - started)
+            print(f"\rMoved {moved} files ({rate:,.0f} files/s)", end="", flush=True)
+    if batch:
+        done, failed = migrate_batch(root, batch, grace)
+        moved, conflicts = moved + done, conflicts + failed
+    print(f"\rMoved {moved} files in {time.perf_counter() - started:.1f} s, {conflicts} conflicts, "
+          f"{kept} mislabeled files kept flat")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads-dir", type=Path, default=UPLOADS_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="count files in each layout")
+    run_parser = subparsers.add_parser("run", help="move flat files into their shards")
+    run_parser.add_argument("--batch", type=int, default=1000, help="files linked before each unlink pass")
+    run_parser.add_argument("--grace", type=float, default=2.0, help="seconds between linking and unlinking")
+    run_parser.add_argument("--limit", type=int, default=None, help="stop after this many files")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        status(args.uploads_dir)
+    else:
+        run(args.uploads_dir, args.batch, args.grace, args.limit)
+
+
+if __name__ == "__main__":
+    main()
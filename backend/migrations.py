@@ -0,0 +1,278 @@
+from sqlalchemy import (
+    Table, Column, MetaData, String, Text, DateTime, Integer, Float, JSON, inspect, select, func, text, delete
+)
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateTable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Versioned schema migrations. Each migration runs once and is recorded in the
+# schema_version table, so startup only needs to read the current version
+version_metadata = MetaData()
+
+# Key of the PostgreSQL advisory lock held while migrating (seeding uses
+# SEED_ADVISORY_LOCK_KEY in seeding.py)
+MIGRATION_ADVISORY_LOCK_KEY = 7_310_457_202
+MIGRATION_LOCK_POLL_SECONDS = 0.5
+
+schema_version_table = Table(
+    "schema_version",
+    version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    upgrade: Callable[..., Awaitable[None]]
+    # Non-transactional migrations run in autocommit mode, which PostgreSQL
+    # requires for CREATE INDEX CONCURRENTLY
+    transactional: bool = True
+
+MIGRATIONS: List[Migration] = []
+
+def migration(version: int, name: str, transactional: bool = True):
+    def register(upgrade):
+        MIGRATIONS.append(Migration(version, name, upgrade, transactional))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return upgrade
+    return register
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+async def create_index(conn, name: str, table: str, columns: List[str]):
+    """Create an index without blocking writes on PostgreSQL"""
+    column_list = ", ".join(columns)
+    if conn.dialect.name == "postgresql":
+        # A failed concurrent build leaves an INVALID index behind that
+        # IF NOT EXISTS would skip, so drop it and build again
+        invalid = await conn.scalar(
+            text(
+                "SELECT NOT i.indisvalid FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+            ),
+            {"name": name}
+        )
+        if invalid:
+            await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        await conn.execute(
+            text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({column_list})")
+        )
+    else:
+        await conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({column_list})"))
+
+async def add_columns(conn, table: str, columns: List[Column]):
+    """Add nullable columns, skipping those that already exist"""
+    existing = await conn.run_sync(
+        lambda sync_conn: {c["name"] for c in inspect(sync_conn).get_columns(table)}
+    )
+    for column in columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=conn.dialect)
+        await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column.name} {column_type}"))
+
+# Migrations. Never edit one that has shipped; add a new version instead
+
+@migration(1, "initial schema")
+async def _initial_schema(conn):
+    # Frozen copy of the tables as originally created by create_all, so
+    # existing databases are adopted as-is and new ones start from the same point
+    metadata = MetaData()
+    Table(
+        "services", metadata,
+        Column("id", String(36), primary_key=True),
+        Column("name", String(255), nullable=False),
+        Column("description", Text, nullable=False),
+        Column("detailed_description", Text, nullable=False),
+        Column("price", String(100), nullable=False),
+        Column("images", JSON),
+        Column("created_at", DateTime),
+        Column("updated_at", DateTime),
+    )
+    Table(
+        "portfolio", metadata,
+        Column("id", String(36), primary_key=True),
+        Column("title", String(255), nullable=False),
+        Column("image", Text, nullable=False),
+        Column("category", String(100), nullable=False),
+        Column("created_at", DateTime),
+        Column("updated_at", DateTime),
+    )
+    Table(
+        "contacts", metadata,
+        Column("id", String(36), primary_key=True),
+        Column("name", String(255), nullable=False),
+        Column("tagline", String(500), nullable=False),
+        Column("phone", String(50), nullable=False),
+        Column("whatsapp", String(50), nullable=False),
+        Column("email", String(255), nullable=False),
+        Column("updated_at", DateTime),
+    )
+    Table(
+        "uploaded_images", metadata,
+        Column("id", String(36), primary_key=True),
+        Column("filename", String(255), nullable=False),
+        Column("original_filename", String(255), nullable=False),
+        Column("url", Text, nullable=False),
+        Column("size", Integer, nullable=False),
+        Column("created_at", DateTime),
+    )
+    await conn.run_sync(metadata.create_all, checkfirst=True)
+
+@migration(2, "index uploaded_images.created_at", transactional=False)
+async def _index_uploaded_images_created_at(conn):
+    await create_index(conn, "ix_uploaded_images_created_at", "uploaded_images", ["created_at"])
+
+@migration(3, "index services and portfolio created_at", transactional=False)
+async def _index_content_created_at(conn):
+    await create_index(conn, "ix_services_created_at", "services", ["created_at"])
+    await create_index(conn, "ix_portfolio_created_at", "portfolio", ["created_at"])
+
+@migration(4, "app_locks table for seeding on SQLite")
+async def _app_locks(conn):
+    metadata = MetaData()
+    app_locks = Table(
+        "app_locks", metadata,
+        Column("name", String(100), primary_key=True),
+        Column("acquired_at", DateTime),
+    )
+    await conn.run_sync(metadata.create_all, checkfirst=True)
+    await conn.execute(app_locks.insert().values(name="seed_default_data"))
+
+@migration(5, "image processing stats on uploaded_images")
+async def _uploaded_image_stats(conn):
+    await add_columns(conn, "uploaded_images", [
+        Column("original_size", Integer),
+        Column("width", Integer),
+        Column("height", Integer),
+        Column("original_width", Integer),
+        Column("original_height", Integer),
+        Column("processing_ms", Float),
+        Column("processing_error", String(50)),
+        Column("processing_stats", JSON),
+    ])
+
+# Runner
+
+async def current_version(engine) -> int:
+    """Current schema version, 0 for a database that was never migrated.
+    Connection errors propagate rather than reading as version 0"""
+    async with engine.connect() as conn:
+        exists = await conn.run_sync(
+            lambda sync_conn: inspect(sync_conn).has_table(schema_version_table.name)
+        )
+        if not exists:
+            return 0
+        version = await conn.scalar(select(func.max(schema_version_table.c.version)))
+    return version or 0
+
+def pending_migrations(version: int, target: Optional[int] = None) -> List[Migration]:
+    target = latest_version() if target is None else target
+    return [m for m in MIGRATIONS if version < m.version <= target]
+
+async def _record(conn, m: Migration):
+    await conn.execute(
+        schema_version_table.insert().values(
+            version=m.version, name=m.name, applied_at=datetime.utcnow()
+        )
+    )
+
+async def _apply(conn, m: Migration):
+    logger.info(f"Applying migration {m.version}: {m.name}")
+    await m.upgrade(conn)
+    await _record(conn, m)
+
+@asynccontextmanager
+async def _postgres_migration_lock(engine):
+    """Session-level advisory lock on its own connection, held across the
+    several transactions (and autocommit steps) of an upgrade"""
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        params = {"key": MIGRATION_ADVISORY_LOCK_KEY}
+        # Polled rather than blocking, so a statement timeout cannot fire
+        # while another worker runs a long migration
+        while not await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), params):
+            await asyncio.sleep(MIGRATION_LOCK_POLL_SECONDS)
+        try:
+            yield
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), params)
+
+async def _upgrade_postgres(engine, target: Optional[int]) -> List[Migration]:
+    async with _postgres_migration_lock(engine):
+        async with engine.begin() as conn:
+            await conn.run_sync(version_metadata.create_all, checkfirst=True)
+        # Read under the lock: a worker that waited finds the work done
+        applied = []
+        for m in pending_migrations(await current_version(engine), target):
+            if m.transactional:
+                async with engine.begin() as conn:
+                    await _apply(conn, m)
+            else:
+                async with engine.connect() as conn:
+                    conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                    await _apply(conn, m)
+            applied.append(m)
+        return applied
+
+async def _upgrade_sqlite(engine, target: Optional[int]) -> List[Migration]:
+    # SQLite has no advisory locks and app_locks only exists from migration
+    # 4 on, so the whole upgrade runs in one transaction that holds the
+    # database write lock; other workers wait for it on busy_timeout, and
+    # try again when a long migration outlasts that. DDL is transactional
+    # in SQLite, so this also makes the upgrade all-or-nothing
+    while True:
+        try:
+            return await _upgrade_sqlite_locked(engine, target)
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            logger.info("Waiting for another worker to finish migrating")
+            await asyncio.sleep(MIGRATION_LOCK_POLL_SECONDS)
+
+async def _upgrade_sqlite_locked(engine, target: Optional[int]) -> List[Migration]:
+    async with engine.begin() as conn:
+        await conn.execute(CreateTable(schema_version_table, if_not_exists=True))
+        # A write that matches nothing still takes the write lock
+        await conn.execute(delete(schema_version_table).where(schema_version_table.c.version < 0))
+        version = await conn.scalar(select(func.max(schema_version_table.c.version))) or 0
+        applied = []
+        for m in pending_migrations(version, target):
+            await _apply(conn, m)
+            applied.append(m)
+        return applied
+
+async def upgrade(engine, target: Optional[int] = None) -> List[Migration]:
+    """Apply pending migrations; safe to run from several workers at once,
+    the first one migrates and the others wait and find nothing to do"""
+    if engine.dialect.name == "postgresql":
+        return await _upgrade_postgres(engine, target)
+    return await _upgrade_sqlite(engine, target)
+
+async def ensure_schema(engine, auto_migrate: bool):
+    """Startup check: a single version query, upgrading only when allowed"""
+    version = await current_version(engine)
+    latest = latest_version()
+    if version == latest:
+        return
+    if version > latest:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this code ({latest})"
+        )
+    if not auto_migrate:
+        raise RuntimeError(
+            f"Database schema is at version {version}, expected {latest}. "
+            "Run `python migrate.py upgrade` before starting the server"
+        )
+    await upgrade(engine)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, DateTime, Integer, JSON
+from sqlalchemy import Column, String, Text, DateTime, Integer, Float, JSON
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
@@ -15,7 +15,7 @@ class ServiceTable(Base):
     detailed_description = Column(Text, nullable=False)
     price = Column(String(100), nullable=False)
     images = Column(JSON, default=list)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class PortfolioTable(Base):
@@ -25,7 +25,7 @@ class PortfolioTable(Base):
     title = Column(String(255), nullable=False)
     image = Column(Text, nullable=False)
     category = Column(String(100), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class ContactsTable(Base):
@@ -47,7 +47,16 @@ class UploadedImagesTable(Base):
     original_filename = Column(String(255), nullable=False)
     url = Column(Text, nullable=False)
     size = Column(Integer, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    # Image pipeline results, empty for images uploaded before they were recorded
+    original_size = Column(Integer)
+    width = Column(Integer)
+    height = Column(Integer)
+    original_width = Column(Integer)
+    original_height = Column(Integer)
+    processing_ms = Column(Float)
+    processing_error = Column(String(50))
+    processing_stats = Column(JSON)
 
 # Pydantic Models for API (Request/Response)
 class ServiceBase(BaseModel):
@@ -125,6 +134,9 @@ class UploadedImage(BaseModel):
     original_filename: str
     url: str
     size: int
+    original_size: Optional[int] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
     createdAt: datetime
 
     class Config:
@@ -0,0 +1,226 @@
+from collections import Counter
+from typing import List, Optional
+from urllib.parse import parse_qs
+import asyncio
+import secrets
+import sys
+import threading
+import time
+
+from metrics import REGISTRY
+
+# On-demand sampling profiler for single live requests. An admin sends
+# `X-Profile: 1` (or `?profile=1`) together with `X-Admin-Token`, optionally
+# with a sample budget in `X-Profile-Samples` (or `?profile_samples=N`); the
+# request runs normally while a background thread samples it, and the response is
+# replaced by the profile in collapsed-stack format ("a;b;c 12" per line),
+# which flamegraph.pl, speedscope and inferno read directly
+
+# Worker threads of the event loop's default executor, which asyncio.to_thread
+# (image processing) runs on
+EXECUTOR_THREAD_PREFIX = "asyncio_"
+# Executor threads are told apart from their work by the file of the frames
+# (_worker, _WorkItem.run) rather than by those private names
+EXECUTOR_MODULE_SUFFIX = "concurrent/futures/thread.py"
+
+PROFILES = REGISTRY.counter(
+    "profiles_total", "On-demand request profiles by outcome", ("outcome",)
+)
+
+class SamplingProfiler:
+    """Samples one asyncio task on one thread at a fixed wall-clock interval.
+
+    While the task is running on the event loop the thread's Python stack is
+    recorded; while it is suspended its await chain is recorded instead,
+    under a `(suspended)` frame, so time spent waiting on the database or
+    other I/O is attributed to the coroutine that is waiting.
+
+    Busy default-executor threads are sampled as well, under a
+    `(thread asyncio_N)` frame, so work handed to asyncio.to_thread shows
+    up with its own stack. Those threads are shared: on a busy worker they
+    may be running another request's work.
+    """
+
+    def __init__(self, task: asyncio.Task, interval: float, max_samples: int, max_seconds: float):
+        self.task = task
+        self.loop = task.get_loop()
+        self.thread_id = threading.get_ident()
+        self.root_code = task.get_coro().cr_code
+        self.interval = interval
+        self.max_samples = max_samples
+        self.max_seconds = max_seconds
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval):
+            if self.samples >= self.max_samples or time.monotonic() > deadline:
+                break
+            self._sample()
+
+    def _sample(self):
+        frames = sys._current_frames()
+        if asyncio.current_task(self.loop) is self.task:
+            stack = self._running_stack(frames.get(self.thread_id))
+        else:
+            stack = ["(suspended)"] + self._await_chain()
+        if stack:
+            self.stacks[";".join(stack)] += 1
+            self.samples += 1
+        for thread in threading.enumerate():
+            if thread.name.startswith(EXECUTOR_THREAD_PREFIX):
+                work = _work_item_stack(frames.get(thread.ident))
+                if work:
+                    self.stacks[";".join([f"(thread {thread.name})"] + work)] += 1
+
+    def _running_stack(self, frame) -> List[str]:
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        frames.reverse()
+        # Drop the event loop and server frames below the task's coroutine
+        for index, candidate in enumerate(frames):
+            if candidate.f_code is self.root_code:
+                frames = frames[index:]
+                break
+        return [_frame_label(frame) for frame in frames]
+
+    def _await_chain(self) -> List[str]:
+        labels = []
+        awaitable = self.task.get_coro()
+        while awaitable is not None:
+            frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+            if frame is None:
+                labels.append(f"<{type(awaitable).__name__}>")
+                break
+            labels.append(_frame_label(frame))
+            awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+        return labels
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _work_item_stack(frame) -> List[str]:
+    """Stack of the function an executor thread is running, empty when idle"""
+    frames = []
+    while frame is not None:
+        if frame.f_code.co_filename.replace("\\", "/").endswith(EXECUTOR_MODULE_SUFFIX):
+            return [_frame_label(f) for f in reversed(frames)]
+        frames.append(frame)
+        frame = frame.f_back
+    return []
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename.rsplit("/", 1)[-1]
+    return f"{code.co_name} ({filename}:{frame.f_lineno})".replace(";", ":")
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware that profiles admin-flagged requests.
+
+    Only one request is profiled at a time and at most one per
+    `min_interval` seconds; others flagged meanwhile get 429 with
+    Retry-After, so profiling cannot pile up on a busy worker.
+    """
+
+    def __init__(self, app, admin_token: Optional[str], interval_ms: float = 5,
+                 max_samples: int = 2000, max_seconds: float = 30, min_interval: float = 10):
+        self.app = app
+        self.admin_token = admin_token
+        self.interval_ms = interval_ms
+        self.max_samples = max_samples
+        self.max_seconds = max_seconds
+        self.min_interval = min_interval
+        self._active = False
+        self._last_started = 0.0
+
+    def _sample_budget(self, scope) -> Optional[int]:
+        """Requested sample budget, or None when the request is not to be profiled"""
+        headers = dict(scope.get("headers", []))
+        query = parse_qs(scope.get("query_string", b"").decode())
+        flagged = headers.get(b"x-profile") == b"1" or query.get("profile") == ["1"]
+        if not flagged or not self.admin_token:
+            return None
+        token = headers.get(b"x-admin-token", b"").decode()
+        if not secrets.compare_digest(token, self.admin_token):
+            return None
+        requested = headers.get(b"x-profile-samples", b"").decode() or \
+            query.get("profile_samples", [""])[0]
+        try:
+            return max(1, min(int(requested), self.max_samples))
+        except ValueError:
+            return self.max_samples
+
+    async def __call__(self, scope, receive, send):
+        budget = self._sample_budget(scope) if scope["type"] == "http" else None
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+
+        wait = self._last_started + self.min_interval - time.monotonic()
+        if self._active or wait > 0:
+            PROFILES.labels(outcome="rate_limited").inc()
+            await _send_text(send, 429, "Profiler busy, retry later\n",
+                             [(b"retry-after", str(max(1, int(wait + 1))).encode())])
+            return
+
+        self._active = True
+        self._last_started = time.monotonic()
+        profiler = SamplingProfiler(
+            asyncio.current_task(),
+            interval=max(1.0, self.interval_ms) / 1000,
+            max_samples=budget,
+            max_seconds=self.max_seconds,
+        )
+        status_code = 500
+
+        async def discard_response(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, discard_response)
+        finally:
+            profiler.stop()
+            self._active = False
+        PROFILES.labels(outcome="captured").inc()
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        filename = f"profile-{int(time.time())}.folded"
+        await _send_text(send, 200, profiler.collapsed(), [
+            (b"content-disposition", f'attachment; filename="{filename}"'.encode()),
+            (b"x-profile-samples", str(profiler.samples).encode()),
+            (b"x-profile-duration-ms", f"{duration_ms:.1f}".encode()),
+            (b"x-profiled-status", str(status_code).encode()),
+        ])
+
+
+async def _send_text(send, status: int, body: str, headers):
+    payload = body.encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"text/plain; charset=utf-8"),
+            (b"content-length", str(len(payload)).encode()),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": payload})
@@ -0,0 +1,70 @@
+from sqlalchemy import Table, Column, MetaData, String, DateTime, select, exists, text, update
+from datetime import datetime
+from pathlib import Path
+import json
+import logging
+
+from models import ServiceTable, PortfolioTable, ContactsTable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIXTURE = Path(__file__).parent / "fixtures" / "default_data.json"
+
+# Fixture sections in the order they are seeded
+SEED_TABLES = {
+    "contacts": ContactsTable.__table__,
+    "services": ServiceTable.__table__,
+    "portfolio": PortfolioTable.__table__,
+}
+
+# Key of the PostgreSQL advisory lock held while seeding
+SEED_ADVISORY_LOCK_KEY = 7_310_457_201
+
+# Lock rows for databases without advisory locks (created by migration 4)
+lock_metadata = MetaData()
+
+app_locks_table = Table(
+    "app_locks",
+    lock_metadata,
+    Column("name", String(100), primary_key=True),
+    Column("acquired_at", DateTime),
+)
+
+SEED_LOCK_NAME = "seed_default_data"
+
+def load_fixture(path: Path = DEFAULT_FIXTURE) -> dict:
+    with open(path, encoding="utf-8") as fixture_file:
+        return json.load(fixture_file)
+
+async def _acquire_seed_lock(conn):
+    """Serialize seeding across workers until the surrounding transaction ends"""
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SEED_ADVISORY_LOCK_KEY})
+    else:
+        # Writing the lock row takes SQLite's write lock, which other
+        # workers wait on (busy_timeout) until this transaction commits
+        await conn.execute(
+            update(app_locks_table)
+            .where(app_locks_table.c.name == SEED_LOCK_NAME)
+            .values(acquired_at=datetime.utcnow())
+        )
+
+async def seed_default_data(engine, fixture: dict = None) -> dict:
+    """Insert fixture rows into every empty table, exactly once across workers.
+
+    Each table is checked with an EXISTS query, so the cost does not depend
+    on how much data is already there. Returns inserted row counts.
+    """
+    fixture = load_fixture() if fixture is None else fixture
+    inserted = {}
+    async with engine.begin() as conn:
+        await _acquire_seed_lock(conn)
+        for name, table in SEED_TABLES.items():
+            rows = fixture.get(name) or []
+            if not rows or await conn.scalar(select(exists().select_from(table))):
+                continue
+            await conn.execute(table.insert(), rows)
+            inserted[name] = len(rows)
+    if inserted:
+        logger.info(f"Seeded default data: {inserted}")
+    return inserted
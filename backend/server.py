@@ -1,21 +1,41 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Depends
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Depends, Header, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, text
+import asyncio
 import os
 import logging
 from pathlib import Path
-from typing import List
+from typing import Annotated, Callable, List, Literal, Optional
 from datetime import datetime
+import secrets
 import shutil
 import uuid
-from PIL import Image
 
 # Import database and models
-from database import engine, Base, get_db_session, async_session_maker
+from imaging import (
+    FORMAT_EXTENSIONS, create_variant, media_type_for, negotiate_variant, preferred_variant_format,
+    process_image, supported_variant_formats
+)
+from image_sniffing import ImageRejected, check_upload
+from admission import AdmissionMiddleware, Overloaded, configure_admission, limiter
+from database import (
+    choose_read_target, dispose_engines, get_database, get_db_session, get_read_session_factory,
+    pool_status, read_target_name, run_read
+)
+from instrumentation import RequestMetricsMiddleware, TimedRoute, timed
+from metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE
+from migrations import ensure_schema
+from profiling import ProfilingMiddleware
+from seeding import seed_default_data
+from settings import get_settings
+from singleflight import FlightTimeout, SingleFlight
+from streaming import stream_format, stream_listing
+from structured_logging import configure_logging, stop_logging
+from upload_storage import locate_upload, stored_files, upload_path
+from warmup import warmup_state, run_warmup, open_connections, warm_image_codecs
 from models import (
     # SQLAlchemy models
     ServiceTable, PortfolioTable, ContactsTable, UploadedImagesTable,
@@ -30,20 +50,21 @@ from models import (
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# Create uploads directory
+# Uploads directory, created by create_app()
 UPLOADS_DIR = ROOT_DIR / "uploads"
-UPLOADS_DIR.mkdir(exist_ok=True)
 
-# Create the main app without a prefix
-app = FastAPI()
+# Coalesces concurrent identical reads; write endpoints forget their group
+# after committing. Created by create_app()
+read_flights: Optional[SingleFlight] = None
+image_flights: Optional[SingleFlight] = None
 
-# Mount static files for uploaded images
-app.mount("/uploads", StaticFiles(directory=str(UPLOADS_DIR)), name="uploads")
+StreamFormat = Literal["json", "ndjson"]
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=TimedRoute)
 
 # Helper function to convert SQLAlchemy model to Pydantic model
+@timed("convert")
 def convert_service_to_pydantic(service_row) -> Service:
     return Service(
         id=str(service_row.id),
@@ -56,6 +77,7 @@ def convert_service_to_pydantic(service_row) -> Service:
         updatedAt=service_row.updated_at
     )
 
+@timed("convert")
 def convert_portfolio_to_pydantic(portfolio_row) -> Portfolio:
     return Portfolio(
         id=str(portfolio_row.id),
@@ -66,6 +88,7 @@ def convert_portfolio_to_pydantic(portfolio_row) -> Portfolio:
         updatedAt=portfolio_row.updated_at
     )
 
+@timed("convert")
 def convert_contacts_to_pydantic(contacts_row) -> Contacts:
     return Contacts(
         id=str(contacts_row.id),
@@ -77,6 +100,7 @@ def convert_contacts_to_pydantic(contacts_row) -> Contacts:
         updatedAt=contacts_row.updated_at
     )
 
+@timed("convert")
 def convert_uploaded_image_to_pydantic(image_row) -> UploadedImage:
     return UploadedImage(
         id=str(image_row.id),
@@ -84,174 +108,65 @@ def convert_uploaded_image_to_pydantic(image_row) -> UploadedImage:
         original_filename=image_row.original_filename,
         url=image_row.url,
         size=image_row.size,
+        original_size=image_row.original_size,
+        width=image_row.width,
+        height=image_row.height,
         createdAt=image_row.created_at
     )
 
-# Helper function to resize and optimize images
-async def process_image(file_path: Path, max_width: int = 1200, max_height: int = 800, quality: int = 85):
-    try:
-        with Image.open(file_path) as img:
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-            
-            # Calculate new dimensions while maintaining aspect ratio
-            ratio = min(max_width / img.width, max_height / img.height)
-            if ratio < 1:
-                new_width = int(img.width * ratio)
-                new_height = int(img.height * ratio)
-                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # Save optimized image
-            img.save(file_path, "JPEG", quality=quality, optimize=True)
-    except Exception as e:
-        logging.error(f"Error processing image {file_path}: {e}")
-
 # Initialize default data
 async def initialize_default_data():
-    async with engine.begin() as conn:
-        # Create all tables
-        await conn.run_sync(Base.metadata.create_all)
-    
-    # Add default data
-    async with async_session_maker() as session:
-        # Check if contacts exist, if not create default
-        result = await session.execute(select(ContactsTable))
-        existing_contacts = result.scalar_one_or_none()
-        
-        if not existing_contacts:
-            default_contacts = ContactsTable(
-                name="Княжий Терем",
-                tagline="Мастера чистовой отделки деревом",
-                phone="+7 (999) 123-45-67",
-                whatsapp="+79991234567",
-                email="info@knyazhiy-terem.ru"
-            )
-            session.add(default_contacts)
-            await session.commit()
-
-        # Check if services exist, if not create default
-        result = await session.execute(select(ServiceTable))
-        existing_services = result.scalars().all()
-        
-        if not existing_services:
-            default_services = [
-                ServiceTable(
-                    name="Баня из бруса",
-                    description="Строительство и отделка бань из качественного бруса. Полный цикл работ от фундамента до финишной отделки.",
-                    detailed_description="Мы используем только качественный брус из северных регионов России. Каждая баня строится с учетом индивидуальных пожеланий клиента. В стоимость входят все материалы, доставка и монтажные работы. Предоставляем гарантию на все виды работ сроком на 3 года. Дополнительно можем выполнить внутреннюю отделку, установку печи и системы водоснабжения.",
-                    price="от 500 000 ₽",
-                    images=[
-                        "https://images.unsplash.com/photo-1571502973714-8c2b0cc0b7ee?w=400&h=300&fit=crop",
-                        "https://images.unsplash.com/photo-1542078753-9b3ec0a9b6d5?w=400&h=300&fit=crop"
-                    ]
-                ),
-                ServiceTable(
-                    name="Беседка из дерева",
-                    description="Изготовление и установка деревянных беседок. Различные размеры и дизайн под ваши потребности.",
-                    detailed_description="Создаем уютные беседки для отдыха на природе. Работаем с различными породами дерева: сосна, лиственница, дуб. Предлагаем готовые проекты или разрабатываем индивидуальный дизайн. В комплект может входить мебель, освещение, декоративные элементы. Все конструкции обрабатываются защитными составами от влаги и насекомых.",
-                    price="от 150 000 ₽",
-                    images=[
-                        "https://images.unsplash.com/photo-1600585154526-990dced4db0d?w=400&h=300&fit=crop",
-                        "https://images.unsplash.com/photo-1600047509807-ba8f99d2cdde?w=400&h=300&fit=crop"
-                    ]
-                ),
-                ServiceTable(
-                    name="Отделка дома деревом",
-                    description="Внутренняя и внешняя отделка домов натуральным деревом. Работаем с различными породами дерева.",
-                    detailed_description="Выполняем комплексную отделку деревом любых помещений. Используем вагонку, имитацию бруса, блок-хаус, массивную доску. Предварительно составляем проект с расчетом материалов. Все работы выполняются аккуратно с соблюдением технологий. Дополнительно устанавливаем плинтуса, наличники, декоративные элементы.",
-                    price="от 2000 ₽/м²",
-                    images=[
-                        "https://images.unsplash.com/photo-1513594736757-3c44df5db6a9?w=400&h=300&fit=crop",
-                        "https://images.unsplash.com/photo-1600563438938-a9e2e2a35470?w=400&h=300&fit=crop"
-                    ]
-                ),
-                ServiceTable(
-                    name="Деревянная мебель",
-                    description="Изготовление мебели из дерева на заказ. Столы, стулья, шкафы, кровати и другая мебель.",
-                    detailed_description="Создаем эксклюзивную мебель из массива дерева по индивидуальным проектам. Работаем с дубом, ясенем, березой, сосной. Каждое изделие проходит многоступенчатую обработку и покрывается экологически чистыми материалами. Предоставляем эскизы и 3D-визуализацию перед началом работ. Доставка и сборка на объекте включены в стоимость.",
-                    price="от 30 000 ₽",
-                    images=[
-                        "https://images.unsplash.com/photo-1586023492125-27b2c045efd7?w=400&h=300&fit=crop",
-                        "https://images.unsplash.com/photo-1542744173-05336fcc7ad4?w=400&h=300&fit=crop"
-                    ]
-                )
-            ]
-            session.add_all(default_services)
-            await session.commit()
-
-        # Check if portfolio exists, if not create default
-        result = await session.execute(select(PortfolioTable))
-        existing_portfolio = result.scalars().all()
-        
-        if not existing_portfolio:
-            default_portfolio = [
-                PortfolioTable(
-                    title="Русская баня",
-                    image="https://images.unsplash.com/photo-1571502973714-8c2b0cc0b7ee?w=600&h=400&fit=crop",
-                    category="Бани"
-                ),
-                PortfolioTable(
-                    title="Садовая беседка",
-                    image="https://images.unsplash.com/photo-1600585154526-990dced4db0d?w=600&h=400&fit=crop",
-                    category="Беседки"
-                ),
-                PortfolioTable(
-                    title="Деревянная отделка",
-                    image="https://images.unsplash.com/photo-1513594736757-3c44df5db6a9?w=600&h=400&fit=crop",
-                    category="Отделка"
-                ),
-                PortfolioTable(
-                    title="Кухонный гарнитур",
-                    image="https://images.unsplash.com/photo-1586023492125-27b2c045efd7?w=600&h=400&fit=crop",
-                    category="Мебель"
-                ),
-                PortfolioTable(
-                    title="Терраса",
-                    image="https://images.unsplash.com/photo-1600047509807-ba8f99d2cdde?w=600&h=400&fit=crop",
-                    category="Террасы"
-                ),
-                PortfolioTable(
-                    title="Деревянный стол",
-                    image="https://images.unsplash.com/photo-1542744173-05336fcc7ad4?w=600&h=400&fit=crop",
-                    category="Мебель"
-                )
-            ]
-            session.add_all(default_portfolio)
-            await session.commit()
+    # Bring the schema up to date (or just verify its version)
+    engine = get_database().engine
+    await ensure_schema(engine, get_settings().db_auto_migrate)
+    # Seed empty tables from fixtures/default_data.json, once across workers
+    await seed_default_data(engine)
 
 # Image Upload Endpoints
 @api_router.post("/upload-image", response_model=ImageUploadResponse)
 async def upload_image(file: UploadFile = File(...), session: AsyncSession = Depends(get_db_session)):
-    # Validate file type
-    if not file.content_type.startswith("image/"):
-        return ImageUploadResponse(
-            success=False,
-            message="Файл должен быть изображением"
-        )
-    
+    settings = get_settings()
+
     # Validate file size (5MB max)
     if file.size > 5 * 1024 * 1024:
         return ImageUploadResponse(
             success=False,
             message="Размер файла не должен превышать 5MB"
         )
+
+    # Validate file type and declared dimensions from the header bytes,
+    # regardless of the client's content type, before writing or decoding
+    try:
+        sniffed = check_upload(
+            file.file,
+            settings.image_allowed_formats,
+            settings.image_max_pixels,
+            settings.image_max_dimension
+        )
+    except ImageRejected as e:
+        return ImageUploadResponse(success=False, message=str(e))
     
     try:
-        # Generate unique filename
-        file_extension = file.filename.split(".")[-1].lower()
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = UPLOADS_DIR / unique_filename
+        # Generate unique filename; the extension follows the sniffed format,
+        # not the client's file name
+        file_path = upload_path(UPLOADS_DIR, f"{uuid.uuid4()}{FORMAT_EXTENSIONS[sniffed.format]}")
         
         # Save file
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
-        # Process image (resize and optimize)
-        await process_image(file_path)
+        # Process image (resize, optimize); the stored file may get a
+        # different extension than the upload
+        # CPU-bound, so capped by the processing limiter; a full queue
+        # raises Overloaded, which AdmissionMiddleware turns into a 503
+        async with limiter("processing").slot():
+            stats = await process_image(
+                file_path, fast_decode=settings.image_fast_decode, formats=[sniffed.format]
+            )
+        unique_filename = stats.output_path.name
         
         # Get file size after processing
-        file_size = file_path.stat().st_size
+        file_size = stats.output_path.stat().st_size
         
         # Create image record
         base_url = os.environ.get('REACT_APP_BACKEND_URL', 'http://localhost:8001')
@@ -261,12 +176,24 @@ async def upload_image(file: UploadFile = File(...), session: AsyncSession = Dep
             filename=unique_filename,
             original_filename=file.filename,
             url=image_url,
-            size=file_size
+            size=file_size,
+            original_size=stats.input_bytes,
+            width=stats.output_width or None,
+            height=stats.output_height or None,
+            original_width=stats.input_width or None,
+            original_height=stats.input_height or None,
+            processing_ms=round(stats.total_seconds * 1000, 3),
+            processing_error=stats.error,
+            processing_stats=stats.as_dict()
         )
         
         # Save to database
         session.add(image_record)
         await session.commit()
+        read_flights.forget("uploaded_images")
+        # GIFs may be animated; siblings would keep only the first frame
+        if stats.error is None and stats.input_format != "GIF":
+            start_sibling_encodes(stats.output_path, settings)
         
         return ImageUploadResponse(
             success=True,
@@ -274,6 +201,9 @@ async def upload_image(file: UploadFile = File(...), session: AsyncSession = Dep
             image=convert_uploaded_image_to_pydantic(image_record)
         )
         
+    except Overloaded:
+        file_path.unlink(missing_ok=True)
+        raise
     except Exception as e:
         logging.error(f"Error uploading image: {e}")
         return ImageUploadResponse(
@@ -281,36 +211,129 @@ async def upload_image(file: UploadFile = File(...), session: AsyncSession = Dep
             message=f"Ошибка загрузки: {str(e)}"
         )
 
-@api_router.get("/uploaded-images", response_model=List[UploadedImage])
-async def get_uploaded_images(session: AsyncSession = Depends(get_db_session)):
+async def coalesced_read(request: Request, name: str, query: Callable):
+    """`query(session)`, shared by concurrent identical reads (see singleflight.py).
+
+    The flight opens its own session on the request's read target, so it
+    stays valid when the request that started it goes away.
+
+    The query runs in the flight task, not in the request's own: its
+    database timings count towards the leader's request only, and the
+    request profiler (profiling.py), which samples the request's task,
+    shows every caller, joiners included, suspended on the shared Future
+    rather than inside the query.
+    """
+    choice = choose_read_target(request)
+    return await read_flights.do((name, read_target_name(choice)), lambda: run_read(choice, query))
+
+async def load_uploaded_images(session: AsyncSession) -> List[UploadedImage]:
     result = await session.execute(
         select(UploadedImagesTable).order_by(UploadedImagesTable.created_at.desc())
     )
-    images = result.scalars().all()
-    return [convert_uploaded_image_to_pydantic(image) for image in images]
+    return [convert_uploaded_image_to_pydantic(image) for image in result.scalars().all()]
+
+@api_router.get("/uploaded-images", response_model=List[UploadedImage])
+async def get_uploaded_images(
+    request: Request,
+    open_session: Callable = Depends(get_read_session_factory),
+    stream: Annotated[Optional[StreamFormat], Query()] = None,
+    accept: Annotated[Optional[str], Header()] = None,
+):
+    # ?stream=json|ndjson (or Accept: application/x-ndjson) streams rows
+    # as they are read, for full exports and admin views of large tables
+    fmt = stream_format(stream, accept)
+    if fmt:
+        statement = select(UploadedImagesTable).order_by(UploadedImagesTable.created_at.desc())
+        return stream_listing(
+            "uploaded_images", open_session, statement, convert_uploaded_image_to_pydantic, fmt,
+            get_settings().stream_batch_size
+        )
+
+    return await coalesced_read(request, "uploaded_images", load_uploaded_images)
+
+async def encode_sibling(file_path: Path, variant_format: str, background: bool = False) -> Path:
+    """Encode one sibling of a stored image in a processing slot; concurrent
+    callers for the same sibling share one encode. Raises Overloaded when
+    no slot is free; in the background, also when requests are queued"""
+    variant_path = file_path.with_suffix(FORMAT_EXTENSIONS[variant_format])
+    processing = limiter("processing")
+
+    async def encode():
+        async with processing.try_slot() if background else processing.slot():
+            return await create_variant(file_path, variant_format)
+    return await image_flights.do(("variant", str(variant_path)), encode)
+
+# Sibling encodes running after their upload was answered
+_sibling_tasks = set()
+
+async def encode_siblings(file_path: Path, formats: List[str]):
+    for variant_format in formats:
+        try:
+            await encode_sibling(file_path, variant_format, background=True)
+        except Overloaded:
+            # Left to ensure_variant on the first request that wants it
+            return
+        except Exception as e:
+            logging.warning(f"Could not encode {variant_format} sibling of {file_path.name}: {e}")
+
+def start_sibling_encodes(file_path: Path, settings):
+    """Encode the WebP/AVIF siblings of a new upload in the background.
+
+    Encoding them inline roughly halved upload throughput. They only use
+    processing slots no upload is waiting for; until they exist the
+    primary is served.
+    """
+    formats = supported_variant_formats(settings.image_variant_formats)
+    if formats:
+        task = asyncio.create_task(encode_siblings(file_path, formats))
+        _sibling_tasks.add(task)
+        task.add_done_callback(_sibling_tasks.discard)
+
+async def ensure_variant(file_path: Path, accept: str, settings):
+    """Encode the sibling the client would prefer when it is missing.
+
+    Concurrent requests for the same image share one encode, which takes a
+    processing slot; when none is free the primary is served this time.
+    """
+    variant_format = preferred_variant_format(accept, supported_variant_formats(settings.image_variant_formats))
+    # GIFs may be animated; siblings would keep only the first frame
+    if variant_format is None or media_type_for(file_path) not in ("image/jpeg", "image/png"):
+        return
+    if file_path.with_suffix(FORMAT_EXTENSIONS[variant_format]).exists():
+        return
+    try:
+        await encode_sibling(file_path, variant_format)
+    except (Overloaded, FlightTimeout):
+        pass
+    except Exception as e:
+        logging.warning(f"Could not encode {variant_format} sibling of {file_path.name}: {e}")
 
 @api_router.get("/uploads/{filename}")
-async def serve_uploaded_image(filename: str):
-    """Serve uploaded images through API endpoint"""
-    file_path = UPLOADS_DIR / filename
+async def serve_uploaded_image(filename: str, request: Request):
+    """Serve uploaded images through API endpoint.
+
+    Clients whose Accept header lists image/avif or image/webp get the
+    smaller sibling of the stored image when one exists.
+    """
+    # Sharded layout, or the flat one for files not migrated yet
+    file_path = locate_upload(UPLOADS_DIR, filename)
     
-    if not file_path.exists():
+    if file_path is None:
         raise HTTPException(status_code=404, detail="Изображение не найдено")
     
-    # Determine media type based on file extension
-    file_extension = filename.lower().split('.')[-1]
-    media_type_map = {
-        'jpg': 'image/jpeg',
-        'jpeg': 'image/jpeg', 
-        'png': 'image/png',
-        'gif': 'image/gif',
-        'webp': 'image/webp',
-        'bmp': 'image/bmp',
-        'svg': 'image/svg+xml'
-    }
-    media_type = media_type_map.get(file_extension, 'application/octet-stream')
+    accept = request.headers.get("accept", "")
+    settings = get_settings()
+    if settings.image_variants_on_demand:
+        await ensure_variant(file_path, accept, settings)
+    served_path = negotiate_variant(file_path, accept)
+    # Stored files are named after their sniffed format. Files still in the
+    # flat layout may be uploads from before then, JPEG bytes under .png
+    # for example, so their magic bytes are read
+    media_type = media_type_for(served_path, sniff=served_path.parent == UPLOADS_DIR)
     
-    return FileResponse(file_path, media_type=media_type, filename=filename)
+    return FileResponse(
+        served_path, media_type=media_type, filename=served_path.name, headers={"Vary": "Accept"}
+    )
 
 @api_router.delete("/uploaded-images/{image_id}")
 async def delete_uploaded_image(image_id: str, session: AsyncSession = Depends(get_db_session)):
@@ -325,15 +348,16 @@ async def delete_uploaded_image(image_id: str, session: AsyncSession = Depends(g
             raise HTTPException(status_code=404, detail="Изображение не найдено")
         
         # Delete file from filesystem
-        file_path = UPLOADS_DIR / image_record.filename
-        if file_path.exists():
-            file_path.unlink()
+        # With its WebP/AVIF siblings, in whichever layout they are
+        for path in stored_files(UPLOADS_DIR, image_record.filename, FORMAT_EXTENSIONS.values()):
+            path.unlink(missing_ok=True)
         
         # Delete from database
         await session.execute(
             delete(UploadedImagesTable).where(UploadedImagesTable.id == image_id)
         )
         await session.commit()
+        read_flights.forget("uploaded_images")
         
         return {"message": "Изображение удалено успешно"}
         
@@ -342,11 +366,13 @@ async def delete_uploaded_image(image_id: str, session: AsyncSession = Depends(g
         raise HTTPException(status_code=500, detail=f"Ошибка удаления: {str(e)}")
 
 # Services Endpoints
-@api_router.get("/services", response_model=List[Service])
-async def get_services(session: AsyncSession = Depends(get_db_session)):
+async def load_services(session: AsyncSession) -> List[Service]:
     result = await session.execute(select(ServiceTable))
-    services = result.scalars().all()
-    return [convert_service_to_pydantic(service) for service in services]
+    return [convert_service_to_pydantic(service) for service in result.scalars().all()]
+
+@api_router.get("/services", response_model=List[Service])
+async def get_services(request: Request):
+    return await coalesced_read(request, "services", load_services)
 
 @api_router.post("/services", response_model=Service)
 async def create_service(service: ServiceCreate, session: AsyncSession = Depends(get_db_session)):
@@ -359,6 +385,7 @@ async def create_service(service: ServiceCreate, session: AsyncSession = Depends
     )
     session.add(service_record)
     await session.commit()
+    read_flights.forget("services")
     await session.refresh(service_record)
     return convert_service_to_pydantic(service_record)
 
@@ -385,6 +412,8 @@ async def update_service(service_id: str, service: ServiceUpdate, session: Async
         
         await session.commit()
         
+        read_flights.forget("services")
+        
         # Fetch updated service
         result = await session.execute(
             select(ServiceTable).where(ServiceTable.id == service_id)
@@ -406,6 +435,8 @@ async def delete_service(service_id: str, session: AsyncSession = Depends(get_db
             raise HTTPException(status_code=404, detail="Service not found")
         
         await session.commit()
+        
+        read_flights.forget("services")
         return {"message": "Service deleted successfully"}
     
     except Exception as e:
@@ -413,11 +444,25 @@ async def delete_service(service_id: str, session: AsyncSession = Depends(get_db
         raise HTTPException(status_code=500, detail=f"Error deleting service: {str(e)}")
 
 # Portfolio Endpoints
-@api_router.get("/portfolio", response_model=List[Portfolio])
-async def get_portfolio(session: AsyncSession = Depends(get_db_session)):
+async def load_portfolio(session: AsyncSession) -> List[Portfolio]:
     result = await session.execute(select(PortfolioTable))
-    portfolio = result.scalars().all()
-    return [convert_portfolio_to_pydantic(item) for item in portfolio]
+    return [convert_portfolio_to_pydantic(item) for item in result.scalars().all()]
+
+@api_router.get("/portfolio", response_model=List[Portfolio])
+async def get_portfolio(
+    request: Request,
+    open_session: Callable = Depends(get_read_session_factory),
+    stream: Annotated[Optional[StreamFormat], Query()] = None,
+    accept: Annotated[Optional[str], Header()] = None,
+):
+    fmt = stream_format(stream, accept)
+    if fmt:
+        return stream_listing(
+            "portfolio", open_session, select(PortfolioTable), convert_portfolio_to_pydantic, fmt,
+            get_settings().stream_batch_size
+        )
+
+    return await coalesced_read(request, "portfolio", load_portfolio)
 
 @api_router.post("/portfolio", response_model=Portfolio)
 async def create_portfolio(portfolio_item: PortfolioCreate, session: AsyncSession = Depends(get_db_session)):
@@ -428,6 +473,7 @@ async def create_portfolio(portfolio_item: PortfolioCreate, session: AsyncSessio
     )
     session.add(portfolio_record)
     await session.commit()
+    read_flights.forget("portfolio")
     await session.refresh(portfolio_record)
     return convert_portfolio_to_pydantic(portfolio_record)
 
@@ -452,6 +498,8 @@ async def update_portfolio(portfolio_id: str, portfolio_item: PortfolioUpdate, s
         
         await session.commit()
         
+        read_flights.forget("portfolio")
+        
         # Fetch updated portfolio
         result = await session.execute(
             select(PortfolioTable).where(PortfolioTable.id == portfolio_id)
@@ -473,6 +521,8 @@ async def delete_portfolio(portfolio_id: str, session: AsyncSession = Depends(ge
             raise HTTPException(status_code=404, detail="Portfolio item not found")
         
         await session.commit()
+        
+        read_flights.forget("portfolio")
         return {"message": "Portfolio item deleted successfully"}
     
     except Exception as e:
@@ -480,16 +530,19 @@ async def delete_portfolio(portfolio_id: str, session: AsyncSession = Depends(ge
         raise HTTPException(status_code=500, detail=f"Error deleting portfolio: {str(e)}")
 
 # Contacts Endpoints
-@api_router.get("/contacts", response_model=Contacts)
-async def get_contacts(session: AsyncSession = Depends(get_db_session)):
+async def load_contacts(session: AsyncSession) -> Contacts:
     result = await session.execute(select(ContactsTable))
     contacts = result.scalar_one_or_none()
-    
+
     if not contacts:
         raise HTTPException(status_code=404, detail="Contacts not found")
-    
+
     return convert_contacts_to_pydantic(contacts)
 
+@api_router.get("/contacts", response_model=Contacts)
+async def get_contacts(request: Request):
+    return await coalesced_read(request, "contacts", load_contacts)
+
 @api_router.put("/contacts", response_model=Contacts)
 async def update_contacts(contacts: ContactsUpdate, session: AsyncSession = Depends(get_db_session)):
     # Update contacts (assuming there's only one record)
@@ -511,6 +564,8 @@ async def update_contacts(contacts: ContactsUpdate, session: AsyncSession = Depe
     
     await session.commit()
     
+    read_flights.forget("contacts")
+    
     # Fetch updated contacts
     result = await session.execute(select(ContactsTable))
     updated_contacts = result.scalar_one()
@@ -525,34 +580,174 @@ async def admin_login(admin: AdminLogin):
     else:
         return AdminResponse(success=False, message="Invalid credentials")
 
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    admin_token = get_settings().admin_token
+    if not admin_token or not secrets.compare_digest(x_admin_token or "", admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@api_router.get("/admin/diagnostics", dependencies=[Depends(require_admin)])
+async def admin_diagnostics():
+    replicas = get_database().replicas
+    return {
+        "settings": get_settings().public_dict(),
+        "pool": pool_status(),
+        "replicas": {
+            name: index in replicas.healthy for index, name in enumerate(replicas.names)
+        }
+    }
+
 # Basic endpoints
 @api_router.get("/")
 async def root():
     return {"message": "Княжий Терем API (PostgreSQL)"}
 
-# Include the router in the main app
-app.include_router(api_router)
+# Probes: /healthz answers while the process is alive, /readyz only once
+# warm-up has finished and the database answers
+probe_router = APIRouter()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+@probe_router.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"status": "ok"}
+
+async def ping_database():
+    async with get_database().read_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+@probe_router.get("/readyz", include_in_schema=False)
+async def readyz():
+    database_ok = True
+    try:
+        await asyncio.wait_for(ping_database(), timeout=1.0)
+    except Exception:
+        database_ok = False
+    ready = warmup_state.ready and database_ok
+    return JSONResponse(
+        {
+            "status": "ready" if ready else "not_ready",
+            "database": database_ok,
+            "warmup": warmup_state.as_dict(),
+            "pool": pool_status(),
+        },
+        status_code=200 if ready else 503
+    )
+
+async def warm_up():
+    settings = get_settings()
+    database = get_database()
+
+    async def pools():
+        for pool_engine in [database.engine, database.reader_engine, *database.replicas.engines]:
+            if pool_engine is not None:
+                await open_connections(pool_engine, settings.warmup_connections)
+
+    async def hot_queries():
+        # Run each public read once so statements are compiled and cached
+        async with database.read_session_maker() as session:
+            await load_services(session)
+            await load_portfolio(session)
+            await load_uploaded_images(session)
+            try:
+                await load_contacts(session)
+            except HTTPException:
+                pass
+
+    async def image_codecs():
+        await asyncio.to_thread(warm_image_codecs)
+
+    await run_warmup(
+        {"pools": pools, "queries": hot_queries, "image_codecs": image_codecs},
+        attempts=settings.warmup_attempts, backoff=settings.warmup_retry_backoff_seconds
+    )
+
+@probe_router.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return Response(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-@app.on_event("startup")
+_warmup_task = None
+
 async def startup_event():
+    global _warmup_task
     await initialize_default_data()
     logger.info("Database initialized and default data created")
+    get_database().replicas.start()
+    _warmup_task = asyncio.create_task(warm_up())
 
-@app.on_event("shutdown")
 async def shutdown_db_client():
-    await engine.dispose()
\ No newline at end of file
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+        # Let it unwind before the engines it may be using are disposed
+        try:
+            await _warmup_task
+        except asyncio.CancelledError:
+            pass
+    for task in list(_sibling_tasks):
+        task.cancel()
+    await asyncio.gather(*_sibling_tasks, return_exceptions=True)
+    await dispose_engines()
+    stop_logging()
+
+def create_app() -> FastAPI:
+    """Application factory; database engines are only created at startup"""
+    global read_flights, image_flights
+    # Configure logging: records are written by a background thread
+    configure_logging(get_settings())
+
+    read_flights = SingleFlight("reads", get_settings().singleflight_timeout_seconds)
+    image_flights = SingleFlight("images", get_settings().singleflight_timeout_seconds)
+
+    # Create uploads directory
+    UPLOADS_DIR.mkdir(exist_ok=True)
+
+    # Create the main app without a prefix
+    app = FastAPI()
+
+    # Legacy /uploads/<name> URLs resolve through the same lookup as the API
+    # route, since files no longer sit directly in UPLOADS_DIR
+    app.add_api_route("/uploads/{filename}", serve_uploaded_image, methods=["GET"], include_in_schema=False)
+
+    @app.exception_handler(FlightTimeout)
+    async def flight_timeout_handler(request, exc):
+        return JSONResponse(status_code=504, content={"detail": "Превышено время ожидания ответа"})
+
+    # Include the routers in the main app
+    app.include_router(api_router)
+    app.include_router(probe_router)
+
+    # Innermost, so 503s still get CORS headers and request metrics
+    configure_admission(get_settings())
+    app.add_middleware(AdmissionMiddleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(
+        RequestMetricsMiddleware,
+        server_timing=get_settings().server_timing,
+        slow_request_ms=get_settings().slow_request_ms
+    )
+    app.add_middleware(
+        ProfilingMiddleware,
+        admin_token=get_settings().admin_token,
+        interval_ms=get_settings().profile_interval_ms,
+        max_samples=get_settings().profile_max_samples,
+        max_seconds=get_settings().profile_max_seconds,
+        min_interval=get_settings().profile_min_interval_seconds
+    )
+
+    app.add_event_handler("startup", startup_event)
+    app.add_event_handler("shutdown", shutdown_db_client)
+    return app
+
+# `uvicorn server:app` keeps working: the app is built on first access.
+# `uvicorn --factory server:create_app` builds it explicitly
+def __getattr__(name):
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
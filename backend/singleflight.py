@@ -0,0 +1,80 @@
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+import asyncio
+
+from metrics import REGISTRY
+
+# Request coalescing. Concurrent calls with the same key share one in-flight
+# computation: the first caller (the leader) starts it as a task and later
+# callers await the same task, so a burst of identical reads after a deploy
+# or an edit reaches the database once. Results and exceptions are delivered
+# to every caller. Nothing is kept once the task finishes; this is not a
+# cache
+
+SINGLEFLIGHT_CALLS = REGISTRY.counter(
+    "singleflight_calls_total", "Coalesced calls by group and role (leader or shared)", ("group", "role")
+)
+SINGLEFLIGHT_TIMEOUTS = REGISTRY.counter(
+    "singleflight_timeouts_total", "Callers that stopped waiting for an in-flight computation", ("group",)
+)
+SINGLEFLIGHT_IN_FLIGHT = REGISTRY.gauge(
+    "singleflight_in_flight", "Computations currently shared", ("group",)
+)
+
+T = TypeVar("T")
+
+class FlightTimeout(TimeoutError):
+    pass
+
+class SingleFlight:
+    """Named group of coalesced computations with a per-caller timeout"""
+
+    def __init__(self, name: str, timeout: float):
+        self.name = name
+        self.timeout = timeout
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+        SINGLEFLIGHT_IN_FLIGHT.set_function(lambda: len(self._flights), group=name)
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[T]]) -> T:
+        """Result of `function()`, shared with concurrent callers of `key`.
+
+        Callers that join a computation another caller started wait at most
+        `timeout` seconds and then get FlightTimeout; the computation itself
+        keeps running for the others. `function` must not depend on
+        resources owned by the calling request, which may be gone before
+        it finishes.
+        """
+        task = self._flights.get(key)
+        if task is None:
+            SINGLEFLIGHT_CALLS.labels(group=self.name, role="leader").inc()
+            # The task runs in a copy of the leader's context, so its queries
+            # and timings are attributed to the leader's request
+            task = asyncio.ensure_future(function())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            # The leader waits as long as the work takes, as it would have
+            # without coalescing. Shielded: the leader disconnecting must not
+            # cancel the computation the others are waiting for
+            return await asyncio.shield(task)
+        SINGLEFLIGHT_CALLS.labels(group=self.name, role="shared").inc()
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            SINGLEFLIGHT_TIMEOUTS.labels(group=self.name).inc()
+            raise FlightTimeout(f"{self.name} {key!r} did not finish within {self.timeout} s")
+
+    def forget(self, prefix) -> None:
+        """Stop handing out in-flight results for keys starting with `prefix`.
+
+        Called after writes: callers arriving later start a fresh
+        computation instead of joining one that may have read the old data.
+        Callers already waiting still get the old result.
+        """
+        for key in [key for key in self._flights if key == prefix or (isinstance(key, tuple) and key[0] == prefix)]:
+            del self._flights[key]
+
+    def _finish(self, key, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # Mark the exception as retrieved when every caller has timed out
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,66 @@
+from typing import Callable, Optional
+import logging
+
+from fastapi.responses import StreamingResponse
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Streaming listings. Rows are read through session.stream() (a server-side
+# cursor on PostgreSQL, inside the read-only transaction the session factory
+# opens) in batches of `batch_size` and written out as they arrive, as one
+# JSON array or as NDJSON, so memory stays flat and the first byte goes out
+# before the last row is read. Errors after the headers are sent can no
+# longer change the status code: they are logged and re-raised, so the server
+# aborts the response without its final chunk and clients see a failed
+# transfer rather than a complete-looking 200
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+STREAMED_ROWS = REGISTRY.counter(
+    "streamed_rows_total", "Rows written by streaming listings", ("listing",)
+)
+STREAM_ERRORS = REGISTRY.counter(
+    "stream_errors_total", "Streaming listings cut short by an error", ("listing",)
+)
+
+def stream_format(stream: Optional[str], accept: Optional[str]) -> Optional[str]:
+    """"json" or "ndjson" when the client asked for a streamed listing,
+    with ?stream=json|ndjson or an Accept header naming NDJSON"""
+    if stream:
+        return stream
+    if accept and NDJSON_MEDIA_TYPE in accept:
+        return "ndjson"
+    return None
+
+def stream_listing(listing: str, open_session: Callable, statement, convert: Callable,
+                   fmt: str, batch_size: int) -> StreamingResponse:
+    """Response streaming `statement`'s rows, each converted with `convert`
+    to a Pydantic model"""
+    ndjson = fmt == "ndjson"
+
+    async def body():
+        rows = 0
+        try:
+            async with open_session() as session:
+                result = await session.stream(statement.execution_options(yield_per=batch_size))
+                if not ndjson:
+                    yield b"["
+                async for partition in result.scalars().partitions():
+                    items = [convert(row).model_dump_json().encode() for row in partition]
+                    if ndjson:
+                        yield b"\n".join(items) + b"\n"
+                    else:
+                        yield (b"," if rows else b"") + b",".join(items)
+                    rows += len(items)
+                    STREAMED_ROWS.labels(listing=listing).inc(len(items))
+                if not ndjson:
+                    yield b"]"
+        except Exception:
+            STREAM_ERRORS.labels(listing=listing).inc()
+            logger.exception(f"Streaming {listing} failed after {rows} rows")
+            raise
+
+    media_type = NDJSON_MEDIA_TYPE if ndjson else "application/json"
+    return StreamingResponse(body(), media_type=media_type)
@@ -0,0 +1,164 @@
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+import json
+import logging
+import queue
+import random
+import sys
+
+from instrumentation import current_request_stats
+from metrics import REGISTRY
+
+# Non-blocking logging. Application threads and the event loop only put
+# records on a bounded queue; a QueueListener thread formats and writes them.
+# When the queue is full records are dropped and counted instead of blocking
+
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "log_records_dropped_total", "Log records dropped because the log queue was full", ("logger",)
+)
+LOG_RECORDS_SAMPLED_OUT = REGISTRY.counter(
+    "log_records_sampled_out_total", "Log records skipped by per-logger sampling", ("logger",)
+)
+LOG_QUEUE_DEPTH = REGISTRY.gauge("log_queue_depth", "Log records waiting to be written")
+
+# Loggers that uvicorn gives their own synchronous stderr handlers, with
+# propagation off; they are routed through the root queue handler instead
+SERVER_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of records below WARNING for the configured loggers.
+
+    `rates` maps logger name prefixes to the share of records kept, e.g.
+    {"sqlalchemy.engine": 0.1}; the longest matching prefix wins.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                if random.random() < rate:
+                    return True
+                LOG_RECORDS_SAMPLED_OUT.labels(logger=prefix).inc()
+                return False
+        return True
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller and tags records with the request id"""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels(logger=record.name).inc()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve everything that depends on the calling thread or context
+        # here; the listener thread only sees the prepared copy
+        stats = current_request_stats.get()
+        record = logging.makeLogRecord(vars(record))
+        if getattr(record, "request_id", None) is None:
+            record.request_id = stats.request_id if stats is not None else None
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed via `extra` are included as-is"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        request_id = getattr(record, "request_id", None)
+        return f"{line} [request_id={request_id}]" if request_id else line
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+def configure_logging(settings) -> QueueListener:
+    """Route all logging through a bounded queue drained by a background thread"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+
+    log_queue = queue.Queue(maxsize=settings.log_queue_size)
+    LOG_QUEUE_DEPTH.set_function(log_queue.qsize)
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter() if settings.log_format == "json" else TextFormatter())
+
+    queue_handler = BoundedQueueHandler(log_queue)
+    if settings.log_sample_rates:
+        queue_handler.addFilter(SamplingFilter(settings.log_sample_rates))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(settings.log_level)
+    _queue_handler = queue_handler
+
+    # uvicorn configures its loggers before the app is imported, so this
+    # runs after it; access logs then go through the queue and sampling
+    for name in SERVER_LOGGERS:
+        server_logger = logging.getLogger(name)
+        for handler in list(server_logger.handlers):
+            server_logger.removeHandler(handler)
+        server_logger.propagate = True
+
+    # SQL echo goes through the same queue instead of SQLAlchemy's own
+    # synchronous stdout handler
+    if settings.db_echo:
+        logging.getLogger("sqlalchemy.engine.Engine").setLevel(logging.INFO)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+def stop_logging():
+    """Flush queued records and stop the listener thread.
+
+    Records logged afterwards (uvicorn's last shutdown lines) are written
+    directly by the listener's handlers.
+    """
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    root = logging.getLogger()
+    root.removeHandler(_queue_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        root.addHandler(handler)
+    _listener = None
+    _queue_handler = None
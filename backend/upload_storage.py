@@ -0,0 +1,82 @@
+import filecmp
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from typing import List, Optional
+
+from metrics import REGISTRY
+
+# Uploads are stored in a two-level hash-prefix layout, uploads/ab/cd/<name>,
+# so that no directory holds more than a handful of the hundreds of
+# thousands of files. The prefix is hashed from the file stem, which keeps
+# an image and its WebP/AVIF siblings in one directory. URLs and database
+# rows keep the bare file name; files that migrate_uploads.py has not moved
+# yet are still found at the top level.
+
+UPLOADS_FLAT_LOOKUPS = REGISTRY.counter(
+    "uploads_flat_lookups_total", "Uploads found in the legacy flat layout instead of their shard"
+)
+
+def valid_upload_name(filename: str) -> bool:
+    """A bare file name that cannot escape the uploads directory"""
+    return bool(filename) and not filename.startswith(".") and Path(filename).name == filename
+
+def shard_path(root: Path, filename: str) -> Path:
+    digest = hashlib.sha1(Path(filename).stem.encode()).hexdigest()
+    return root / digest[:2] / digest[2:4] / filename
+
+def upload_path(root: Path, filename: str) -> Path:
+    """Where a new upload is written; the shard directory is created"""
+    path = shard_path(root, filename)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+def locate_upload(root: Path, filename: str) -> Optional[Path]:
+    """The stored file for a URL file name, in its shard or the flat layout"""
+    if not valid_upload_name(filename):
+        return None
+    path = shard_path(root, filename)
+    if path.is_file():
+        return path
+    path = root / filename
+    if path.is_file():
+        UPLOADS_FLAT_LOOKUPS.inc()
+        return path
+    return None
+
+def stored_files(root: Path, filename: str, extensions) -> List[Path]:
+    """Every stored copy of a file and its siblings (same stem, given
+    extensions) in either layout, as a migration may be half done"""
+    if not valid_upload_name(filename):
+        return []
+    paths = []
+    for directory in (shard_path(root, filename).parent, root):
+        primary = directory / filename
+        for path in [primary, *(primary.with_suffix(ext) for ext in extensions)]:
+            if path.is_file() and path not in paths:
+                paths.append(path)
+    return paths
+
+def link_into_shard(root: Path, flat_path: Path) -> bool:
+    """Make a flat file also reachable at its shard path, without removing it.
+
+    Returns False when a different file already occupies the shard path.
+    Hard links keep both names valid at once; where they are unsupported
+    the file is copied and renamed into place atomically.
+    """
+    target = upload_path(root, flat_path.name)
+    if target.exists():
+        # Linked (or copied) by an earlier, interrupted run. Anything else,
+        # even of the same size, is a different file the flat one must not
+        # be deleted for
+        return os.path.samefile(target, flat_path) or filecmp.cmp(target, flat_path, shallow=False)
+    try:
+        os.link(flat_path, target)
+    except OSError:
+        partial = target.with_name(f".{target.name}.partial")
+        shutil.copy2(flat_path, partial)
+        with open(partial, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(partial, target)
+    return True
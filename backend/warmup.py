@@ -0,0 +1,104 @@
+from sqlalchemy import text
+from contextlib import AsyncExitStack
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import io
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Warm-up runs after startup so the first real requests do not pay for new
+# pool connections, statement compilation or codec imports. /readyz stays
+# 503 until it has finished. A failing step (a database blip at boot) is
+# retried with backoff; a step that keeps failing is skipped and the worker
+# is reported ready but cold, since /readyz checks the database itself
+MAX_RETRY_DELAY = 30.0
+
+class WarmupState:
+    def __init__(self):
+        self.status = "pending"  # pending, running, retrying, done, cold
+        self.started_at: Optional[float] = None
+        self.duration_ms: Optional[float] = None
+        self.steps: Dict[str, float] = {}
+        self.skipped: List[str] = []
+        self.error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status in ("done", "cold")
+
+    def as_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "duration_ms": self.duration_ms,
+            "steps_ms": self.steps,
+            "skipped": self.skipped,
+            "error": self.error,
+        }
+
+warmup_state = WarmupState()
+
+async def open_connections(engine, count: int) -> int:
+    """Open up to `count` pool connections at once and return them to the pool"""
+    count = min(count, engine.pool.size())
+    if count <= 0:
+        return 0
+    async with AsyncExitStack() as stack:
+        connections = [await stack.enter_async_context(engine.connect()) for _ in range(count)]
+        await asyncio.gather(*(conn.execute(text("SELECT 1")) for conn in connections))
+    return count
+
+def warm_image_codecs():
+    """Load Pillow plugins and run each codec the upload path uses once"""
+    from PIL import Image
+    from imaging import supported_variant_formats
+    from settings import get_settings
+
+    Image.init()
+    sample = Image.new("RGB", (64, 64), "white")
+    for image_format in ("JPEG", "PNG", *supported_variant_formats(get_settings().image_variant_formats)):
+        buffer = io.BytesIO()
+        sample.save(buffer, image_format)
+        buffer.seek(0)
+        with Image.open(buffer) as decoded:
+            decoded.load()
+
+async def run_step(name: str, step: Callable[[], Awaitable], attempts: int, backoff: float) -> bool:
+    """Run a step, retrying failures with exponential backoff; False when
+    every attempt failed"""
+    for attempt in range(1, attempts + 1):
+        step_started = time.perf_counter()
+        try:
+            await step()
+        except Exception as e:
+            warmup_state.error = f"{name}: {e}"
+            if attempt == attempts:
+                logger.exception(f"Warm-up step {name} failed {attempts} times, skipping it")
+                return False
+            delay = min(backoff * 2 ** (attempt - 1), MAX_RETRY_DELAY)
+            logger.warning(f"Warm-up step {name} failed (attempt {attempt}/{attempts}), retrying in {delay:.1f} s: {e}")
+            warmup_state.status = "retrying"
+            await asyncio.sleep(delay)
+            warmup_state.status = "running"
+        else:
+            warmup_state.steps[name] = round((time.perf_counter() - step_started) * 1000, 2)
+            return True
+    return False
+
+async def run_warmup(steps: Dict[str, Callable[[], Awaitable]], attempts: int = 5, backoff: float = 0.5):
+    warmup_state.status = "running"
+    warmup_state.started_at = time.perf_counter()
+    try:
+        for name, step in steps.items():
+            if not await run_step(name, step, attempts, backoff):
+                warmup_state.skipped.append(name)
+    finally:
+        warmup_state.duration_ms = round((time.perf_counter() - warmup_state.started_at) * 1000, 2)
+    if warmup_state.skipped:
+        warmup_state.status = "cold"
+        logger.warning(f"Warm-up finished without {', '.join(warmup_state.skipped)}; serving cold")
+    else:
+        warmup_state.status = "done"
+        warmup_state.error = None
+        logger.info(f"Warm-up finished: {warmup_state.steps}")
@@ -0,0 +1,104 @@
+"""Minimal in-process ASGI driver used by the benchmark scripts.
+
+Requests go straight into the application callable, so measurements cover
+routing, dependencies, database and serialization without any socket or
+HTTP client overhead.
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+
+def add_backend_to_path():
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+
+
+class ASGIClient:
+    def __init__(self, app):
+        self.app = app
+        self._lifespan_task = None
+
+    async def request(self, method: str, path: str, json_body=None, body: bytes = b"",
+                      headers: Optional[Dict[str, str]] = None,
+                      query: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+        header_list = [(b"host", b"benchmark")]
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            header_list.append((b"content-type", b"application/json"))
+        for name, value in (headers or {}).items():
+            header_list.append((name.lower().encode(), value.encode()))
+        header_list.append((b"content-length", str(len(body)).encode()))
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": urlencode(query or {}).encode(),
+            "root_path": "",
+            "headers": header_list,
+            "client": ("127.0.0.1", 12345),
+            "server": ("benchmark", 80),
+        }
+        request_sent = False
+        status = 0
+        response_headers: Dict[str, str] = {}
+        chunks = []
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", []):
+                    response_headers[name.decode().lower()] = value.decode()
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return status, response_headers, b"".join(chunks)
+
+    async def startup(self):
+        await self._lifespan("startup")
+
+    async def shutdown(self):
+        await self._lifespan("shutdown")
+
+    async def _lifespan(self, phase: str):
+        # Starlette runs startup and shutdown inside a single lifespan call;
+        # the messages are fed through a queue that stays open in between
+        if phase == "startup":
+            self._lifespan_queue = asyncio.Queue()
+            self._lifespan_done = asyncio.Queue()
+
+            async def receive():
+                return await self._lifespan_queue.get()
+
+            async def send(message):
+                await self._lifespan_done.put(message)
+
+            self._lifespan_task = asyncio.create_task(
+                self.app({"type": "lifespan", "asgi": {"version": "3.0"}}, receive, send)
+            )
+        await self._lifespan_queue.put({"type": f"lifespan.{phase}"})
+        message = await self._lifespan_done.get()
+        if message["type"] != f"lifespan.{phase}.complete":
+            raise RuntimeError(f"Lifespan {phase} failed: {message}")
+        if phase == "shutdown":
+            await self._lifespan_task
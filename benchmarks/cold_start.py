@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Import-time and cold-start benchmark for the API process, with a budget.
+
+For each run a fresh interpreter is started:
+
+* import: `python -X importtime -c "import server"`, parsed for the
+  cumulative time of `server` and the heaviest top-level packages;
+* cold start: wall time of a new process that imports server, builds the
+  app, runs startup against a fresh SQLite database and answers its first
+  GET /api/services.
+
+Medians are compared against cold_start_budget.json and the script exits
+with status 1 when a budget is exceeded, so it can gate CI.
+
+    python benchmarks/cold_start.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from asgi import BACKEND_DIR
+
+BUDGET_FILE = Path(__file__).parent / "cold_start_budget.json"
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$")
+
+FIRST_REQUEST = """
+import asyncio, sys
+sys.path.insert(0, {benchmarks!r})
+from asgi import ASGIClient
+import server
+
+async def main():
+    client = ASGIClient(server.create_app())
+    await client.startup()
+    status, _, _ = await client.request("GET", "/api/services")
+    assert status == 200, status
+    await client.shutdown()
+
+asyncio.run(main())
+"""
+
+
+def environment(db_path):
+    return dict(os.environ, APP_ENV="test", DATABASE_URL=f"sqlite+aiosqlite:///{db_path}")
+
+
+def measure_import(db_path):
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=BACKEND_DIR, env=environment(db_path), capture_output=True, text=True, check=True,
+    ).stderr
+    total_us = None
+    packages = defaultdict(int)
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        packages[module.split(".")[0]] += int(self_us)
+        if module == "server" and len(indent) == 1:
+            total_us = int(cumulative_us)
+    return total_us / 1000, {name: us / 1000 for name, us in packages.items()}
+
+
+def measure_cold_start(db_path):
+    code = FIRST_REQUEST.format(benchmarks=str(Path(__file__).parent))
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=environment(db_path),
+                   check=True, capture_output=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="heaviest packages to list")
+    parser.add_argument("--budget", type=Path, default=BUDGET_FILE)
+    parser.add_argument("--json", type=Path, default=None, help="write results to this file")
+    args = parser.parse_args()
+
+    import_runs, cold_runs = [], []
+    package_totals = defaultdict(list)
+    with tempfile.TemporaryDirectory() as tmp:
+        for run in range(args.runs):
+            db_path = Path(tmp) / f"cold_start_{run}.db"
+            import_ms, packages = measure_import(db_path)
+            import_runs.append(import_ms)
+            for name, ms in packages.items():
+                package_totals[name].append(ms)
+            cold_runs.append(measure_cold_start(db_path))
+
+    results = {
+        "import_ms": statistics.median(import_runs),
+        "cold_start_ms": statistics.median(cold_runs),
+    }
+    heaviest = sorted(
+        ((name, statistics.median(values)) for name, values in package_totals.items()),
+        key=lambda item: item[1], reverse=True,
+    )[:args.top]
+
+    print(f"import server (median of {args.runs}): {results['import_ms']:.1f} ms")
+    print(f"cold start to first response:    {results['cold_start_ms']:.1f} ms")
+    print("heaviest packages (self time):")
+    for name, ms in heaviest:
+        print(f"  {name:<24}{ms:>8.1f} ms")
+    if args.json:
+        args.json.write_text(json.dumps({**results, "packages_ms": dict(heaviest)}, indent=2))
+
+    budget = json.loads(args.budget.read_text())
+    failures = [
+        f"{key} {results[key]:.1f} ms > budget {limit} ms"
+        for key, limit in budget.items() if results[key] > limit
+    ]
+    for failure in failures:
+        print(f"OVER BUDGET: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Synthetic dataset generator for scale testing.
+
+Fills the schema with realistic volumes:
+- services and portfolio items with Cyrillic names, descriptions and
+  categories;
+- uploaded_images rows, each with a matching JPEG file in its shard of
+  the uploads directory.
+Creation dates are spread over the last three years, so listing and
+pagination see realistic ordering.
+
+Rows go in with Core bulk inserts (executemany) in batches of --batch,
+one transaction per batch. The image files are hard links to a small
+set of distinct generated JPEGs, because writing hundreds of thousands
+of files would otherwise dominate the run. Links fall back to copies
+where hard links are not supported.
+
+The target database comes from the usual settings (APP_ENV, DATABASE_URL)
+or --database-url. Pending migrations are applied first.
+
+    python benchmarks/dataset.py --services 40000 --portfolio 60000 --images 400000
+    python benchmarks/dataset.py --database-url sqlite+aiosqlite:////tmp/scale.db --clear
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from asgi import BACKEND_DIR, add_backend_to_path
+
+ADJECTIVES = [
+    "Уютная", "Просторная", "Классическая", "Современная", "Русская", "Финская", "Угловая",
+    "Двухэтажная", "Компактная", "Семейная", "Загородная", "Рубленая", "Северная", "Тёплая",
+]
+BUILDINGS = ["баня", "беседка", "дом", "терраса", "купель", "веранда", "мастерская", "гостевой домик"]
+MATERIALS = ["из бруса", "из бревна", "из кедра", "из лиственницы", "из сосны", "каркасная", "из осины"]
+SENTENCES = [
+    "Строим под ключ за один сезон.",
+    "Используем только сухой камерный лес.",
+    "В стоимость входит фундамент и кровля.",
+    "Печь-каменка подбирается под объём парной.",
+    "Отделка вагонкой из липы и осины.",
+    "Возможна доставка в любой район области.",
+    "Гарантия на сруб и конструктив пять лет.",
+    "Проект адаптируем под ваш участок.",
+    "Электрика и сантехника выполняются по согласованию.",
+    "Работаем по договору с поэтапной оплатой.",
+]
+CATEGORIES = ["Бани", "Беседки", "Дома", "Террасы", "Купели", "Интерьеры", "Отделка", "Фундаменты"]
+# Width x height of the template images: phone photos, landscape and portrait
+IMAGE_SHAPES = [(1200, 800), (800, 1200), (1200, 675), (1024, 768), (640, 480), (1200, 400)]
+
+
+def _name(rng: random.Random) -> str:
+    size = f"{rng.randint(3, 9)}x{rng.randint(3, 12)}"
+    return f"{rng.choice(ADJECTIVES)} {rng.choice(BUILDINGS)} {rng.choice(MATERIALS)} {size}"
+
+
+def _text(rng: random.Random, sentences: int) -> str:
+    return " ".join(rng.choice(SENTENCES) for _ in range(sentences))
+
+
+def _created_at(rng: random.Random, now: datetime) -> datetime:
+    return now - timedelta(seconds=rng.randint(0, 3 * 365 * 24 * 3600))
+
+
+def service_rows(rng, count, now):
+    for _ in range(count):
+        created = _created_at(rng, now)
+        yield {
+            "id": str(uuid.uuid4()),
+            "name": _name(rng),
+            "description": _text(rng, 2),
+            "detailed_description": _text(rng, rng.randint(5, 15)),
+            "price": f"от {rng.randint(50, 5000) * 1000:,} ₽".replace(",", " "),
+            "images": [f"https://example.com/images/{uuid.uuid4().hex}.jpg" for _ in range(rng.randint(0, 6))],
+            "created_at": created,
+            "updated_at": created,
+        }
+
+
+def portfolio_rows(rng, count, now):
+    for _ in range(count):
+        created = _created_at(rng, now)
+        yield {
+            "id": str(uuid.uuid4()),
+            "title": _name(rng),
+            "image": f"https://example.com/portfolio/{uuid.uuid4().hex}.jpg",
+            "category": rng.choice(CATEGORIES),
+            "created_at": created,
+            "updated_at": created,
+        }
+
+
+def make_templates(directory: Path, count: int, rng: random.Random):
+    """Distinct JPEGs the per-row files link to: (path, bytes, width, height)"""
+    from PIL import Image, ImageDraw
+
+    templates = []
+    directory.mkdir(parents=True, exist_ok=True)
+    for index in range(count):
+        width, height = IMAGE_SHAPES[index % len(IMAGE_SHAPES)]
+        image = Image.new("RGB", (width, height), tuple(rng.randint(40, 220) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(12):
+            x, y = rng.randint(0, width), rng.randint(0, height)
+            draw.ellipse((x, y, x + rng.randint(20, 300), y + rng.randint(20, 300)),
+                         fill=tuple(rng.randint(0, 255) for _ in range(3)))
+        path = directory / f"template_{index}.jpg"
+        image.save(path, "JPEG", quality=85)
+        templates.append((path, path.stat().st_size, width, height))
+    return templates
+
+
+def _link(source: Path, target: Path):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def image_rows(rng, count, now, templates, uploads_dir: Path, base_url: str):
+    from upload_storage import upload_path
+
+    for index in range(count):
+        path, size, width, height = templates[index % len(templates)]
+        filename = f"{uuid.uuid4()}.jpg"
+        _link(path, upload_path(uploads_dir, filename))
+        yield {
+            "id": str(uuid.uuid4()),
+            "filename": filename,
+            "original_filename": f"IMG_{rng.randint(1000, 9999)}.jpg",
+            "url": f"{base_url}/api/uploads/{filename}",
+            "size": size,
+            "original_size": size * rng.randint(2, 6),
+            "width": width,
+            "height": height,
+            "original_width": width * 3,
+            "original_height": height * 3,
+            "created_at": _created_at(rng, now),
+        }
+
+
+async def bulk_insert(engine, table, rows, total: int, batch_size: int):
+    started = time.perf_counter()
+    inserted = 0
+    batch = []
+
+    async def flush():
+        nonlocal inserted
+        async with engine.begin() as conn:
+            await conn.execute(table.insert(), batch)
+        inserted += len(batch)
+        batch.clear()
+        rate = inserted / (time.perf_counter() - started)
+        print(f"\r  {table.name}: {inserted}/{total} rows ({rate:,.0f} rows/s)", end="", flush=True)
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    print()
+
+
+async def generate(args):
+    add_backend_to_path()
+    from sqlalchemy import delete
+    from database import get_database
+    from migrations import upgrade
+    from models import ServiceTable, PortfolioTable, UploadedImagesTable
+
+    engine = get_database().engine
+    await upgrade(engine)
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+
+    tables = [ServiceTable.__table__, PortfolioTable.__table__, UploadedImagesTable.__table__]
+    if args.clear:
+        async with engine.begin() as conn:
+            for table in tables:
+                await conn.execute(delete(table))
+        print("Cleared services, portfolio and uploaded_images")
+
+    try:
+        await bulk_insert(engine, tables[0], service_rows(rng, args.services, now), args.services, args.batch)
+        await bulk_insert(engine, tables[1], portfolio_rows(rng, args.portfolio, now), args.portfolio, args.batch)
+        if args.images:
+            args.uploads_dir.mkdir(parents=True, exist_ok=True)
+            templates = make_templates(args.uploads_dir / ".templates", args.distinct_images, rng)
+            rows = image_rows(rng, args.images, now, templates, args.uploads_dir, args.base_url)
+            await bulk_insert(engine, tables[2], rows, args.images, args.batch)
+    finally:
+        await get_database().dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=40_000)
+    parser.add_argument("--portfolio", type=int, default=60_000)
+    parser.add_argument("--images", type=int, default=400_000, help="uploaded_images rows and files")
+    parser.add_argument("--distinct-images", type=int, default=60, help="distinct JPEGs the files link to")
+    parser.add_argument("--uploads-dir", type=Path, default=BACKEND_DIR / "uploads")
+    parser.add_argument("--base-url", default=os.environ.get("REACT_APP_BACKEND_URL", "http://localhost:8001"))
+    parser.add_argument("--batch", type=int, default=5000, help="rows per insert transaction")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--clear", action="store_true",
+                        help="delete existing services, portfolio and uploaded_images rows first")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    started = time.perf_counter()
+    asyncio.run(generate(args))
+    print(f"Done in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Image pipeline microbenchmark: throughput, peak RSS and output size.
+
+A deterministic corpus is generated once into --corpus-dir. It covers
+the shapes uploads actually have:
+- phone photos (12 and 24 MP JPEG);
+- a wide panorama;
+- a PNG with alpha;
+- a palette GIF;
+- a small JPEG that needs no resize.
+
+Each variant processes each image --iterations times in a fresh
+subprocess, so the peak RSS belongs to that pair alone. Peak RSS is
+reported relative to the process after imports.
+
+Variants:
+- `current` runs imaging.process_image exactly as the upload endpoint
+  does, so it tracks the code as it changes.
+- `full_decode` is process_image with fast_decode off.
+- `with_variants` adds the WebP and AVIF siblings uploads get.
+- The others are the same steps with one knob changed: the resampler,
+  JPEG draft-mode decoding with reduce(), or WebP output.
+
+Results can be saved with --json and compared with an earlier run via
+--compare.
+
+--parity checks output quality instead. It compares process_image output
+with process_image at full decode (the reference: full decode, then
+LANCZOS, same output format) by PSNR, flattened over white, and
+exits 1 when any image falls below --min-psnr.
+
+    python benchmarks/image_pipeline.py
+    python benchmarks/image_pipeline.py --variants current,draft --json after.json --compare before.json
+    python benchmarks/image_pipeline.py --parity
+"""
+
+import argparse
+import asyncio
+import json
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from asgi import add_backend_to_path
+
+CORPUS_DIR = Path(__file__).parent / ".image_corpus"
+MAX_SIZE = (1200, 800)
+QUALITY = 85
+
+# name -> (width, height, mode, format)
+CORPUS = {
+    "phone_12mp.jpg": (4000, 3000, "RGB", "JPEG"),
+    "phone_24mp.jpg": (6000, 4000, "RGB", "JPEG"),
+    "panorama.jpg": (12000, 2000, "RGB", "JPEG"),
+    "alpha.png": (2400, 1600, "RGBA", "PNG"),
+    "palette.gif": (1600, 1200, "P", "GIF"),
+    "small.jpg": (1024, 683, "RGB", "JPEG"),
+}
+
+VARIANTS = {
+    # name -> keyword arguments for process_image, or options for run_alternative
+    "current": {"pipeline": "process_image"},
+    "full_decode": {"pipeline": "process_image", "fast_decode": False},
+    # As uploads are processed in production, with WebP and AVIF siblings;
+    # output bytes are the primary file's
+    "with_variants": {"pipeline": "process_image", "variant_formats": ["WEBP", "AVIF"]},
+    "lanczos": {"resample": "LANCZOS"},
+    "bicubic": {"resample": "BICUBIC"},
+    "bilinear": {"resample": "BILINEAR"},
+    "draft": {"resample": "LANCZOS", "draft": True},
+    "webp": {"resample": "LANCZOS", "format": "WEBP"},
+}
+
+
+def generate_corpus(directory: Path):
+    """Photo-like content: smooth gradients, shapes and sensor noise"""
+    from PIL import Image, ImageDraw, ImageFilter
+    import random
+
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(42)
+    for name, (width, height, mode, image_format) in CORPUS.items():
+        path = directory / name
+        if path.exists():
+            continue
+        # Draw at a fraction of the size and upscale, which gives the
+        # smooth areas real photos have, then add noise for texture
+        small = Image.new("RGB", (max(1, width // 8), max(1, height // 8)))
+        draw = ImageDraw.Draw(small)
+        for y in range(small.height):
+            shade = int(255 * y / small.height)
+            draw.line([(0, y), (small.width, y)], fill=(shade, 180 - shade // 2, 255 - shade))
+        for _ in range(40):
+            x, y = rng.randrange(small.width), rng.randrange(small.height)
+            r = rng.randint(5, max(6, small.width // 6))
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rng.randint(0, 255) for _ in range(3)))
+        image = small.filter(ImageFilter.GaussianBlur(2)).resize((width, height), Image.Resampling.BICUBIC)
+        noise = Image.effect_noise((width, height), 24).convert("RGB")
+        image = Image.blend(image, noise, 0.12)
+
+        if mode == "RGBA":
+            alpha = Image.linear_gradient("L").resize((width, height))
+            image.putalpha(alpha)
+        elif mode == "P":
+            image = image.quantize(colors=128)
+        save_options = {"quality": 92} if image_format == "JPEG" else {}
+        image.save(path, image_format, **save_options)
+        print(f"generated {name} ({path.stat().st_size // 1024} KiB)")
+
+
+def run_alternative(source: Path, target: Path, resample: str, draft: bool = False, format: str = "JPEG"):
+    from PIL import Image
+
+    with Image.open(source) as img:
+        if draft and img.format == "JPEG":
+            img.draft("RGB", MAX_SIZE)
+        img.load()
+        if img.mode in ("RGBA", "P"):
+            img = img.convert("RGB")
+        ratio = min(MAX_SIZE[0] / img.width, MAX_SIZE[1] / img.height)
+        if ratio < 1:
+            size = (int(img.width * ratio), int(img.height * ratio))
+            reducing_gap = 3.0 if draft else None
+            img = img.resize(size, getattr(Image.Resampling, resample), reducing_gap=reducing_gap)
+        options = {"quality": QUALITY}
+        if format == "JPEG":
+            options["optimize"] = True
+        img.save(target, format, **options)
+    return target.stat().st_size
+
+
+def _status_kib(field: str) -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def reset_peak_rss() -> int:
+    """Current RSS in KiB, with the peak reset to it where the OS allows"""
+    try:
+        # Writing 5 to clear_refs resets VmHWM on Linux; ru_maxrss cannot be
+        # reset and also carries the parent's peak over fork/exec
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return _status_kib("VmRSS")
+    except (OSError, KeyError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def peak_rss() -> int:
+    try:
+        return _status_kib("VmHWM")
+    except (OSError, KeyError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def worker(variant: str, source: Path, iterations: int) -> dict:
+    """Runs inside a fresh interpreter; prints one JSON result"""
+    add_backend_to_path()
+    from PIL import Image
+    from imaging import process_image
+
+    Image.init()
+    options = dict(VARIANTS[variant])
+    pipeline = options.pop("pipeline", None)
+    rss_before = reset_peak_rss()
+    timings, output_bytes = [], 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(iterations):
+            if pipeline == "process_image":
+                # process_image works in place, so give it a fresh copy
+                target = Path(tmp) / source.name
+                shutil.copyfile(source, target)
+                started = time.perf_counter()
+                stats = asyncio.run(process_image(target, **options))
+                timings.append(time.perf_counter() - started)
+                output_bytes = stats.output_path.stat().st_size
+            else:
+                target = Path(tmp) / f"out.{options.get('format', 'JPEG').lower()}"
+                started = time.perf_counter()
+                output_bytes = run_alternative(source, target, **options)
+                timings.append(time.perf_counter() - started)
+    peak_kib = peak_rss() - rss_before
+    return {"timings": timings, "output_bytes": output_bytes, "peak_rss_kib": peak_kib}
+
+
+def measure(variant: str, source: Path, iterations: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--worker", variant, str(source), "--iterations", str(iterations)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    raw = json.loads(output.strip().splitlines()[-1])
+    width, height = CORPUS[source.name][:2]
+    median = statistics.median(raw["timings"])
+    return {
+        "median_ms": round(median * 1000, 2),
+        "min_ms": round(min(raw["timings"]) * 1000, 2),
+        "images_per_s": round(1 / median, 2),
+        "megapixels_per_s": round(width * height / 1e6 / median, 1),
+        "peak_rss_mib": round(raw["peak_rss_kib"] / 1024, 1),
+        "input_bytes": source.stat().st_size,
+        "output_bytes": raw["output_bytes"],
+    }
+
+
+def psnr(first, second) -> float:
+    from PIL import ImageChops, ImageStat
+    import math
+
+    rms = ImageStat.Stat(ImageChops.difference(first, second)).rms
+    mse = sum(value * value for value in rms) / len(rms)
+    return float("inf") if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def _flatten(image):
+    """RGB over white, so transparent areas compare as what viewers see"""
+    from PIL import Image
+
+    image = image.convert("RGBA")
+    background = Image.new("RGBA", image.size, "white")
+    return Image.alpha_composite(background, image).convert("RGB")
+
+
+def check_parity(corpus_dir: Path, names, min_psnr: float) -> bool:
+    add_backend_to_path()
+    from PIL import Image
+    from imaging import process_image
+
+    passed = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in names:
+            source = corpus_dir / name
+            candidate, reference = Path(tmp) / name, Path(tmp) / "reference" / name
+            reference.parent.mkdir(exist_ok=True)
+            shutil.copyfile(source, candidate)
+            shutil.copyfile(source, reference)
+            candidate = asyncio.run(process_image(candidate)).output_path
+            reference = asyncio.run(process_image(reference, fast_decode=False)).output_path
+            with Image.open(candidate) as a, Image.open(reference) as b:
+                score = psnr(_flatten(a), _flatten(b))
+            ok = score >= min_psnr
+            passed &= ok
+            print(f"{name:<16} PSNR {score:6.2f} dB  {'ok' if ok else 'BELOW ' + str(min_psnr)}")
+    return passed
+
+
+def print_comparison(results: dict, previous: dict):
+    print("\nchange vs previous run (median ms, peak RSS MiB, output bytes):")
+    for variant, images in results.items():
+        for name, current in images.items():
+            before = previous.get(variant, {}).get(name)
+            if before is None:
+                continue
+            changes = [
+                f"{(current[key] - before[key]) / before[key] * 100:+6.1f}% {key}"
+                for key in ("median_ms", "peak_rss_mib", "output_bytes") if before[key]
+            ]
+            print(f"  {variant:<15}{name:<16}" + "  ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variants", default=",".join(VARIANTS), help="comma-separated, from: " + ", ".join(VARIANTS))
+    parser.add_argument("--images", default=",".join(CORPUS), help="comma-separated corpus file names")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--corpus-dir", type=Path, default=CORPUS_DIR)
+    parser.add_argument("--json", type=Path, default=None, help="write results to this file")
+    parser.add_argument("--compare", type=Path, default=None, help="earlier --json output to compare with")
+    parser.add_argument("--parity", action="store_true", help="check process_image output against the reference")
+    parser.add_argument("--min-psnr", type=float, default=40.0)
+    parser.add_argument("--worker", nargs=2, metavar=("VARIANT", "IMAGE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        variant, source = args.worker
+        print(json.dumps(worker(variant, Path(source), args.iterations)))
+        return
+
+    generate_corpus(args.corpus_dir)
+    if args.parity:
+        sys.exit(0 if check_parity(args.corpus_dir, args.images.split(","), args.min_psnr) else 1)
+
+    results = {}
+    print(f"{'variant':<15}{'image':<16}{'median ms':>10}{'img/s':>8}{'MP/s':>8}{'peak MiB':>10}{'out KiB':>9}")
+    for variant in args.variants.split(","):
+        results[variant] = {}
+        for name in args.images.split(","):
+            r = results[variant][name] = measure(variant, args.corpus_dir / name, args.iterations)
+            print(f"{variant:<15}{name:<16}{r['median_ms']:>10.1f}{r['images_per_s']:>8.2f}"
+                  f"{r['megapixels_per_s']:>8.1f}{r['peak_rss_mib']:>10.1f}{r['output_bytes'] // 1024:>9}")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    if args.compare:
+        print_comparison(results, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
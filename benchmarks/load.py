@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+In-process load benchmark for every API endpoint, with a regression baseline.
+
+The app is driven over ASGI (no sockets) against a freshly migrated and
+seeded SQLite database, or against --database-url. Each scenario sends
+--requests requests from --concurrency concurrent workers, repeated for
+--rounds rounds. The benchmark reports the median across rounds of p50,
+p95 and p99 latency and requests per second, plus error counts.
+
+services_list_under_uploads measures public reads while 16 workers keep
+uploading; the uploads admission control rejects are reported, not
+counted as errors.
+
+Write scenarios run in dependency order:
+- create, then update, then delete;
+- upload, then serve, then delete.
+So the dataset stays the same size from one run to the next.
+
+Results are compared with load_baseline.json. A scenario is flagged when
+its p95 grows or its throughput drops by more than --tolerance (p95
+increases under --min-delta-ms are ignored). The script then exits with
+status 1 so it can gate CI. Baselines only make sense on the machine that
+recorded them; refresh them with --save-baseline.
+
+    python benchmarks/load.py --concurrency 16 --requests 400
+    python benchmarks/load.py --only services,portfolio --json results.json
+"""
+
+import argparse
+import asyncio
+import collections
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from asgi import ASGIClient, add_backend_to_path
+
+BASELINE_FILE = Path(__file__).parent / "load_baseline.json"
+ADMIN_TOKEN = "benchmark-admin-token"
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    # Builds (path, kwargs for ASGIClient.request) for the i-th request
+    build: Callable[[int], tuple]
+    # Called with the response body of each successful request
+    on_success: Optional[Callable[[bytes], None]] = None
+    # Sent in a loop by `background_concurrency` workers for as long as the
+    # scenario runs, e.g. an upload storm behind public reads
+    background: Optional["Scenario"] = None
+    background_concurrency: int = 0
+
+
+def _multipart(filename: str, content: bytes, content_type: str):
+    boundary = "benchmark-boundary"
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return body, {"content-type": f"multipart/form-data; boundary={boundary}"}
+
+
+def _sample_jpeg(noise: bool = False) -> bytes:
+    """A flat colour, or noise, which costs about as much CPU as a photo"""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    if noise:
+        image = Image.effect_noise((1600, 1200), 64).convert("RGB")
+    else:
+        image = Image.new("RGB", (1600, 1200), (180, 120, 60))
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def build_scenarios() -> List[Scenario]:
+    service_ids, portfolio_ids, images = [], [], []
+    service = {
+        "name": "Баня из бруса", "description": "Строительство бани под ключ",
+        "detailedDescription": "Фундамент, сруб, кровля и отделка", "price": "от 500 000 ₽", "images": [],
+    }
+    portfolio = {"title": "Баня 6x4", "image": "https://example.com/banya.jpg", "category": "Бани"}
+    contacts = {
+        "name": "Княжий Терем", "tagline": "Строим с душой", "phone": "+7 900 000-00-00",
+        "whatsapp": "+7 900 000-00-00", "email": "info@example.com",
+    }
+    upload_body, upload_headers = _multipart("photo.jpg", _sample_jpeg(), "image/jpeg")
+    storm_body, storm_headers = _multipart("storm.jpg", _sample_jpeg(noise=True), "image/jpeg")
+
+    def remember(target, key=None):
+        def callback(body: bytes):
+            data = json.loads(body)
+            target.append(data[key] if key else data)
+        return callback
+
+    def remember_image(body: bytes):
+        data = json.loads(body)
+        if data.get("success"):
+            images.append(data["image"])
+
+    def item(ids, i):
+        return ids[i % len(ids)]
+
+    return [
+        Scenario("root", "GET", lambda i: ("/api/", {})),
+        Scenario("healthz", "GET", lambda i: ("/healthz", {})),
+        Scenario("readyz", "GET", lambda i: ("/readyz", {})),
+        Scenario("metrics", "GET", lambda i: ("/metrics", {})),
+        Scenario("services_list", "GET", lambda i: ("/api/services", {})),
+        Scenario("portfolio_list", "GET", lambda i: ("/api/portfolio", {})),
+        Scenario("contacts_get", "GET", lambda i: ("/api/contacts", {})),
+        Scenario("uploaded_images_list", "GET", lambda i: ("/api/uploaded-images", {})),
+        Scenario("admin_login", "POST", lambda i: (
+            "/api/admin/login", {"json_body": {"login": "admin", "password": "admin123"}})),
+        Scenario("admin_diagnostics", "GET", lambda i: (
+            "/api/admin/diagnostics", {"headers": {"X-Admin-Token": ADMIN_TOKEN}})),
+        Scenario("services_create", "POST", lambda i: ("/api/services", {"json_body": service}),
+                 remember(service_ids, "id")),
+        Scenario("services_update", "PUT", lambda i: (
+            f"/api/services/{item(service_ids, i)}", {"json_body": {**service, "price": f"{i} ₽"}})),
+        Scenario("services_delete", "DELETE", lambda i: (f"/api/services/{service_ids.pop()}", {})),
+        Scenario("portfolio_create", "POST", lambda i: ("/api/portfolio", {"json_body": portfolio}),
+                 remember(portfolio_ids, "id")),
+        Scenario("portfolio_update", "PUT", lambda i: (
+            f"/api/portfolio/{item(portfolio_ids, i)}", {"json_body": {**portfolio, "title": f"Баня {i}"}})),
+        Scenario("portfolio_delete", "DELETE", lambda i: (f"/api/portfolio/{portfolio_ids.pop()}", {})),
+        Scenario("contacts_update", "PUT", lambda i: ("/api/contacts", {"json_body": contacts})),
+        Scenario("upload_image", "POST", lambda i: (
+            "/api/upload-image", {"body": upload_body, "headers": upload_headers}), remember_image),
+        Scenario("serve_uploaded_image", "GET", lambda i: (
+            f"/api/uploads/{item(images, i)['filename']}", {})),
+        Scenario("uploaded_images_delete", "DELETE", lambda i: (
+            f"/api/uploaded-images/{images.pop()['id']}", {})),
+        # Public read latency while uploads saturate the worker; uploads
+        # turned away by admission control are expected here
+        Scenario("services_list_under_uploads", "GET", lambda i: ("/api/services", {}),
+                 background=Scenario("upload_storm", "POST", lambda i: (
+                     "/api/upload-image", {"body": storm_body, "headers": storm_headers})),
+                 background_concurrency=16),
+    ]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(client: ASGIClient, scenario: Scenario, requests: int, concurrency: int) -> dict:
+    latencies, errors = [], 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            path, kwargs = scenario.build(i)
+            started = time.perf_counter()
+            status, _, body = await client.request(scenario.method, path, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors += 1
+            elif scenario.on_success:
+                scenario.on_success(body)
+
+    background_statuses = collections.Counter()
+    stop = asyncio.Event()
+
+    async def background_worker():
+        i = 0
+        while not stop.is_set():
+            path, kwargs = scenario.background.build(i)
+            i += 1
+            status, _, _ = await client.request(scenario.background.method, path, **kwargs)
+            background_statuses[status] += 1
+            if status == 503:
+                # Back off like a client honouring Retry-After would; a 503
+                # is answered without yielding, so retrying at once would
+                # starve the event loop
+                await asyncio.sleep(0.1)
+
+    background = [
+        asyncio.ensure_future(background_worker()) for _ in range(scenario.background_concurrency)
+    ]
+    if background:
+        # Let the storm build up before measuring
+        await asyncio.sleep(0.5)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*background)
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        **({"background_requests": sum(background_statuses.values()),
+            "background_rejected": background_statuses[503]} if background else {}),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> List[str]:
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        slower_ms = current["p95_ms"] - previous["p95_ms"]
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance) and slower_ms > min_delta_ms:
+            regressions.append(f"{name}: p95 {current['p95_ms']} ms vs baseline {previous['p95_ms']} ms")
+        if current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {current['rps']} req/s vs baseline {previous['rps']} req/s")
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}: {current['errors']} errors vs baseline {previous['errors']}")
+    return regressions
+
+
+async def run(args, uploads_dir: Path) -> dict:
+    add_backend_to_path()
+    import server
+
+    # Keep benchmark uploads out of the real uploads directory
+    server.UPLOADS_DIR = uploads_dir
+    client = ASGIClient(server.create_app())
+    await client.startup()
+    # Warm-up runs in the background after startup; wait for it so the
+    # first scenario does not pay for connection setup
+    while (await client.request("GET", "/readyz"))[0] != 200:
+        await asyncio.sleep(0.05)
+
+    scenarios = build_scenarios()
+    if args.only:
+        selected = set(args.only.split(","))
+        scenarios = [s for s in scenarios if s.name in selected or s.name.split("_")[0] in selected]
+
+    results = {}
+    try:
+        for scenario in scenarios:
+            rounds = [
+                await run_scenario(client, scenario, args.requests, args.concurrency)
+                for _ in range(args.rounds)
+            ]
+            # Median of each figure across rounds damps one-off stalls
+            r = results[scenario.name] = {
+                key: statistics.median(round_[key] for round_ in rounds) for key in rounds[0]
+            }
+            r["errors"] = sum(round_["errors"] for round_ in rounds)
+            background = (f"  background {r['background_requests']:.0f} ({r['background_rejected']:.0f} rejected)"
+                          if "background_requests" in r else "")
+            print(f"{scenario.name:<28}{r['rps']:>9.1f} req/s  p50 {r['p50_ms']:>8.2f}  "
+                  f"p95 {r['p95_ms']:>8.2f}  p99 {r['p99_ms']:>8.2f} ms  errors {r['errors']}{background}")
+    finally:
+        await client.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--rounds", type=int, default=3, help="repetitions of each scenario")
+    parser.add_argument("--only", default=None, help="comma-separated scenario names or prefixes")
+    parser.add_argument("--database-url", default=None, help="default: a fresh temporary SQLite file")
+    parser.add_argument("--json", type=Path, default=None, help="write results to this file")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with this run")
+    parser.add_argument("--tolerance", type=float, default=0.4, help="allowed relative slowdown")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="ignore p95 increases smaller than this, which are timer noise on fast endpoints")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(
+            APP_ENV="test",
+            DATABASE_URL=args.database_url or f"sqlite+aiosqlite:///{tmp}/load.db",
+            ADMIN_TOKEN=ADMIN_TOKEN,
+            SLOW_REQUEST_MS="0",
+        )
+        uploads_dir = Path(tmp) / "uploads"
+        uploads_dir.mkdir()
+        scenarios = asyncio.run(run(args, uploads_dir))
+
+    results = {
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "rounds": args.rounds,
+        "database": "sqlite" if args.database_url is None else args.database_url.split(":", 1)[0],
+        "python": platform.python_version(),
+        "scenarios": scenarios,
+    }
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2, ensure_ascii=False) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+    baseline = json.loads(args.baseline.read_text())
+    if (baseline.get("concurrency"), baseline.get("requests")) != (args.concurrency, args.requests):
+        print("Baseline was recorded with different --concurrency/--requests; comparison may be skewed")
+    regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
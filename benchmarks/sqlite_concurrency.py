@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Concurrent GET throughput during writes on the SQLite fallback database.
+
+Runs the same workload against the default SQLite setup (rollback journal,
+full sync, one shared pool) and the tuned profile (WAL, synchronous=NORMAL,
+mmap, separate reader pool next to a single writer), each in a fresh
+process and on a fresh copy of the database.
+
+    python benchmarks/sqlite_concurrency.py --duration 10 --readers 16 --writers 2
+
+Writers are paced to --write-rate inserts per second each, so both modes
+serve reads under the same write load.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from asgi import ASGIClient, add_backend_to_path
+
+MODES = {
+    "default": {"SQLITE_TUNING": "false"},
+    "tuned": {"SQLITE_TUNING": "true"},
+}
+
+
+async def run_worker(args):
+    add_backend_to_path()
+    import server
+
+    client = ASGIClient(server.app)
+    await client.startup()
+    deadline = time.perf_counter() + args.duration
+    latencies = []
+    counts = {"reads": 0, "writes": 0, "read_errors": 0, "write_errors": 0}
+
+    async def reader():
+        paths = ["/api/services", "/api/portfolio", "/api/contacts"]
+        index = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            status, _, _ = await client.request("GET", paths[index % len(paths)])
+            index += 1
+            if status == 200:
+                counts["reads"] += 1
+                latencies.append(time.perf_counter() - started)
+            else:
+                counts["read_errors"] += 1
+
+    async def writer():
+        interval = 1.0 / args.write_rate
+        while time.perf_counter() < deadline:
+            next_write = time.perf_counter() + interval
+            status, _, body = await client.request("POST", "/api/portfolio", json_body={
+                "title": "Бенчмарк", "image": "https://example.com/x.jpg", "category": "Тест"
+            })
+            if status != 200:
+                counts["write_errors"] += 1
+                continue
+            item_id = json.loads(body)["id"]
+            status, _, _ = await client.request("DELETE", f"/api/portfolio/{item_id}")
+            counts["writes"] += 2 if status == 200 else 1
+            await asyncio.sleep(max(0.0, next_write - time.perf_counter()))
+
+    await asyncio.gather(
+        *[reader() for _ in range(args.readers)],
+        *[writer() for _ in range(args.writers)],
+    )
+    await client.shutdown()
+
+    latencies.sort()
+    result = dict(counts)
+    result["reads_per_second"] = counts["reads"] / args.duration
+    result["writes_per_second"] = counts["writes"] / args.duration
+    if latencies:
+        result["read_p50_ms"] = statistics.median(latencies) * 1000
+        result["read_p95_ms"] = latencies[int(len(latencies) * 0.95) - 1] * 1000
+        result["read_p99_ms"] = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(json.dumps(result))
+
+
+def run_mode(mode, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "benchmark.db"
+        env = dict(os.environ, APP_ENV="test", DATABASE_URL=f"sqlite+aiosqlite:///{db_path}", **MODES[mode])
+        command = [
+            sys.executable, __file__, "--worker",
+            "--duration", str(args.duration),
+            "--readers", str(args.readers),
+            "--writers", str(args.writers),
+            "--write-rate", str(args.write_rate),
+        ]
+        output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--write-rate", type=float, default=10.0)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        asyncio.run(run_worker(args))
+        return
+
+    results = {mode: run_mode(mode, args) for mode in MODES}
+    columns = ["reads_per_second", "read_p50_ms", "read_p95_ms", "read_p99_ms",
+               "writes_per_second", "read_errors", "write_errors"]
+    print(f"{'metric':<20}" + "".join(f"{mode:>12}" for mode in MODES))
+    for column in columns:
+        row = "".join(f"{results[mode].get(column, 0):>12.1f}" for mode in MODES)
+        print(f"{column:<20}{row}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Startup seeding: multi-worker race check and boot time versus dataset size.
+
+1. Starts --workers processes that seed the same fresh database at once and
+   checks that the default rows were inserted exactly once.
+2. Fills services and portfolio with --sizes rows and times the startup
+   path (schema version check + seeding) against the previous approach of
+   loading every row to see whether a table is empty.
+
+    python benchmarks/startup_seeding.py --workers 8 --sizes 0 10000 100000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from asgi import add_backend_to_path
+
+
+async def seed_worker():
+    add_backend_to_path()
+    from database import engine
+    from seeding import seed_default_data
+
+    inserted = await seed_default_data(engine)
+    await engine.dispose()
+    print(json.dumps(inserted))
+
+
+async def count_rows():
+    add_backend_to_path()
+    from sqlalchemy import select, func
+    from database import engine
+    from seeding import SEED_TABLES
+
+    async with engine.connect() as conn:
+        counts = {name: await conn.scalar(select(func.count()).select_from(table))
+                  for name, table in SEED_TABLES.items()}
+    await engine.dispose()
+    print(json.dumps(counts))
+
+
+async def migrate_only():
+    add_backend_to_path()
+    from database import engine
+    from migrations import upgrade
+
+    await upgrade(engine)
+    await engine.dispose()
+
+
+async def boot_timing(size, repeat):
+    add_backend_to_path()
+    from sqlalchemy import select
+    from database import engine
+    from migrations import upgrade, ensure_schema
+    from seeding import SEED_TABLES, seed_default_data
+
+    await upgrade(engine)
+    services = SEED_TABLES["services"]
+    portfolio = SEED_TABLES["portfolio"]
+    async with engine.begin() as conn:
+        for start in range(0, size, 5000):
+            batch = range(start, min(size, start + 5000))
+            await conn.execute(services.insert(), [{
+                "name": f"Услуга {i}", "description": "Описание услуги " * 5,
+                "detailed_description": "Подробное описание " * 20,
+                "price": "от 1000 ₽", "images": [f"https://example.com/{i}.jpg"],
+            } for i in batch])
+            await conn.execute(portfolio.insert(), [{
+                "title": f"Работа {i}", "image": f"https://example.com/{i}.jpg", "category": "Бани",
+            } for i in batch])
+
+    async def current():
+        await ensure_schema(engine, auto_migrate=True)
+        await seed_default_data(engine)
+
+    async def legacy():
+        async with engine.connect() as conn:
+            for table in SEED_TABLES.values():
+                (await conn.execute(select(table))).all()
+
+    results = {}
+    for name, startup in (("current", current), ("legacy", legacy)):
+        await startup()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            await startup()
+        results[name] = (time.perf_counter() - started) / repeat * 1000
+    await engine.dispose()
+    print(json.dumps(results))
+
+
+def run(mode, db_path, *extra):
+    env = dict(os.environ, APP_ENV="test", DATABASE_URL=f"sqlite+aiosqlite:///{db_path}")
+    return subprocess.Popen(
+        [sys.executable, __file__, "--mode", mode, *extra],
+        env=env, stdout=subprocess.PIPE, text=True,
+    )
+
+
+def output(process):
+    stdout, _ = process.communicate()
+    if process.returncode:
+        raise RuntimeError(f"worker failed with exit code {process.returncode}")
+    return json.loads(stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mode", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode == "seed":
+        return asyncio.run(seed_worker())
+    if args.mode == "count":
+        return asyncio.run(count_rows())
+    if args.mode == "migrate":
+        return asyncio.run(migrate_only())
+    if args.mode == "boot":
+        return asyncio.run(boot_timing(args.size, args.repeat))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "race.db"
+        run("migrate", db_path).wait()
+        workers = [run("seed", db_path) for _ in range(args.workers)]
+        inserted = [output(worker) for worker in workers]
+        counts = output(run("count", db_path))
+        seeders = sum(1 for result in inserted if result)
+        print(f"Race: {args.workers} workers, {seeders} seeded, rows after: {counts}")
+
+    print(f"{'rows':>10}{'current ms':>14}{'legacy ms':>14}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            timing = output(run("boot", Path(tmp) / "boot.db", "--size", str(size), "--repeat", str(args.repeat)))
+        print(f"{size:>10}{timing['current']:>14.2f}{timing['legacy']:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("APP_ENV", "test")
+
+
+def sample_rows() -> dict:
+    """A few rows per content table, covering NULLs, JSON, Cyrillic text
+    and microsecond timestamps"""
+    started = datetime(2024, 3, 1, 12, 30, 15, 123456)
+    services = [
+        {"id": f"service-{i:03d}", "name": f"Услуга {i}", "description": "Отделка «под ключ»",
+         "detailed_description": "Строка\nс переносом", "price": f"от {i * 1000} ₽",
+         "images": [f"/api/uploads/{i}.jpg"] if i % 2 else [],
+         "created_at": started + timedelta(minutes=i), "updated_at": started + timedelta(minutes=i)}
+        for i in range(23)
+    ]
+    portfolio = [
+        {"id": f"portfolio-{i:03d}", "title": f"Проект {i}", "image": f"/api/uploads/p{i}.jpg",
+         "category": ("Бани", "Дома", "Интерьеры")[i % 3],
+         "created_at": started + timedelta(hours=i), "updated_at": None}
+        for i in range(31)
+    ]
+    contacts = [
+        {"id": "contacts-000", "name": "Княжий Терем", "tagline": "Мастера чистовой отделки деревом",
+         "phone": "+7 (999) 123-45-67", "whatsapp": "+79991234567", "email": "info@example.ru",
+         "updated_at": started}
+    ]
+    uploaded_images = [
+        {"id": f"image-{i:03d}", "filename": f"{i:08x}-0000-4000-8000-000000000000.jpg",
+         "original_filename": f"фото {i}.jpg", "url": f"http://localhost:8001/api/uploads/{i}.jpg",
+         "size": 1000 + i, "created_at": started + timedelta(seconds=i),
+         "original_size": 5000 + i if i % 4 else None, "width": 1200, "height": 800,
+         "original_width": None, "original_height": None, "processing_ms": 12.5 + i,
+         "processing_error": "truncated" if i == 3 else None,
+         "processing_stats": {"input_format": "JPEG", "variants": {"WEBP": 321}} if i % 5 else None}
+        for i in range(17)
+    ]
+    return {"services": services, "portfolio": portfolio, "contacts": contacts,
+            "uploaded_images": uploaded_images}
+
+
+async def create_database(url: str, rows: dict = None):
+    """Migrate the database at `url` to the latest schema and insert `rows`"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from bulk import CONTENT_TABLES, insert_rows
+    from migrations import upgrade
+
+    engine = create_async_engine(url)
+    try:
+        await upgrade(engine)
+        async with engine.begin() as conn:
+            for name, table_rows in (rows or {}).items():
+                await insert_rows(conn, CONTENT_TABLES[name], table_rows)
+    finally:
+        await engine.dispose()
+
+
+async def checksums(url: str) -> dict:
+    """Table name -> (row count, checksum) of the database at `url`"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from bulk import CONTENT_TABLES, table_checksum
+
+    engine = create_async_engine(url)
+    try:
+        async with engine.connect() as conn:
+            return {name: await table_checksum(conn, table, 10) for name, table in CONTENT_TABLES.items()}
+    finally:
+        await engine.dispose()
+
+
+@pytest.fixture
+def sqlite_url(tmp_path):
+    """Factory of SQLite URLs for fresh database files under tmp_path"""
+    def make(name: str) -> str:
+        return f"sqlite+aiosqlite:///{tmp_path / name}.db"
+    return make
+
+
+@pytest.fixture
+def source_url(sqlite_url):
+    """SQLite database at the latest schema holding sample_rows()"""
+    url = sqlite_url("source")
+    asyncio.run(create_database(url, sample_rows()))
+    return url
+
+
+@pytest.fixture
+def configure_database(monkeypatch):
+    """Point the settings at a database URL for code that calls
+    get_database(); keyword arguments override other settings by their
+    environment variable, e.g. configure(url, admission_upload_queue=0).
+    Engines are created on first use, in the event loop that uses them"""
+    import database
+    import settings
+
+    def configure(url: str, **overrides):
+        monkeypatch.setenv("DATABASE_URL", url)
+        for name, value in overrides.items():
+            monkeypatch.setenv(name.upper(), str(value))
+        settings.get_settings.cache_clear()
+        monkeypatch.setattr(database, "_database", None)
+
+    yield configure
+    settings.get_settings.cache_clear()
+
+
+@pytest.fixture
+def make_client(tmp_path, monkeypatch, configure_database):
+    """Factory of started TestClients for a fresh app on a temporary SQLite
+    database and uploads directory; keyword arguments as for
+    configure_database"""
+    from fastapi.testclient import TestClient
+    import server
+
+    clients = []
+
+    def make(**overrides) -> TestClient:
+        configure_database(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}", **overrides)
+        monkeypatch.setattr(server, "UPLOADS_DIR", tmp_path / "uploads")
+        client = TestClient(server.create_app())
+        client.__enter__()
+        clients.append(client)
+        # Warm-up runs in the background after startup
+        deadline = time.monotonic() + 10
+        while client.get("/readyz").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        return client
+
+    yield make
+    for client in clients:
+        client.__exit__(None, None, None)
+
+
+def metric_value(name: str, **labels) -> float:
+    """Current value of a series from the metrics registry; 0 for a
+    labelled series that was never incremented"""
+    from metrics import REGISTRY
+
+    wanted = name + ("{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}" if labels else "")
+    for line in REGISTRY.render().splitlines():
+        series, _, value = line.rpartition(" ")
+        if series == wanted:
+            return float(value)
+    return 0.0
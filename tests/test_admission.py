@@ -0,0 +1,148 @@
+import asyncio
+import contextlib
+
+import httpx
+import pytest
+
+from .conftest import metric_value
+
+
+def make_limiter(name="test", concurrency=1, queue_size=1, queue_timeout=5.0):
+    from admission import AdmissionLimiter
+
+    return AdmissionLimiter(name, concurrency, queue_size, queue_timeout, retry_after=7)
+
+
+async def hold(limiter, release: asyncio.Event, entered: asyncio.Event = None):
+    async with limiter.slot():
+        if entered is not None:
+            entered.set()
+        await release.wait()
+
+
+def test_queue_overflow_is_rejected():
+    from admission import Overloaded
+
+    async def run():
+        limiter = make_limiter("overflow")
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(limiter, release))
+        queued = asyncio.create_task(hold(limiter, release))
+        await asyncio.sleep(0.01)
+        assert (limiter.active, limiter.waiting) == (1, 1)
+        with pytest.raises(Overloaded) as raised:
+            async with limiter.slot():
+                pass
+        release.set()
+        await asyncio.gather(holder, queued)
+        return raised.value, limiter
+
+    error, limiter = asyncio.run(run())
+    assert (error.reason, error.retry_after) == ("queue_full", 7)
+    assert (limiter.active, limiter.waiting) == (0, 0)
+    assert metric_value("admission_rejected_total", pool="overflow", reason="queue_full") == 1
+
+
+def test_slots_are_handed_over_in_arrival_order():
+    async def run():
+        limiter = make_limiter(queue_size=3)
+        order = []
+
+        async def request(number, release):
+            async with limiter.slot():
+                order.append(number)
+                await release.wait()
+
+        gates = [asyncio.Event() for _ in range(4)]
+        tasks = []
+        for number, gate in enumerate(gates):
+            tasks.append(asyncio.create_task(request(number, gate)))
+            await asyncio.sleep(0)
+        for gate in gates:
+            gate.set()
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*tasks)
+        return order, limiter.active
+
+    assert asyncio.run(run()) == ([0, 1, 2, 3], 0)
+
+
+def test_slot_is_released_after_an_error():
+    async def run():
+        limiter = make_limiter()
+        for _ in range(3):
+            with pytest.raises(RuntimeError):
+                async with limiter.slot():
+                    raise RuntimeError("handler failed")
+        return limiter.active
+
+    assert asyncio.run(run()) == 0
+
+
+def test_cancelled_waiter_passes_its_slot_on():
+    async def run():
+        limiter = make_limiter()
+        release, entered = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(limiter, release, entered))
+        await entered.wait()
+        waiter = asyncio.create_task(hold(limiter, asyncio.Event()))
+        await asyncio.sleep(0.01)
+
+        # The slot reaches the waiter in the same step it is cancelled
+        release.set()
+        await holder
+        waiter.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await waiter
+        # Free again: taken without queueing
+        async with limiter.slot():
+            free = limiter.waiting == 0
+        return free, limiter.active, limiter.waiting
+
+    assert asyncio.run(run()) == (True, 0, 0)
+
+
+@pytest.fixture
+def read_limiter(monkeypatch):
+    import admission
+
+    limiter = make_limiter("read", queue_timeout=0.1)
+    monkeypatch.setattr(admission, "_limiters", {"read": limiter})
+    return limiter
+
+
+def test_middleware_answers_a_timeout_with_503(read_limiter):
+    from admission import AdmissionMiddleware
+
+    release, entered = asyncio.Event(), asyncio.Event()
+
+    async def app(scope, receive, send):
+        if scope["path"] == "/api/slow":
+            entered.set()
+            await release.wait()
+        if scope["path"] == "/api/broken":
+            raise RuntimeError("handler failed")
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def run():
+        transport = httpx.ASGITransport(app=AdmissionMiddleware(app))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            slow = asyncio.create_task(client.get("/api/slow"))
+            await entered.wait()
+            timed_out = await client.get("/api/services")
+            release.set()
+            await slow
+            with pytest.raises(RuntimeError):
+                await client.get("/api/broken")
+            after_error = await client.get("/api/services")
+            return timed_out, after_error
+
+    before = metric_value("admission_rejected_total", pool="read", reason="timeout")
+    timed_out, after_error = asyncio.run(run())
+    assert timed_out.status_code == 503
+    assert timed_out.headers["retry-after"] == "7"
+    assert "перегружен" in timed_out.json()["detail"]
+    assert metric_value("admission_rejected_total", pool="read", reason="timeout") == before + 1
+    assert after_error.status_code == 200
+    assert (read_limiter.active, read_limiter.waiting) == (0, 0)
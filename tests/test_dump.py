@@ -0,0 +1,182 @@
+import asyncio
+import gzip
+import io
+import json
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from .conftest import checksums, create_database, sample_rows
+
+
+async def export_to(url: str, output: str, **kwargs):
+    import dump
+
+    engine = create_async_engine(url)
+    try:
+        await dump.export(engine, output, kwargs.get("with_uploads", False), kwargs.get("uploads_dir"))
+    finally:
+        await engine.dispose()
+
+
+async def import_from(url: str, source: str, clear: bool = False, batch_size: int = 7, uploads_dir=None):
+    import dump
+
+    engine = create_async_engine(url)
+    try:
+        await dump.import_dump(engine, source, clear, batch_size, uploads_dir)
+    finally:
+        await engine.dispose()
+
+
+def dump_lines(rows: dict, schema_version: int = 1) -> list:
+    import dump
+    from bulk import CONTENT_TABLES, encode_row
+
+    lines = [json.dumps({"meta": {"format_version": dump.FORMAT_VERSION, "schema_version": schema_version}})]
+    lines += [json.dumps({"table": name, "row": encode_row(CONTENT_TABLES[name], row)})
+              for name, table_rows in rows.items() for row in table_rows]
+    lines.append(json.dumps({"meta": {"counts": {name: len(table_rows) for name, table_rows in rows.items()}}}))
+    return [line + "\n" for line in lines]
+
+
+@pytest.mark.parametrize("name", ["backup.ndjson", "backup.ndjson.gz", "backup.tar.gz"])
+def test_round_trip(tmp_path, source_url, sqlite_url, name):
+    output = str(tmp_path / name)
+    target_url = sqlite_url("target")
+    asyncio.run(export_to(source_url, output))
+    asyncio.run(import_from(target_url, output))
+
+    expected = {name: len(rows) for name, rows in sample_rows().items()}
+    assert {name: count for name, (count, _) in asyncio.run(checksums(target_url)).items()} == expected
+    assert asyncio.run(checksums(target_url)) == asyncio.run(checksums(source_url))
+
+
+def test_round_trip_keeps_values(tmp_path, source_url, sqlite_url):
+    from models import PortfolioTable, UploadedImagesTable
+
+    output = str(tmp_path / "backup.ndjson.gz")
+    target_url = sqlite_url("target")
+    asyncio.run(export_to(source_url, output))
+    asyncio.run(import_from(target_url, output))
+
+    async def read(url):
+        engine = create_async_engine(url)
+        try:
+            async with engine.connect() as conn:
+                images = (await conn.execute(
+                    select(UploadedImagesTable).order_by(UploadedImagesTable.id)
+                )).mappings().all()
+                null_stats = await conn.scalar(
+                    select(func.count()).where(UploadedImagesTable.processing_stats.is_(None))
+                )
+                portfolio = (await conn.execute(
+                    select(PortfolioTable).order_by(PortfolioTable.id)
+                )).mappings().all()
+                return [dict(row) for row in images], null_stats, [dict(row) for row in portfolio]
+        finally:
+            await engine.dispose()
+
+    images, null_stats, portfolio = asyncio.run(read(target_url))
+    assert (images, null_stats, portfolio) == asyncio.run(read(source_url))
+    # SQL NULL in a JSON column stays SQL NULL rather than the JSON text 'null'
+    assert null_stats == sum(1 for row in sample_rows()["uploaded_images"] if row["processing_stats"] is None)
+    assert images[0]["created_at"].microsecond == 123456
+
+
+def test_export_format(tmp_path, source_url):
+    from migrations import latest_version
+
+    output = tmp_path / "backup.ndjson.gz"
+    asyncio.run(export_to(source_url, str(output)))
+    with gzip.open(output, "rt", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+
+    assert records[0]["meta"]["schema_version"] == latest_version()
+    assert records[-1]["meta"]["counts"] == {name: len(rows) for name, rows in sample_rows().items()}
+    keys = [record["row"]["id"] for record in records[1:-1] if record["table"] == "services"]
+    assert keys == sorted(keys)
+
+
+def test_tarball_with_uploads(tmp_path, source_url, sqlite_url):
+    from upload_storage import locate_upload, upload_path
+
+    source_uploads, target_uploads = tmp_path / "uploads", tmp_path / "restored"
+    target_uploads.mkdir()
+    filename = sample_rows()["uploaded_images"][0]["filename"]
+    upload_path(source_uploads, filename).write_bytes(b"primary")
+    upload_path(source_uploads, filename).with_suffix(".webp").write_bytes(b"sibling")
+    # A file left in the flat layout by an unfinished migration
+    flat = sample_rows()["uploaded_images"][1]["filename"]
+    (source_uploads / flat).write_bytes(b"flat")
+
+    output = str(tmp_path / "backup.tar.gz")
+    asyncio.run(export_to(source_url, output, with_uploads=True, uploads_dir=source_uploads))
+    asyncio.run(import_from(sqlite_url("target"), output, uploads_dir=target_uploads))
+
+    assert locate_upload(target_uploads, filename).read_bytes() == b"primary"
+    assert locate_upload(target_uploads, filename).with_suffix(".webp").read_bytes() == b"sibling"
+    assert locate_upload(target_uploads, flat).read_bytes() == b"flat"
+
+
+def test_with_uploads_needs_a_tarball(tmp_path, source_url):
+    import dump
+
+    with pytest.raises(dump.DumpError):
+        asyncio.run(export_to(source_url, str(tmp_path / "backup.ndjson"), with_uploads=True,
+                              uploads_dir=tmp_path))
+
+
+def test_import_refuses_non_empty_tables(tmp_path, source_url):
+    import dump
+
+    output = str(tmp_path / "backup.ndjson")
+    asyncio.run(export_to(source_url, output))
+    with pytest.raises(dump.DumpError, match="not empty"):
+        asyncio.run(import_from(source_url, output))
+
+    before = asyncio.run(checksums(source_url))
+    asyncio.run(import_from(source_url, output, clear=True))
+    assert asyncio.run(checksums(source_url)) == before
+
+
+@pytest.mark.parametrize("mutate, message", [
+    (lambda lines: lines[:-1], "truncated"),
+    (lambda lines: lines[:-2] + lines[-1:], "Row counts differ"),
+    (lambda lines: lines[1:], "Missing header"),
+    (lambda lines: lines + lines[-1:], "after the trailer"),
+    (lambda lines: lines[:1] + ["{not json\n"] + lines[1:], "not valid JSON"),
+])
+def test_damaged_dump_is_rejected(sqlite_url, mutate, message):
+    import dump
+
+    url = sqlite_url("target")
+    asyncio.run(create_database(url))
+    lines = mutate(dump_lines({"services": sample_rows()["services"][:2]}))
+
+    async def run():
+        engine = create_async_engine(url)
+        try:
+            await dump.read_rows(engine, io.StringIO("".join(lines)), 5000)
+        finally:
+            await engine.dispose()
+    with pytest.raises(dump.DumpError, match=message):
+        asyncio.run(run())
+
+
+def test_dump_from_newer_schema_is_rejected(sqlite_url):
+    import dump
+    from migrations import latest_version
+
+    url = sqlite_url("target")
+    asyncio.run(create_database(url))
+
+    async def run():
+        engine = create_async_engine(url)
+        try:
+            await dump.read_rows(engine, dump_lines({}, schema_version=latest_version() + 1), 5000)
+        finally:
+            await engine.dispose()
+    with pytest.raises(dump.DumpError, match="newer"):
+        asyncio.run(run())
@@ -0,0 +1,129 @@
+import io
+import struct
+import zlib
+
+import pytest
+from PIL import Image
+
+from .conftest import metric_value
+
+ALLOWED = ["JPEG", "PNG", "GIF", "WEBP"]
+
+
+def encoded(image_format: str, size=(64, 48), **params) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 120, 40)).save(buffer, image_format, **params)
+    return buffer.getvalue()
+
+
+def segment(code: int, payload: bytes) -> bytes:
+    return bytes([0xFF, code]) + struct.pack(">H", len(payload) + 2) + payload
+
+
+def sof(width: int, height: int, code: int = 0xC0) -> bytes:
+    return segment(code, bytes([8]) + struct.pack(">HH", height, width) + b"\x03" + b"\x01\x22\x00" * 3)
+
+
+def png_header(width: int, height: int) -> bytes:
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    chunk = b"IHDR" + ihdr
+    return b"\x89PNG\r\n\x1a\n" + struct.pack(">I", len(ihdr)) + chunk + struct.pack(">I", zlib.crc32(chunk))
+
+
+def check(data: bytes, allowed=ALLOWED, max_pixels=64_000_000, max_dimension=16384):
+    from image_sniffing import check_upload
+
+    return check_upload(io.BytesIO(data), allowed, max_pixels, max_dimension)
+
+
+def rejection(data: bytes, **kwargs) -> str:
+    from image_sniffing import ImageRejected
+
+    with pytest.raises(ImageRejected) as raised:
+        check(data, **kwargs)
+    return raised.value.reason
+
+
+@pytest.mark.parametrize("image_format, params", [
+    ("JPEG", {}),
+    ("JPEG", {"progressive": True}),
+    ("PNG", {}),
+    ("GIF", {}),
+    ("WEBP", {}),
+    ("WEBP", {"lossless": True}),
+])
+def test_sizes_are_read_from_headers(image_format, params):
+    image = check(encoded(image_format, (321, 123), **params))
+    assert (image.format, image.width, image.height) == (image_format, 321, 123)
+
+
+def test_jpeg_frame_after_large_segments_and_fill_bytes():
+    from image_sniffing import sniff_image
+
+    data = b"\xff\xd8" + segment(0xE1, b"Exif\x00\x00" + b"\x00" * 60000) + b"\xff\xff\xff" + sof(4000, 3000)[1:]
+    stream = io.BytesIO(data)
+    stream.seek(7)
+    image = sniff_image(stream)
+    assert (image.width, image.height) == (4000, 3000)
+    # The caller's position is restored
+    assert stream.tell() == 7
+
+
+@pytest.mark.parametrize("data", [
+    # Ends inside the APP0 segment's length field
+    b"\xff\xd8\xff\xe0\x00",
+    # Ends inside the frame header
+    b"\xff\xd8" + sof(640, 480)[:7],
+    # Scan data before any frame header
+    b"\xff\xd8" + segment(0xDA, b"\x01\x01\x00\x00\x3f\x00") + b"\x00" * 64,
+    # A zero height, to be defined later by a DNL marker
+    b"\xff\xd8" + sof(640, 0),
+    # A segment length that points backwards
+    b"\xff\xd8\xff\xe0\x00\x00" + b"\x00" * 64,
+    # No frame header within the first MiB
+    b"\xff\xd8" + segment(0xFE, b"\x00" * 65000) * 17,
+], ids=["length", "frame", "scan", "zero-height", "bad-length", "too-far"])
+def test_malformed_jpeg_headers_are_rejected(data):
+    assert rejection(data) == "bad_header"
+
+
+def test_non_frame_sof_codes_are_skipped():
+    # C4 (Huffman table) shares the SOF range but carries no dimensions
+    image = check(b"\xff\xd8" + segment(0xC4, b"\x00" * 20) + sof(50, 60, code=0xC2))
+    assert (image.width, image.height) == (50, 60)
+
+
+def test_png_ihdr_limits():
+    assert rejection(png_header(100_000, 100_000)) == "too_many_pixels"
+    # Within the pixel budget, but one side is too long
+    assert rejection(png_header(20_000, 10), max_dimension=16384) == "too_many_pixels"
+    assert rejection(png_header(0, 10)) == "bad_header"
+    assert rejection(png_header(64, 48)[:20]) == "bad_header"
+
+
+def test_pixel_and_dimension_limits():
+    jpeg = b"\xff\xd8" + sof(3000, 3000)
+    assert rejection(jpeg, max_pixels=8_000_000) == "too_many_pixels"
+    assert rejection(jpeg, max_dimension=2999) == "too_many_pixels"
+    assert check(jpeg, max_pixels=9_000_000, max_dimension=3000).pixels == 9_000_000
+
+
+def test_format_is_checked_by_content():
+    assert rejection(encoded("GIF"), allowed=["JPEG", "PNG"]) == "format_not_allowed"
+    avif = b"\x00\x00\x00\x1cftypavif" + b"\x00" * 32
+    assert rejection(avif) == "format_not_allowed"
+    assert rejection(b"<svg xmlns='http://www.w3.org/2000/svg'/>") == "unknown_format"
+
+
+def test_rejections_are_counted():
+    before = metric_value("image_uploads_rejected_total", reason="bad_header")
+    rejection(b"\xff\xd8\xff")
+    assert metric_value("image_uploads_rejected_total", reason="bad_header") == before + 1
+
+
+def test_gif_named_png_is_rejected_when_gif_is_not_allowed(make_client, tmp_path):
+    client = make_client(image_allowed_formats="JPEG,PNG")
+    result = client.post("/api/upload-image", files={"file": ("photo.png", encoded("GIF"), "image/png")}).json()
+    assert not result["success"]
+    assert result["message"] == "Формат GIF не поддерживается"
+    assert not any((tmp_path / "uploads").rglob("*.*"))
@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import os
+import sqlite3
+
+import pytest
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+# An empty PostgreSQL database the tests may write to, as for
+# test_migrate_to_postgres.py
+POSTGRES_DSN = os.environ.get("TEST_POSTGRES_DSN")
+
+
+async def with_engine(url: str, run, **kwargs):
+    engine = create_async_engine(url, **kwargs)
+    try:
+        return await run(engine)
+    finally:
+        await engine.dispose()
+
+
+async def schema(engine) -> dict:
+    """Table name -> (column names, index names)"""
+    def read(sync_conn):
+        inspector = inspect(sync_conn)
+        return {
+            table: ({c["name"] for c in inspector.get_columns(table)},
+                    {i["name"] for i in inspector.get_indexes(table)})
+            for table in inspector.get_table_names()
+        }
+    async with engine.connect() as conn:
+        return await conn.run_sync(read)
+
+
+async def recorded_versions(engine) -> list:
+    from migrations import schema_version_table
+
+    async with engine.connect() as conn:
+        versions = await conn.scalars(select(schema_version_table.c.version).order_by(schema_version_table.c.version))
+        return list(versions)
+
+
+def extra_migration(monkeypatch, upgrade, transactional=True):
+    """Register `upgrade` as the next version for the rest of the test"""
+    import migrations
+
+    m = migrations.Migration(migrations.latest_version() + 1, "test step", upgrade, transactional)
+    monkeypatch.setattr(migrations, "MIGRATIONS", [*migrations.MIGRATIONS, m])
+    return m
+
+
+def test_fresh_database(sqlite_url):
+    from migrations import MIGRATIONS, current_version, latest_version, upgrade
+
+    async def run(engine):
+        before = await current_version(engine)
+        applied = await upgrade(engine)
+        return before, applied, await current_version(engine), await schema(engine), await upgrade(engine)
+
+    before, applied, after, tables, again = asyncio.run(with_engine(sqlite_url("fresh"), run))
+    assert before == 0
+    assert [m.version for m in applied] == [m.version for m in MIGRATIONS]
+    assert after == latest_version()
+    assert {"services", "portfolio", "contacts", "uploaded_images", "app_locks", "schema_version"} <= set(tables)
+    assert "ix_uploaded_images_created_at" in tables["uploaded_images"][1]
+    assert "processing_stats" in tables["uploaded_images"][0]
+    assert again == []
+
+
+def test_partial_upgrade(sqlite_url):
+    from migrations import current_version, latest_version, upgrade
+
+    async def run(engine):
+        first = await upgrade(engine, target=3)
+        partial = (await current_version(engine), await schema(engine))
+        rest = await upgrade(engine)
+        return first, partial, rest, await recorded_versions(engine)
+
+    first, (version, tables), rest, versions = asyncio.run(with_engine(sqlite_url("partial"), run))
+    assert [m.version for m in first] == [1, 2, 3]
+    assert version == 3
+    assert "ix_portfolio_created_at" in tables["portfolio"][1]
+    assert "app_locks" not in tables
+    assert "width" not in tables["uploaded_images"][0]
+    assert [m.version for m in rest] == list(range(4, latest_version() + 1))
+    assert versions == list(range(1, latest_version() + 1))
+
+
+def test_non_transactional_step_on_sqlite(sqlite_url, monkeypatch):
+    from migrations import create_index, upgrade
+
+    async def step(conn):
+        await create_index(conn, "ix_services_name", "services", ["name"])
+
+    m = extra_migration(monkeypatch, step, transactional=False)
+
+    async def run(engine):
+        applied = await upgrade(engine)
+        return applied, await schema(engine), await recorded_versions(engine)
+
+    applied, tables, versions = asyncio.run(with_engine(sqlite_url("concurrently"), run))
+    assert applied[-1] is m
+    assert "ix_services_name" in tables["services"][1]
+    assert versions[-1] == m.version
+
+
+def test_failed_upgrade_is_rolled_back_on_sqlite(sqlite_url, monkeypatch):
+    from migrations import current_version, upgrade
+
+    async def step(conn):
+        await conn.execute(text("CREATE TABLE half_done (id INTEGER)"))
+        raise RuntimeError("step failed")
+
+    extra_migration(monkeypatch, step)
+
+    async def run(engine):
+        with pytest.raises(RuntimeError, match="step failed"):
+            await upgrade(engine)
+        return await current_version(engine), await schema(engine)
+
+    version, tables = asyncio.run(with_engine(sqlite_url("failed"), run))
+    # The whole upgrade is one transaction on SQLite
+    assert version == 0
+    assert "half_done" not in tables and "services" not in tables
+
+
+def test_concurrent_upgrades_migrate_once(sqlite_url):
+    from migrations import latest_version, upgrade
+
+    url = sqlite_url("shared")
+
+    async def run():
+        engines = [create_async_engine(url) for _ in range(3)]
+        try:
+            results = await asyncio.gather(*(upgrade(engine) for engine in engines))
+            return results, await recorded_versions(engines[0])
+        finally:
+            for engine in engines:
+                await engine.dispose()
+
+    results, versions = asyncio.run(run())
+    assert sorted(len(applied) for applied in results) == [0, 0, latest_version()]
+    assert versions == list(range(1, latest_version() + 1))
+
+
+def test_upgrade_waits_for_a_locked_database(tmp_path, monkeypatch, caplog):
+    import migrations
+
+    monkeypatch.setattr(migrations, "MIGRATION_LOCK_POLL_SECONDS", 0.02)
+    path = tmp_path / "locked.db"
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+
+    async def run(engine):
+        task = asyncio.create_task(migrations.upgrade(engine))
+        # Longer than the busy timeout, so the runner has to retry
+        await asyncio.sleep(0.3)
+        waited = not task.done()
+        holder.execute("ROLLBACK")
+        applied = await task
+        return waited, applied
+
+    try:
+        with caplog.at_level(logging.INFO, logger="migrations"):
+            waited, applied = asyncio.run(
+                with_engine(f"sqlite+aiosqlite:///{path}", run, connect_args={"timeout": 0.05})
+            )
+    finally:
+        holder.close()
+    assert waited
+    assert len(applied) == migrations.latest_version()
+    assert "Waiting for another worker" in caplog.text
+
+
+def test_current_version_propagates_database_errors(tmp_path):
+    from migrations import current_version
+
+    # Not read as "never migrated", which would run the migrations against it
+    path = tmp_path / "site.db"
+    path.write_bytes(b"not a database" * 100)
+    with pytest.raises(DatabaseError, match="not a database"):
+        asyncio.run(with_engine(f"sqlite+aiosqlite:///{path}", current_version))
+
+
+@pytest.mark.skipif(not POSTGRES_DSN, reason="TEST_POSTGRES_DSN is not set")
+def test_postgres_concurrent_index_and_advisory_lock(monkeypatch):
+    import migrations
+
+    monkeypatch.setattr(migrations, "MIGRATION_LOCK_POLL_SECONDS", 0.05)
+
+    async def step(conn):
+        # Fails inside a transaction block
+        await migrations.create_index(conn, "ix_services_name_test", "services", ["name"])
+
+    m = extra_migration(monkeypatch, step, transactional=False)
+
+    async def run(engine):
+        await migrations.upgrade(engine, target=m.version - 1)
+        params = {"key": migrations.MIGRATION_ADVISORY_LOCK_KEY}
+        try:
+            async with engine.connect() as holder:
+                holder = await holder.execution_options(isolation_level="AUTOCOMMIT")
+                await holder.execute(text("SELECT pg_advisory_lock(:key)"), params)
+                task = asyncio.create_task(migrations.upgrade(engine))
+                await asyncio.sleep(0.3)
+                waited = not task.done()
+                await holder.execute(text("SELECT pg_advisory_unlock(:key)"), params)
+                applied = await task
+            return waited, applied, await schema(engine)
+        finally:
+            async with engine.begin() as conn:
+                await conn.execute(text("DROP INDEX IF EXISTS ix_services_name_test"))
+                await conn.execute(
+                    migrations.schema_version_table.delete()
+                    .where(migrations.schema_version_table.c.version == m.version)
+                )
+
+    waited, applied, tables = asyncio.run(with_engine(POSTGRES_DSN, run))
+    assert waited
+    assert applied == [m]
+    assert "ix_services_name_test" in tables["services"][1]
@@ -0,0 +1,77 @@
+import asyncio
+import sys
+import threading
+import time
+
+from .conftest import metric_value
+
+
+def spin(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def handler():
+    await asyncio.to_thread(spin, 0.3)
+    await asyncio.sleep(0.1)
+    spin(0.1)
+
+
+def test_profiler_samples_the_task_and_executor_threads():
+    from profiling import SamplingProfiler
+
+    async def run():
+        task = asyncio.create_task(handler())
+        profiler = SamplingProfiler(task, interval=0.005, max_samples=1000, max_seconds=5)
+        profiler.start()
+        try:
+            await task
+        finally:
+            profiler.stop()
+        return profiler.collapsed()
+
+    stacks = {}
+    for line in asyncio.run(run()).splitlines():
+        stack, _, count = line.rpartition(" ")
+        stacks[stack] = int(count)
+
+    suspended = [stack for stack in stacks if stack.startswith("(suspended);handler (test_profiling.py")]
+    running = [stack for stack in stacks if stack.startswith("handler (test_profiling.py") and "spin (" in stack]
+    # Work handed to asyncio.to_thread shows with its own stack, without
+    # the executor's frames
+    threads = [stack for stack in stacks if stack.startswith("(thread asyncio_")]
+    assert suspended and running
+    assert any(stack.split(";")[1].startswith("spin (test_profiling.py") for stack in threads)
+    assert not any("thread.py" in stack for stack in threads)
+
+
+def test_idle_executor_thread_is_not_sampled():
+    from profiling import _work_item_stack
+
+    async def run():
+        await asyncio.to_thread(spin, 0.01)
+        await asyncio.sleep(0.05)
+        frames = sys._current_frames()
+        return [_work_item_stack(frames.get(thread.ident)) for thread in threading.enumerate()
+                if thread.name.startswith("asyncio_")]
+
+    idle = asyncio.run(run())
+    assert idle and all(stack == [] for stack in idle)
+
+
+def test_profile_request(make_client):
+    client = make_client(admin_token="secret", profile_min_interval_seconds=60)
+    headers = {"x-profile": "1", "x-admin-token": "secret", "x-profile-samples": "50"}
+    captured = metric_value("profiles_total", outcome="captured")
+
+    response = client.get("/api/services", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["x-profiled-status"] == "200"
+    assert int(response.headers["x-profile-samples"]) <= 50
+    assert all(line.rpartition(" ")[2].isdigit() for line in response.text.splitlines())
+    assert metric_value("profiles_total", outcome="captured") == captured + 1
+
+    assert client.get("/api/services", headers=headers).status_code == 429
+    # Without the token the request is served normally
+    assert client.get("/api/services", headers={"x-profile": "1"}).json() == client.get("/api/services").json()
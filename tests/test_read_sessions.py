@@ -0,0 +1,28 @@
+from .conftest import metric_value
+
+READ_PATHS = [
+    "/api/services", "/api/portfolio", "/api/contacts", "/api/uploaded-images",
+    "/api/portfolio?stream=ndjson", "/api/uploaded-images?stream=json",
+]
+
+
+def test_reads_never_commit_and_writes_do(make_client):
+    client = make_client()
+    read_sessions = metric_value("db_sessions_total", path="read")
+    read_commits = metric_value("db_commits_total", path="read")
+    write_commits = metric_value("db_commits_total", path="write")
+
+    for path in READ_PATHS:
+        assert client.get(path).status_code == 200, path
+    assert metric_value("db_sessions_total", path="read") >= read_sessions + len(READ_PATHS)
+    assert metric_value("db_commits_total", path="read") == read_commits
+    assert metric_value("db_commits_total", path="write") == write_commits
+
+    created = client.post("/api/services", json={
+        "name": "Новая услуга", "description": "Описание", "detailedDescription": "Подробно",
+        "price": "от 1 000 ₽", "images": [],
+    })
+    assert created.status_code == 200
+    assert metric_value("db_commits_total", path="write") > write_commits
+    assert metric_value("db_commits_total", path="read") == read_commits
+    assert created.json()["id"] in [service["id"] for service in client.get("/api/services").json()]
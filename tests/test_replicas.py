@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select, text
+
+from .conftest import create_database, metric_value, sample_rows
+
+REPLICA_SERVICE = {**sample_rows()["services"][0], "id": "replica-service", "name": "Услуга с реплики"}
+
+
+async def service_names(session) -> list:
+    from models import ServiceTable
+
+    return sorted(await session.scalars(select(ServiceTable.name)))
+
+
+@pytest.fixture
+def replica_url(sqlite_url):
+    url = sqlite_url("replica")
+    asyncio.run(create_database(url, {"services": [REPLICA_SERVICE]}))
+    return url
+
+
+def test_reads_go_to_the_replica_until_the_client_writes(make_client, replica_url):
+    from database import PRIMARY_PIN_COOKIE
+
+    client = make_client(database_replica_urls=replica_url)
+    routed = metric_value("db_read_routes_total", target="replica")
+    assert [service["name"] for service in client.get("/api/services").json()] == [REPLICA_SERVICE["name"]]
+    assert metric_value("db_read_routes_total", target="replica") == routed + 1
+
+    created = client.post("/api/services", json={
+        "name": "Новая услуга", "description": "Описание", "detailedDescription": "Подробно",
+        "price": "от 1 000 ₽", "images": [],
+    })
+    assert created.status_code == 200
+    assert PRIMARY_PIN_COOKIE in created.cookies
+
+    # Read-your-writes: the pinned client reads the primary
+    names = [service["name"] for service in client.get("/api/services").json()]
+    assert "Новая услуга" in names and REPLICA_SERVICE["name"] not in names
+
+    client.cookies.clear()
+    assert [service["name"] for service in client.get("/api/services").json()] == [REPLICA_SERVICE["name"]]
+
+
+def run_on_database(configure_database, primary_url: str, replica_url: str, run):
+    import database
+
+    configure_database(primary_url, database_replica_urls=replica_url)
+
+    async def main():
+        try:
+            return await run(database.get_database())
+        finally:
+            await database.dispose_engines()
+    return asyncio.run(main())
+
+
+def test_unreachable_replica_falls_back_to_the_primary(source_url, tmp_path, configure_database):
+    from database import open_target_session, run_read
+
+    (tmp_path / "down.db").write_bytes(b"not a database" * 100)
+    fallbacks = metric_value("db_replica_fallbacks_total", replica="replica0")
+
+    async def run(db):
+        # No health check has run yet, so the replica is still chosen
+        choice = db.replicas.choose()
+        assert choice is not None
+        names = await run_read(choice, service_names)
+        healthy = set(db.replicas.healthy)
+        db.replicas.healthy.add(0)
+        async with open_target_session(db.replicas.choose(), transaction=True) as session:
+            streamed_from = session.info["read_target"]
+        return names, healthy, streamed_from
+
+    names, healthy, streamed_from = run_on_database(
+        configure_database, source_url, f"sqlite+aiosqlite:///{tmp_path / 'down.db'}", run
+    )
+    assert names == sorted(row["name"] for row in sample_rows()["services"])
+    assert healthy == set()
+    assert streamed_from == "primary"
+    assert metric_value("db_replica_fallbacks_total", replica="replica0") == fallbacks + 2
+
+
+def test_failed_replica_query_is_retried_on_the_primary(source_url, sqlite_url, configure_database):
+    from database import run_read
+
+    # Reachable, but behind on migrations: the query fails, not the connection
+    lagging = sqlite_url("lagging")
+    asyncio.run(create_database(lagging))
+
+    async def run(db):
+        async with db.replicas.engines[0].begin() as conn:
+            await conn.execute(text("DROP TABLE services"))
+        return await run_read(db.replicas.choose(), service_names), set(db.replicas.healthy)
+
+    names, healthy = run_on_database(configure_database, source_url, lagging, run)
+    assert names == sorted(row["name"] for row in sample_rows()["services"])
+    # A query error says nothing about the replica's health
+    assert healthy == {0}
@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from .conftest import metric_value
+
+
+def test_joiners_share_one_result():
+    from singleflight import SingleFlight
+
+    async def run():
+        flights = SingleFlight("test-share", timeout=5)
+        calls = 0
+        release = asyncio.Event()
+
+        async def load():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return ["result"]
+
+        callers = [asyncio.create_task(flights.do(("services", "primary"), load)) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(*callers)
+        return calls, results
+
+    calls, results = asyncio.run(run())
+    assert calls == 1
+    assert all(result is results[0] for result in results)
+    assert metric_value("singleflight_calls_total", group="test-share", role="shared") == 4
+
+
+def test_leader_exception_reaches_joiners():
+    from singleflight import SingleFlight
+
+    async def run():
+        flights = SingleFlight("test-error", timeout=5)
+        release = asyncio.Event()
+
+        async def load():
+            await release.wait()
+            raise LookupError("query failed")
+
+        callers = [asyncio.create_task(flights.do("key", load)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(*callers, return_exceptions=True)
+
+    errors = asyncio.run(run())
+    assert [type(error) for error in errors] == [LookupError] * 3
+    assert errors[1] is errors[0]
+
+
+def test_joiner_times_out_while_the_flight_goes_on():
+    from singleflight import FlightTimeout, SingleFlight
+
+    async def run():
+        flights = SingleFlight("test-timeout", timeout=0.05)
+
+        async def load():
+            await asyncio.sleep(0.2)
+            return "done"
+
+        leader = asyncio.create_task(flights.do("key", load))
+        await asyncio.sleep(0.01)
+        with pytest.raises(FlightTimeout):
+            await flights.do("key", load)
+        return await leader
+
+    assert asyncio.run(run()) == "done"
+    assert metric_value("singleflight_timeouts_total", group="test-timeout") == 1
+
+
+def test_forget_starts_a_fresh_flight():
+    from singleflight import SingleFlight
+
+    async def run():
+        flights = SingleFlight("test-forget", timeout=5)
+        data = {"value": "old"}
+        release = asyncio.Event()
+
+        async def load():
+            value = data["value"]
+            await release.wait()
+            return value
+
+        stale = asyncio.create_task(flights.do(("services", "primary"), load))
+        await asyncio.sleep(0.01)
+        # A write lands while the read is in flight
+        data["value"] = "new"
+        flights.forget("services")
+        fresh = asyncio.create_task(flights.do(("services", "primary"), load))
+        await asyncio.sleep(0.01)
+        release.set()
+        return await stale, await fresh
+
+    assert asyncio.run(run()) == ("old", "new")
+
+
+def slow_loads(monkeypatch, seconds: float):
+    """Make GET /api/services take `seconds` after its query has run"""
+    import server
+
+    load_services = server.load_services
+
+    async def slow(session):
+        services = await load_services(session)
+        await asyncio.sleep(seconds)
+        return services
+    monkeypatch.setattr(server, "load_services", slow)
+
+
+def in_thread(call):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("response", call()))
+    thread.start()
+    return thread, result
+
+
+def test_joiner_gets_504_on_flight_timeout(make_client, monkeypatch):
+    client = make_client(singleflight_timeout_seconds=0.1)
+    slow_loads(monkeypatch, 0.6)
+
+    leader, result = in_thread(lambda: client.get("/api/services"))
+    time.sleep(0.2)
+    joined = client.get("/api/services")
+    leader.join()
+
+    assert joined.status_code == 504
+    assert joined.json()["detail"] == "Превышено время ожидания ответа"
+    # The leader waits for the work however long it takes
+    assert result["response"].status_code == 200
+
+
+def test_read_after_a_write_does_not_join_an_older_flight(make_client, monkeypatch):
+    client = make_client()
+    slow_loads(monkeypatch, 0.6)
+
+    before, result = in_thread(lambda: client.get("/api/services"))
+    time.sleep(0.2)
+    created = client.post("/api/services", json={
+        "name": "Новая услуга", "description": "Описание", "detailedDescription": "Подробно",
+        "price": "от 1 000 ₽", "images": [],
+    }).json()
+    after = client.get("/api/services").json()
+    before.join()
+
+    assert created["id"] in [service["id"] for service in after]
+    assert created["id"] not in [service["id"] for service in result["response"].json()]
@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import select
+
+from .conftest import create_database, metric_value, sample_rows
+
+
+@pytest.fixture
+def client(make_client, tmp_path):
+    client = make_client(stream_batch_size=4)
+    # The API model requires updatedAt
+    portfolio = [{**row, "updated_at": row["created_at"]} for row in sample_rows()["portfolio"]]
+    asyncio.run(create_database(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}", {"portfolio": portfolio}))
+    return client
+
+
+def listed_ids(client) -> list:
+    return sorted(item["id"] for item in client.get("/api/portfolio").json())
+
+
+@pytest.mark.parametrize("query, headers", [
+    ("?stream=json", {}),
+    ("?stream=ndjson", {}),
+    ("", {"accept": "application/x-ndjson"}),
+])
+def test_stream_formats(client, query, headers):
+    commits = metric_value("db_commits_total", path="read")
+    response = client.get(f"/api/portfolio{query}", headers=headers)
+
+    assert response.status_code == 200
+    if "json" in query and "ndjson" not in query:
+        assert response.headers["content-type"] == "application/json"
+        items = response.json()
+    else:
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = response.text.split("\n")
+        assert lines[-1] == ""
+        items = [json.loads(line) for line in lines[:-1]]
+    assert sorted(item["id"] for item in items) == listed_ids(client)
+    assert len(items) > 4
+    # The read transaction is rolled back, never committed
+    assert metric_value("db_commits_total", path="read") == commits
+
+
+def test_empty_stream_is_an_empty_array(make_client):
+    client = make_client()
+    assert client.get("/api/uploaded-images?stream=json").json() == []
+    assert client.get("/api/uploaded-images?stream=ndjson").text == ""
+
+
+@pytest.mark.parametrize("fmt", ["json", "ndjson"])
+def test_error_mid_stream_aborts_the_response(client, monkeypatch, fmt):
+    import server
+
+    convert = server.convert_portfolio_to_pydantic
+
+    def failing_convert(row):
+        # Past the first batch of 4, so the headers and some rows are out
+        if row.id == "portfolio-020":
+            raise RuntimeError("row cannot be converted")
+        return convert(row)
+
+    monkeypatch.setattr(server, "convert_portfolio_to_pydantic", failing_convert)
+    errors = metric_value("stream_errors_total", listing="portfolio")
+    # The error reaches the server, through Starlette's middleware task
+    # groups, instead of the body ending as if complete
+    with pytest.raises((RuntimeError, ExceptionGroup)) as raised:
+        client.get(f"/api/portfolio?stream={fmt}")
+    if raised.type is RuntimeError:
+        raised.match("cannot be converted")
+    else:
+        assert raised.group_contains(RuntimeError, match="cannot be converted", depth=None)
+    assert metric_value("stream_errors_total", listing="portfolio") == errors + 1
+
+
+def test_stream_session_reads_in_a_transaction(source_url, configure_database):
+    import database
+    from models import PortfolioTable
+
+    configure_database(source_url)
+
+    async def run():
+        try:
+            async with database.open_target_session(None, transaction=True) as session:
+                assert session.in_transaction()
+                conn = await session.connection()
+                assert conn.sync_connection.get_execution_options().get("isolation_level") != "AUTOCOMMIT"
+                result = await session.stream(select(PortfolioTable.id).execution_options(yield_per=5))
+                ids = [row async for row in result.scalars()]
+            async with database.open_target_session(None) as session:
+                conn = await session.connection()
+                assert conn.sync_connection.get_execution_options().get("isolation_level") == "AUTOCOMMIT"
+            return ids
+        finally:
+            await database.dispose_engines()
+
+    assert sorted(asyncio.run(run())) == sorted(row["id"] for row in sample_rows()["portfolio"])
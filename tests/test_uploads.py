@@ -0,0 +1,159 @@
+import io
+import shutil
+import time
+
+import pytest
+from PIL import Image, ImageDraw
+
+from .conftest import BACKEND_DIR
+
+# Shipped uploads from before formats were sniffed: JPEG bytes under .png
+LEGACY_UPLOADS = ["2f800e4c-f5b6-4827-84a4-155b7ee3d48e.png", "370fb168-5397-4092-b453-61306530f7ef.png"]
+
+
+def encode(img, image_format: str) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def screenshot(size=(1600, 1000)):
+    img = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(img)
+    for y in range(0, size[1], 18):
+        draw.text((10, y), "def choose_output_format(img) -> str:  # a line of code " * 3, fill=(30, 30, 30))
+    draw.rectangle((400, 300, 900, 600), fill=(70, 130, 180))
+    return img
+
+
+def photo():
+    with Image.open(BACKEND_DIR / "uploads" / LEGACY_UPLOADS[1]) as img:
+        return img.convert("RGB")
+
+
+def copy_legacy(uploads_dir, name):
+    uploads_dir.mkdir(exist_ok=True)
+    shutil.copy(BACKEND_DIR / "uploads" / name, uploads_dir / name)
+
+
+@pytest.mark.parametrize("name", LEGACY_UPLOADS)
+def test_legacy_upload_is_served_by_magic_bytes(make_client, tmp_path, name):
+    client = make_client()
+    copy_legacy(tmp_path / "uploads", name)
+
+    for path in (f"/api/uploads/{name}", f"/uploads/{name}"):
+        response = client.get(path, headers={"accept": "*/*"})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/jpeg"
+        assert response.content[:3] == b"\xff\xd8\xff"
+
+
+def test_upload_is_stored_and_served_by_sniffed_format(make_client):
+    client = make_client()
+    # JPEG bytes under a .png name and content type
+    body = encode(photo(), "JPEG")
+    result = client.post("/api/upload-image", files={"file": ("photo.png", body, "image/png")}).json()
+    assert result["success"], result
+
+    filename = result["image"]["filename"]
+    assert filename.endswith(".jpg")
+    response = client.get(f"/api/uploads/{filename}", headers={"accept": "*/*"})
+    assert response.headers["content-type"] == "image/jpeg"
+
+
+def test_migration_keeps_mislabeled_uploads_flat(make_client, tmp_path, capsys):
+    import migrate_uploads
+    from upload_storage import shard_path
+
+    uploads_dir = tmp_path / "uploads"
+    copy_legacy(uploads_dir, LEGACY_UPLOADS[0])
+    labeled = "0f6d1c38-4f34-4c8e-9a57-1d8e4d3c2b10.png"
+    (uploads_dir / labeled).write_bytes(encode(screenshot((40, 30)), "PNG"))
+
+    migrate_uploads.run(uploads_dir, batch_size=10, grace=0, limit=None)
+    assert "1 mislabeled files kept flat" in capsys.readouterr().out
+    assert (uploads_dir / LEGACY_UPLOADS[0]).is_file()
+    assert not shard_path(uploads_dir, LEGACY_UPLOADS[0]).exists()
+    assert shard_path(uploads_dir, labeled).is_file()
+    assert not (uploads_dir / labeled).exists()
+
+    client = make_client()
+    assert client.get(f"/api/uploads/{LEGACY_UPLOADS[0]}").headers["content-type"] == "image/jpeg"
+    assert client.get(f"/api/uploads/{labeled}").headers["content-type"] == "image/png"
+
+
+@pytest.mark.parametrize("make_image, image_format, expected", [
+    (screenshot, "PNG", "PNG"),
+    (lambda: screenshot().convert("L"), "PNG", "PNG"),
+    (photo, "PNG", "JPEG"),
+    (photo, "JPEG", "JPEG"),
+    (screenshot, "JPEG", "JPEG"),
+    (lambda: screenshot().convert("RGBA"), "PNG", "PNG"),
+])
+def test_output_format(tmp_path, make_image, image_format, expected):
+    import asyncio
+    from imaging import process_image
+
+    path = tmp_path / f"upload.{image_format.lower()}"
+    path.write_bytes(encode(make_image(), image_format))
+    stats = asyncio.run(process_image(path))
+
+    assert stats.error is None
+    assert stats.output_format == expected
+    with Image.open(stats.output_path) as img:
+        assert img.format == expected
+
+
+def test_sixteen_bit_png_keeps_its_depth(tmp_path):
+    import asyncio
+    from imaging import process_image
+
+    img = Image.new("I;16", (1600, 400))
+    img.putdata([(x * 40) % 65536 for _ in range(400) for x in range(1600)])
+    path = tmp_path / "scan.png"
+    img.save(path)
+
+    stats = asyncio.run(process_image(path, variant_formats=["WEBP"]))
+    assert stats.output_format == "PNG"
+    with Image.open(stats.output_path) as output:
+        assert output.mode == "I;16"
+        assert output.getextrema()[1] > 255
+    # The 8-bit sibling is scaled down rather than clipped to white
+    with Image.open(path.with_suffix(".webp")) as sibling:
+        low, high = sibling.convert("L").getextrema()
+        assert high - low > 200
+
+
+def wait_for_sibling_encodes():
+    import server
+
+    deadline = time.monotonic() + 10
+    while server._sibling_tasks and time.monotonic() < deadline:
+        time.sleep(0.02)
+
+
+def test_jpeg_upload_gets_siblings_in_the_background(make_client, tmp_path):
+    from imaging import supported_variant_formats
+    from upload_storage import stored_files
+
+    client = make_client()
+    result = client.post("/api/upload-image", files={"file": ("a.jpg", encode(photo(), "JPEG"), "image/jpeg")}).json()
+    assert result["success"], result
+    wait_for_sibling_encodes()
+
+    files = stored_files(tmp_path / "uploads", result["image"]["filename"], [".webp", ".avif"])
+    expected = {".jpg", *(f".{name.lower()}" for name in supported_variant_formats(["WEBP", "AVIF"]))}
+    assert {path.suffix for path in files} == expected
+
+
+def test_gif_upload_gets_no_siblings(make_client, tmp_path):
+    from upload_storage import stored_files
+
+    client = make_client()
+    body = encode(Image.new("P", (400, 300), 3), "GIF")
+    result = client.post("/api/upload-image", files={"file": ("a.gif", body, "image/gif")}).json()
+    assert result["success"], result
+    wait_for_sibling_encodes()
+
+    files = stored_files(tmp_path / "uploads", result["image"]["filename"], [".webp", ".avif"])
+    assert [path.suffix for path in files] == [".png"]